@@ -3,18 +3,56 @@ Module with classes describing api request behaviour.
 """
 
 
-from flask import request
+import time
+from flask import request, Response
 from flask_restful import Resource
 import bson
 import app
+import metrics
 from map_vision import MapVision
 from task_assignment import TaskAssigner
 
 
-def verify_player_id():
+def parse_object_id(value):
+
+    """
+    Convert str id to bson's ObjectId.
+    :param value: str id
+    :type value: str
+    :return: bson's ObjectId or None if id is invalid
+    :rtype: bson.ObjectId
+    """
+
+    try:
+        return bson.ObjectId(value)
+    except (bson.errors.InvalidId, TypeError):
+        return None
+
+
+def drop_expired_tasks(player):
+
+    """
+    Drop expired tasks from player's dict in lazy task expiry mode, expired tasks are kept in MongoDB till the sweep.
+    :param player: player's dict
+    :type player: dict
+    :return: None
+    """
+
+    if not app.app.config['LAZY_TASK_EXPIRY']:
+        return
+
+    now = time.time()
+
+    for key in [key for key, value in player.items() if key.startswith('Task') and value <= now]:
+        del player[key]
+
+
+def verify_player_id(with_tasks=False):
 
     """
     Verify player's id. Id must be bson's ObjectId and presents in players MongoDB collection.
+    :param with_tasks: player's tasks are needed, otherwise player's id and position may be enough
+    :type with_tasks: bool
     :return: player dict from MongoDB collection if player exists or None
     :rtype: dict
     """
@@ -22,18 +60,93 @@ def verify_player_id():
     # Get player's id from URL
     player_id = request.args.get('player_id', type=str)
 
+    # Take player or known wrong id from the cache without id parsing, spatial index lookup needs no cache
+    use_cache = app.player_cache is not None and not app.spatial_index.is_loaded
+
+    if use_cache:
+
+        found, main_player = app.player_cache.get(player_id)
+
+        # Cache without tasks is enough only for wrong ids and when tasks are not needed
+        if found and (main_player is None or not with_tasks or app.player_cache.fields is None):
+            return main_player
+
+        version = app.player_cache.get_version(player_id)
+
     # Convert str player's id to bson's ObjectId
-    try:
-        player_id_obj = bson.ObjectId(player_id)
-    except bson.errors.InvalidId:
-        return None
+    player_id_obj = parse_object_id(player_id)
+
+    # Find player in memory or in players MongoDB collection by id
+    if player_id_obj is None:
+        main_player = None
+    elif app.spatial_index.is_loaded:
+        main_player = app.spatial_index.get_player(player_id_obj)
+    else:
 
-    # Find player in in players MongoDB collection by id
-    main_player = app.players_collection.find_one({'_id': player_id_obj})
+        with metrics.mongo_seconds.time('find_one'):
+            main_player = app.players_collection.find_one({'_id': player_id_obj})
+
+    if use_cache:
+        app.player_cache.put(player_id, main_player, version)
 
     return main_player
 
 
+def apply_player_control(player_id, control):
+
+    """
+    Pause or resume player's tasks in the process running simulation engine.
+    :param player_id: player's id
+    :param control: control trigger - 0 to stop all current tasks, 1 to start new tasks
+    :type control: int
+    :return: None
+    """
+
+    # Forward control to the worker process of the player in sharded mode
+    if app.task_workers is not None:
+        app.task_workers.control_player(player_id, control)
+    # Stop all player's tasks if control is 0 or start new tasks if else
+    elif control:
+        TaskAssigner.resume_player(player_id)
+    else:
+        TaskAssigner.pause_player(player_id, app.task_assigner)
+
+
+def find_players(player_ids):
+
+    """
+    Find many players by ids with one lookup.
+    :param player_ids: players ids
+    :type player_ids: list of bson.ObjectId
+    :return: player's id to player dict mapping for existed players
+    :rtype: dict
+    """
+
+    # Find players in memory or in players MongoDB collection with one $in query
+    if app.spatial_index.is_loaded:
+        players = [app.spatial_index.get_player(player_id) for player_id in player_ids]
+    else:
+
+        with metrics.mongo_seconds.time('find'):
+            players = list(app.players_collection.find({'_id': {'$in': player_ids}}))
+
+    return {player['_id']: player for player in players if player is not None}
+
+
+def get_projection():
+
+    """
+    Get projection from comma separated fields specified in URL, id is always included.
+    :return: projection as in MongoDB or None to get all fields
+    :rtype: dict
+    """
+
+    # Get fields to show from URL
+    fields = request.args.get('fields', type=str)
+
+    return {field: 1 for field in fields.split(',') if field} if fields else None
+
+
 def get_area_center_coordinates(player):
 
     """
@@ -59,9 +172,49 @@ def get_area_center_coordinates(player):
 class GetPlayer(Resource, MapVision):
 
     """
-    Class for getting one player info with it's visible area info.
+    Class for getting one player info with it's visible area info. Visible players can be projected to specified
+    fields and limited with max_players request attribute.
     """
 
+    @staticmethod
+    def prepare_cached_players(players, exclude_id, projection, max_players):
+
+        """
+        Prepare visible players taken from the area cache in one pass.
+        :param players: shared cached players dicts
+        :type players: list
+        :param exclude_id: str id of the player to skip
+        :type exclude_id: str
+        :param projection: fields to leave as in MongoDB projection, all fields if it is None
+        :type projection: dict
+        :param max_players: max number of players, 0 for all players
+        :type max_players: int
+        :return: list of players dicts
+        :rtype: list
+        """
+
+        lazy_task_expiry = app.app.config['LAZY_TASK_EXPIRY']
+        visible_players_list = []
+
+        for player in players:
+
+            if player['_id'] == exclude_id:
+                continue
+
+            # Cached players dicts are shared, so they are changed only as copies
+            if projection is not None:
+                player = {field: value for field, value in player.items() if field == '_id' or field in projection}
+            elif lazy_task_expiry:
+                player = dict(player)
+
+            drop_expired_tasks(player)
+            visible_players_list.append(player)
+
+            if len(visible_players_list) == max_players:
+                break
+
+        return visible_players_list
+
     def get(self):
 
         """
@@ -70,51 +223,113 @@ class GetPlayer(Resource, MapVision):
         :rtype: dict
         """
 
-        # Verify player's id
-        main_player = verify_player_id()
+        # Verify player's id, player's tasks are returned too
+        main_player = verify_player_id(with_tasks=True)
 
         # Return error if player does not exist
         if main_player is None:
             return {'error': 'wrong player_id'}, 400
 
-        # Get x and y coordinates
+        # Get x and y coordinates, visible players fields and max number of visible players
         x, y = get_area_center_coordinates(main_player)
+        projection = get_projection()
+        max_players = max(request.args.get('max_players', default=0, type=int), 0)
 
         # Calculate visible area coordinates
         area = self.calculate_visible_area_coordinates(x, y, app.app.config['VISIBLE_AREA_WIDTH'],
                                                        app.app.config['VISIBLE_AREA_HEIGHT'])
 
-        # Get MongoDB collection cursor for all players within visible area
-        visible_players = self.get_area_players(area, app.players_collection)
+        # Take prepared players within visible area from the cache if it is enabled, current player is skipped
+        if app.area_cache is not None and app.spatial_index.is_loaded:
 
-        # Prepare all players within visible area info
-        visible_players_list = []
+            visible_players_list = self.prepare_cached_players(app.area_cache.get_area_players(area),
+                                                               str(main_player['_id']), projection, max_players)
 
-        for player in visible_players:
+        else:
 
-            player['_id'] = str(player['_id'])
-            visible_players_list.append(player)
+            # Get all players within visible area except the current one, ids are converted by the serializer
+            visible_players_list = list(self.get_area_players(area, app.players_collection, main_player['_id'],
+                                                              projection, max_players))
 
-        # Prepare current player info
-        main_player['_id'] = str(main_player['_id'])
+            if app.app.config['LAZY_TASK_EXPIRY']:
 
-        if main_player in visible_players_list:
-            visible_players_list.remove(main_player)
+                for player in visible_players_list:
+                    drop_expired_tasks(player)
+
+        # Prepare current player info
+        drop_expired_tasks(main_player)
 
         result = {'current_player': main_player, 'center_x': x, 'center_y': y, 'visible_players': visible_players_list}
 
         return result, 200
 
 
-class GetPlayers(Resource):
+class GetPlayersBatch(Resource, MapVision):
 
     """
-    Class for getting players personal info. Number of players to show can be specified with limit request attribute.
-    By default all players personal info will be showed.
+    Class for getting many players info with their visible areas info and visible areas around specified centers with
+    one request. Players are found with one lookup and players of all visible areas are taken with one scan, so
+    overlapping areas share it. Visible players are returned once and areas refer to them by ids.
     """
 
     @staticmethod
-    def get():
+    def parse_center(value):
+
+        """
+        Parse area center specified as 'x,y'.
+        :param value: area center
+        :type value: str
+        :return: x, y as the center of the area coordinates or None if center is invalid
+        :rtype: tuple of two ints
+        """
+
+        try:
+            x, y = (int(coordinate) for coordinate in value.split(','))
+        except ValueError:
+            return None
+
+        return x, y
+
+    @staticmethod
+    def split_players_by_areas(players, areas, cell_size):
+
+        """
+        Split players between visible areas. Players are bucketed by grid cells once and every area checks players of
+        its cells only.
+        :param players: player's id to player's dict mapping
+        :type players: dict
+        :param areas: visible areas coordinates as (x_min, x_max, y_min, y_max) tuples
+        :type areas: list
+        :param cell_size: grid cell size
+        :type cell_size: int
+        :return: list of visible players ids for every area
+        :rtype: list
+        """
+
+        # Cell to players ids and dicts mapping
+        cells = {}
+
+        for player_id, player in players.items():
+            cells.setdefault((player['x'] // cell_size, player['y'] // cell_size), []).append((player_id, player))
+
+        areas_player_ids = []
+
+        for x_min, x_max, y_min, y_max in areas:
+
+            area_player_ids = []
+
+            for cell_x in range(x_min // cell_size, x_max // cell_size + 1):
+                for cell_y in range(y_min // cell_size, y_max // cell_size + 1):
+
+                    # Cells on the area border are checked player by player
+                    area_player_ids.extend(player_id for player_id, player in cells.get((cell_x, cell_y), ())
+                                           if x_min <= player['x'] <= x_max and y_min <= player['y'] <= y_max)
+
+            areas_player_ids.append(area_player_ids)
+
+        return areas_player_ids
+
+    def get(self):
 
         """
         Api get request handling.
@@ -122,20 +337,173 @@ class GetPlayers(Resource):
         :rtype: dict
         """
 
-        # Get number of players limit from URL
-        limit = request.args.get('limit', default=app.app.config['PLAYERS_NUMBER'], type=int)
-        # Get MongoDB collection cursor for players
-        players = app.players_collection.find({}, limit=limit)
+        # Get players ids and areas centers from URL
+        player_ids = request.args.getlist('player_id', type=str)
+        centers = [self.parse_center(value) for value in request.args.getlist('center', type=str)]
+
+        # Return error if there is nothing to look up or too much to look up
+        if not player_ids and not centers:
+            return {'error': 'no player_id or center'}, 400
+
+        if len(player_ids) + len(centers) > app.app.config['MAX_BATCH_SIZE']:
+            return {'error': 'too many player_id and center'}, 400
+
+        if None in centers:
+            return {'error': 'wrong center'}, 400
+
+        # Find all valid players with one lookup
+        player_ids_obj = [parse_object_id(player_id) for player_id in player_ids]
+        main_players = find_players([player_id for player_id in player_ids_obj if player_id is not None])
+
+        wrong_player_ids = [player_id for player_id, player_id_obj in zip(player_ids, player_ids_obj)
+                            if player_id_obj not in main_players]
+
+        # Calculate all visible areas, areas of players are centered on players positions
+        width = app.app.config['VISIBLE_AREA_WIDTH']
+        height = app.app.config['VISIBLE_AREA_HEIGHT']
+
+        main_players_list = [main_players[player_id] for player_id in player_ids_obj if player_id in main_players]
+        centers = [(player['x'], player['y']) for player in main_players_list] + centers
+        areas = [self.calculate_visible_area_coordinates(x, y, width, height) for x, y in centers]
+
+        # Get players within all visible areas with one scan
+        visible_players = {}
+
+        for player in self.get_areas_players(areas, app.players_collection):
+
+            drop_expired_tasks(player)
+            player['_id'] = str(player['_id'])
+            visible_players[player['_id']] = player
 
-        # Prepare players info
+        # Split visible players by areas
+        areas_player_ids = self.split_players_by_areas(visible_players, areas,
+                                                        app.app.config['SPATIAL_INDEX_CELL_SIZE'])
+
+        areas_list = [{'center_x': x, 'center_y': y, 'visible_player_ids': area_player_ids}
+                      for (x, y), area_player_ids in zip(centers, areas_player_ids)]
+
+        # Prepare players info, current player is not in its own visible players
         players_list = []
 
-        for player in players:
+        for player, area_info in zip(main_players_list, areas_list):
 
+            drop_expired_tasks(player)
             player['_id'] = str(player['_id'])
-            players_list.append(player)
 
-        result = {'players': players_list}
+            if player['_id'] in area_info['visible_player_ids']:
+                area_info['visible_player_ids'].remove(player['_id'])
+
+            area_info['current_player'] = player
+            players_list.append(area_info)
+
+        result = {'players': players_list,
+                  'areas': areas_list[len(players_list):],
+                  'visible_players': visible_players,
+                  'wrong_player_ids': wrong_player_ids}
+
+        return result, 200
+
+
+class GetPlayers(Resource):
+
+    """
+    Class for getting players personal info. Number of players to show can be specified with limit request attribute.
+    By default all players personal info will be showed. Players are sorted by id, next page starts after the id
+    specified with after request attribute. Players can be streamed as newline delimited json with stream request
+    attribute.
+    """
+
+    @staticmethod
+    def stream_players(players):
+
+        """
+        Generate newline delimited json lines from players cursor.
+        :param players: MongoDB collection cursor for players
+        :return: generator for json lines
+        """
+
+        for player in players:
+
+            drop_expired_tasks(player)
+            yield app.json_serializer.dumps(player) + b'\n'
+
+    @staticmethod
+    def project_players(players, projection):
+
+        """
+        Leave only projected fields of players dicts.
+        :param players: players dicts
+        :type players: list
+        :param projection: fields to leave as in MongoDB projection, all fields if it is None
+        :type projection: dict
+        :return: generator for players dicts
+        """
+
+        for player in players:
+
+            if projection is not None:
+                player = {field: value for field, value in player.items() if field == '_id' or field in projection}
+
+            yield player
+
+    def get(self):
+
+        """
+        Api get request handling.
+        :return: dict object as response or streamed response
+        """
+
+        # Get number of players limit, last seen player's id and stream trigger from URL
+        limit = request.args.get('limit', default=app.app.config['PLAYERS_NUMBER'], type=int)
+        after = request.args.get('after', type=str)
+        stream = request.args.get('stream', default=0, type=int)
+
+        players_filter = {}
+        after_obj = None
+
+        # Continue after the last seen player
+        if after is not None:
+
+            after_obj = parse_object_id(after)
+
+            # Return error if last seen player's id is invalid
+            if after_obj is None:
+                return {'error': 'wrong after'}, 400
+
+            players_filter['_id'] = {'$gt': after_obj}
+
+        # Get only specified fields, id is always included
+        projection = get_projection()
+
+        # Get players from memory or MongoDB collection cursor for players
+        if app.spatial_index.is_loaded:
+            players = self.project_players(app.spatial_index.get_players(after_obj, limit), projection)
+        else:
+
+            players = app.players_collection.find(players_filter, projection, limit=limit).sort('_id')
+
+            # Read players within the timer unless they are streamed
+            if not stream:
+
+                with metrics.mongo_seconds.time('find'):
+                    players = list(players)
+
+        # Stream players without collecting them in memory
+        if stream:
+            return Response(self.stream_players(players), mimetype='application/x-ndjson')
+
+        # Prepare players info, ids are converted by the serializer while the response is encoded
+        players_list = list(players)
+
+        if app.app.config['LAZY_TASK_EXPIRY']:
+
+            for player in players_list:
+                drop_expired_tasks(player)
+
+        # Return last player's id to continue from if page is full
+        next_after = str(players_list[-1]['_id']) if players_list and len(players_list) == limit else None
+
+        result = {'players': players_list, 'next_after': next_after}
 
         return result, 200
 
@@ -165,13 +533,16 @@ class TasksControl(Resource):
         # Get control trigger from URL
         control = request.args.get('control', default=1, type=int)
 
-        # Stop all player's tasks if control is 0 or start new tasks if else
-        if control and main_player['_id'] in TaskAssigner._players_to_stop:
-            TaskAssigner._players_to_stop.remove(main_player['_id'])
+        # Apply control in this process or send it to the engine process
+        if app.run_engine:
+            apply_player_control(main_player['_id'], control)
+            paused_players = TaskAssigner.get_paused_players_number()
         else:
-            TaskAssigner._players_to_stop.append(main_player['_id'])
+            app.engine_commands.send(main_player['_id'], control)
+            paused_players = None
 
-        result = {'player_id': str(main_player['_id']), 'control': control}
+        result = {'player_id': str(main_player['_id']), 'control': control, 'queued': int(not app.run_engine),
+                  'paused_players': paused_players}
 
         return result, 200
 
@@ -190,13 +561,18 @@ class AreaPlayersLogControl(Resource, MapVision):
         :rtype: dict
         """
 
+        # Return error if areas are logged in other process, area ids are known only to the process which started them
+        if not app.run_engine:
+            return {'error': 'area logging is served by the engine process'}, 503
+
         # Get control trigger from URL
         control = request.args.get('control', default=0, type=int)
 
-        # Stop visible area logging if control is 0
+        # Stop visible area logging if control is 0, only specified area if area id is passed
         if not control:
-            MapVision.stop_area_players_logging()
-            return {'area_players_log': control}, 200
+            area_id = request.args.get('area_id', type=int)
+            stopped = MapVision.stop_area_players_logging(area_id)
+            return {'area_players_log': control, 'stopped_areas': stopped}, 200
 
         # Verify player's id
         main_player = verify_player_id()
@@ -211,9 +587,135 @@ class AreaPlayersLogControl(Resource, MapVision):
         # Calculate visible area coordinates
         area = self.calculate_visible_area_coordinates(x, y, app.app.config['VISIBLE_AREA_WIDTH'],
                                                        app.app.config['VISIBLE_AREA_HEIGHT'])
+        # Get delay between log notes from URL
+        interval = request.args.get('interval', default=app.app.config['DEFAULT_LOGGING_DELAY'], type=float)
+
         # Start visible area logging
-        self.start_visible_area_logging(area, app.players_collection)
+        area_id = self.start_visible_area_logging(area, app.players_collection, max(interval, 0))
+
+        result = {'player_id': str(main_player['_id']), 'center_x': x, 'center_y': y, 'area_players_log': control,
+                  'area_id': area_id}
+
+        return result, 200
+
+
+class AreaFeed(Resource, MapVision):
+
+    """
+    Class for subscription to visible area changes with long polling. First request returns visible area players,
+    next ones wait for tasks events that happened in the area since the version returned by the previous request.
+    """
+
+    def get(self):
+
+        """
+        Api get request handling.
+        :return: dict object as response
+        :rtype: dict
+        """
+
+        # Return error if tasks events are published in other process
+        if not app.run_engine:
+            return {'error': 'area feed is served by the engine process'}, 503
+
+        # Verify player's id
+        main_player = verify_player_id()
+
+        # Return error if player does not exist
+        if main_player is None:
+            return {'error': 'wrong player_id'}, 400
+
+        # Get x and y coordinates
+        x, y = get_area_center_coordinates(main_player)
+
+        # Get last seen version and waiting timeout from URL
+        version = request.args.get('version', type=int)
+        timeout = request.args.get('timeout', default=app.app.config['AREA_FEED_TIMEOUT'], type=float)
+        timeout = min(max(timeout, 0), app.app.config['AREA_FEED_TIMEOUT'])
+
+        # Calculate visible area coordinates
+        area = self.calculate_visible_area_coordinates(x, y, app.app.config['VISIBLE_AREA_WIDTH'],
+                                                       app.app.config['VISIBLE_AREA_HEIGHT'])
+
+        result = {'center_x': x, 'center_y': y}
+
+        # Wait for area events if subscriber has seen the area before
+        if version is not None:
+
+            version, events = app.task_events.wait_area_events(area, version, timeout)
+
+            if events is not None:
+
+                for event in events:
+                    event['player_id'] = str(event['player_id'])
+
+                result.update({'version': version, 'reset': 0, 'events': events})
+
+                return result, 200
+
+        # Send area snapshot to new subscriber or to subscriber which has missed some events
+        version = app.task_events.version
+        visible_players_list = []
+
+        for player in self.get_area_players(area, app.players_collection):
+
+            drop_expired_tasks(player)
+            player['_id'] = str(player['_id'])
+            visible_players_list.append(player)
+
+        result.update({'version': version, 'reset': 1, 'visible_players': visible_players_list})
+
+        return result, 200
+
+
+class TasksStats(Resource):
+
+    """
+    Class for getting players tasks statistics from columnar players table.
+    """
+
+    @staticmethod
+    def get():
+
+        """
+        Api get request handling.
+        :return: dict object as response
+        :rtype: dict
+        """
+
+        # Return error if columnar players table is not loaded
+        if app.player_table is None or not app.spatial_index.is_loaded:
+            return {'error': 'players table is not available'}, 503
+
+        # Get number of seconds to count expiring tasks within from URL
+        within = request.args.get('within', default=60, type=float)
+
+        expiring_tasks = app.player_table.count_expiring_tasks(within)
+
+        result = {'players': len(app.player_table),
+                  'active_tasks_histogram': app.player_table.get_active_tasks_histogram(),
+                  'expiring_tasks': expiring_tasks,
+                  'within': within}
+
+        return result, 200
+
+
+class CacheStats(Resource):
+
+    """
+    Class for getting visible areas and players lookup caches hits and misses statistics.
+    """
+
+    @staticmethod
+    def get():
+
+        """
+        Api get request handling.
+        :return: dict object as response
+        :rtype: dict
+        """
 
-        result = {'player_id': str(main_player['_id']), 'center_x': x, 'center_y': y, 'area_players_log': control}
+        result = {'area_cache': app.area_cache.get_stats() if app.area_cache is not None else None,
+                  'player_cache': app.player_cache.get_stats() if app.player_cache is not None else None}
 
         return result, 200
@@ -3,46 +3,363 @@ Game server with api based on Flask micro framework.
 """
 
 
-from flask import Flask, render_template
+import sys
+import time
+import atexit
+import threading
+from flask import Flask, Response, jsonify, render_template
 from flask_restful import Api
 from pymongo import MongoClient
+
+
+# Serve requests with the app module: running this file directly would boot the server twice - as __main__ and as
+# app module imported by other modules
+if __name__ == '__main__':
+
+    import app as server
+
+    # Reloader runs the app in two processes, so it is used only if neither of them may run the engine
+    server.app.run(use_reloader=bool(server.app.config['DEBUG']) and server.app.config['SERVER_ROLE'] == 'api')
+    sys.exit(0)
+
+
+# Project modules import the app module, so they are imported after the check above
 from world_initialization import WorldCreator
+from spatial_index import SpatialIndex
+from player_table import PlayerTable
+from area_cache import AreaCache
+from player_cache import PlayerCache
+from world_state import WorldState
+from task_events import TaskEventFeed
 from task_assignment import TaskAssigner
+from task_workers import TaskWorkersPool
+from task_sweeper import TaskSweeper
+from map_vision import MapVision
+from boot_progress import BootProgress
+import serializers
+import metrics
+import lifecycle
 import api_classes
 
 
 # Create main app with api
 app = Flask(__name__)
 app.config.from_object('config')
-api = Api(app)
+api = Api(app, decorators=[metrics.observe_resource])
+
+# Encode api responses with configured json backend and optional MessagePack
+json_serializer = serializers.register_representations(api, app.config['JSON_BACKEND'], app.config['MSGPACK_OUTPUT'])
+
+# Run simulation engine (world seeding, tasks assignment and sweeping) in this process or serve api requests only
+run_engine = lifecycle.elect_engine(app.config['SERVER_ROLE'], app.config['ENGINE_LOCK_FILE'])
+
+# Task worker processes are forked before MongoDB client and background threads are started, locks held by other
+# threads at fork time would stay locked in the workers forever. Workers get their players when the world is booted
+task_workers = None
+
+if run_engine and app.config['TASK_WORKERS'] and app.config['ASSIGN_ON_BOOT']:
+    task_workers = TaskWorkersPool(app.config['TASK_WORKERS'])
+    task_workers.fork()
 
 # Connect to MongoDB
-mongo_client = MongoClient(app.config['MONGODB_HOST'], app.config['MONGODB_PORT'])
+mongo_client = MongoClient(app.config['MONGODB_HOST'], app.config['MONGODB_PORT'],
+                           maxPoolSize=app.config['MONGODB_MAX_POOL_SIZE'])
 database = mongo_client[app.config['DATABASE_NAME']]
 players_collection = database[app.config['PLAYERS_COLLECTION']]
 log_collection = database[app.config['LOG_COLLECTION']]
 
-# Check if database exists and there are some players
-if app.config['DATABASE_NAME'] not in mongo_client.list_database_names() or not players_collection.count_documents({}):
+# Players control commands sent by api processes to the engine process
+engine_commands = lifecycle.EngineCommands(database[app.config['ENGINE_COMMANDS_COLLECTION']],
+                                           app.config['ENGINE_COMMANDS_INTERVAL'])
+
+# World seeding stats, stays None if world was not seeded on this boot
+seeding_stats = None
+
+# In-memory spatial index of players with columnar players table
+player_table = PlayerTable(app.config['MAX_PLAYER_TASKS']) if app.config['PLAYER_TABLE'] else None
+spatial_index = SpatialIndex(app.config['SPATIAL_INDEX_CELL_SIZE'], player_table)
+
+# Cache of visible areas players invalidated by spatial index changes, stays None if disabled
+area_cache = AreaCache(spatial_index, app.config['AREA_CACHE_MAX_PLAYERS']) if app.config['AREA_CACHE'] else None
+
+# Cache of players looked up by ids invalidated by tasks changes, stays None if disabled. If tasks are changed in
+# other process only players ids and positions are cached
+player_cache = None
+
+if app.config['PLAYER_CACHE']:
+    player_cache = PlayerCache(app.config['PLAYER_CACHE_SIZE'], app.config['PLAYER_CACHE_TTL'],
+                               app.config['PLAYER_CACHE_NEGATIVE_TTL'], None if run_engine else ('_id', 'x', 'y'))
+
+# Authoritative in-memory world state, stays None if MongoDB is the source of truth
+world_state = None
+
+# Create feed of tasks events for visible area subscribers
+task_events = TaskEventFeed(app.config['TASK_EVENTS_BUFFER'])
+
+# Tasks sweeper and task assigner, stay None if not used in this mode or till the engine boots
+task_sweeper = None
+task_assigner = None
+
+# Simulation engine boot progress shown on the main page
+boot_progress = BootProgress()
+
+
+def seed_world():
+
+    """
+    Generate new world and save it in batches, seeded players are counted in boot progress. Columnar players table
+    is filled from the generated map arrays.
+    :return: True if players table is filled
+    :rtype: bool
+    """
+
+    global seeding_stats
+
+    boot_progress.set_stage('seeding')
+    boot_progress.total_players = app.config['PLAYERS_NUMBER']
 
     creator = WorldCreator(app.config['MAP_WIDTH'], app.config['MAP_HEIGHT'], app.config['PLAYERS_NUMBER'])
     new_world = creator.generate_new_world()
-    creator.save_world(players_collection, new_world)
+    ids = [] if player_table is not None else None
+    seeding_stats = creator.save_world(players_collection, new_world, app.config['SEED_BATCH_SIZE'],
+                                       app.config['SEED_ORDERED_WRITES'],
+                                       progress=lambda number: setattr(boot_progress, 'seeded_players', number),
+                                       ids=ids)
+
+    if ids is None:
+        return False
+
+    player_table.load_world(new_world, ids)
+
+    return True
+
+
+def assign_players_tasks(players):
+
+    """
+    Start tasks assignment for all the players. In fast boot mode players are added to the running assigner in
+    batches of config.WARMUP_BATCH_SIZE with config.WARMUP_BATCH_DELAY seconds between batches.
+    :param players: MongoDB collection cursor or list of players
+    :return: None
+    """
 
-# Get all players from the collection
-players = players_collection.find()
+    global task_assigner
 
-# Assign tasks for each player
-if app.config['ASSIGN_ON_BOOT']:
+    boot_progress.set_stage('assigning')
+
+    # Sharded workers forked on import get all their players on start
+    if task_workers is not None:
+
+        task_workers.start(players, world_state is not None, player_cache is not None)
+        boot_progress.assigned_players = boot_progress.total_players
+
+        return
 
     task_assigner = TaskAssigner(players_collection, log_collection)
-    task_assigner.start_task_assignment(players)
+
+    if not app.config['FAST_BOOT']:
+
+        task_assigner.start_task_assignment(players)
+        boot_progress.assigned_players = boot_progress.total_players
+
+        return
+
+    task_assigner.start_task_assignment([])
+
+    batch = []
+
+    for player in players:
+
+        batch.append(player)
+
+        if len(batch) < app.config['WARMUP_BATCH_SIZE']:
+            continue
+
+        task_assigner.add_players(batch)
+        boot_progress.assigned_players += len(batch)
+        batch = []
+
+        time.sleep(app.config['WARMUP_BATCH_DELAY'])
+
+    if batch:
+        task_assigner.add_players(batch)
+        boot_progress.assigned_players += len(batch)
+
+
+def boot_engine():
+
+    """
+    Recover or seed the world, load players into memory and start tasks sweeping and assignment.
+    :return: None
+    """
+
+    global world_state
+
+    boot_progress.set_stage('checking')
+
+    # Recover the world from the last snapshot or check if database exists and there are some players
+    if app.config['WORLD_STATE']:
+        world_state = WorldState(spatial_index, players_collection, app.config['WORLD_CHANGE_LOG'],
+                                 app.config['WORLD_SNAPSHOT_INTERVAL'])
+        world_exists = world_state.recover()
+    else:
+        world_exists = (app.config['DATABASE_NAME'] in mongo_client.list_database_names() and
+                        players_collection.count_documents({}))
+
+    table_loaded = seed_world() if not world_exists else False
+
+    boot_progress.set_stage('loading')
+
+    # Load players into in-memory spatial index before any task changes them
+    if world_state is not None:
+
+        if not world_exists:
+            world_state.recover()
+
+        world_state.start()
+
+    elif app.config['SPATIAL_INDEX']:
+        spatial_index.load(players_collection, load_table=not table_loaded)
+
+    start_task_sweeper()
+
+    # Close tasks expired while the engine was down, live ones are resumed by tasks assignment
+    if app.config['RESUME_TASKS'] and app.config['ASSIGN_ON_BOOT']:
+        boot_progress.closed_tasks = (task_sweeper or make_task_sweeper()).close_expired_tasks()
+
+    # Get all players from memory or from the collection
+    if spatial_index.is_loaded:
+        players = spatial_index.get_players()
+        boot_progress.total_players = len(spatial_index)
+    else:
+        players = players_collection.find()
+        boot_progress.total_players = players_collection.estimated_document_count()
+
+    # Assign tasks for each player in separate worker processes or in this process
+    if app.config['ASSIGN_ON_BOOT']:
+        assign_players_tasks(players)
+
+    boot_progress.set_stage('ready')
+
+
+def make_task_sweeper():
+
+    """
+    Make sweeper of expired tasks.
+    :return: tasks sweeper
+    :rtype: TaskSweeper
+    """
+
+    return TaskSweeper(players_collection, log_collection, app.config['MAX_PLAYER_TASKS'],
+                       app.config['TASK_SWEEP_INTERVAL'], app.config['LOG_TTL'], spatial_index, world_state)
+
+
+def start_task_sweeper():
+
+    """
+    Delete expired tasks in bulk if they are not deleted on completion and expire old log notes.
+    :return: None
+    """
+
+    global task_sweeper
+
+    if not (app.config['LAZY_TASK_EXPIRY'] or app.config['LOG_TTL']):
+        return
+
+    task_sweeper = make_task_sweeper()
+
+    # Only log notes expire if tasks are deleted on completion
+    if app.config['LAZY_TASK_EXPIRY']:
+        task_sweeper.start()
+    else:
+        task_sweeper.create_indexes(task_indexes=False)
+
+
+def run_boot_engine():
+
+    """
+    Boot simulation engine in background thread, failure is shown in boot progress and logged.
+    :return: None
+    """
+
+    try:
+        boot_engine()
+    except Exception:
+        boot_progress.set_stage('failed')
+        app.logger.exception('Simulation engine boot failed')
+
+
+# Boot the engine before serving requests or serve requests right away and warm up the world in background, api
+# processes read the world from MongoDB and leave seeding to the engine process
+if run_engine and app.config['FAST_BOOT']:
+    threading.Thread(target=run_boot_engine, daemon=True).start()
+elif run_engine:
+    boot_engine()
+else:
+    boot_progress.set_stage('ready')
+
+# Apply players control commands sent by api processes
+if run_engine:
+    engine_commands.start(api_classes.apply_player_control)
+
+
+def shutdown():
+
+    """
+    Stop background loops and drain simulation engine, called on interpreter exit.
+    :return: None
+    """
+
+    engine_commands.stop()
+
+    if task_workers is not None:
+        task_workers.stop(app.config['SHUTDOWN_TIMEOUT'])
+
+    if task_assigner is not None:
+        task_assigner.stop(app.config['SHUTDOWN_TIMEOUT'])
+
+    if task_sweeper is not None:
+        task_sweeper.stop()
+
+    MapVision.stop_area_players_logging()
+
+
+atexit.register(shutdown)
+
+# Take live values for metrics gauges when metrics are rendered
+metrics.paused_players.set_function(TaskAssigner.get_paused_players_number)
+metrics.scheduled_tasks.set_function(lambda: len(task_assigner.scheduler) if task_assigner is not None else 0)
+metrics.task_start_rate.set_function(lambda: get_task_start_rate() or 0)
+
+if player_cache is not None:
+    metrics.player_cache_hit_rate.set_function(player_cache.get_hit_rate)
 
 # Setup api
 api.add_resource(api_classes.GetPlayer, '/api/get_player')
+api.add_resource(api_classes.GetPlayersBatch, '/api/get_players_batch')
 api.add_resource(api_classes.GetPlayers, '/api/get_players')
 api.add_resource(api_classes.TasksControl, '/api/tasks_control')
 api.add_resource(api_classes.AreaPlayersLogControl, '/api/area_log')
+api.add_resource(api_classes.AreaFeed, '/api/area_feed')
+api.add_resource(api_classes.TasksStats, '/api/tasks_stats')
+api.add_resource(api_classes.CacheStats, '/api/cache_stats')
+
+
+def get_task_start_rate():
+
+    """
+    Get achieved tasks starts rate of tasks assignment running in this process or in task workers.
+    :return: tasks starts per second or None if tasks are not assigned by this process
+    :rtype: float
+    """
+
+    if task_assigner is not None:
+        return task_assigner.get_start_rate()
+
+    if task_workers is not None:
+        return task_workers.get_start_rate()
+
+    return None
 
 
 @app.route('/')
@@ -54,9 +371,64 @@ def index():
     """
 
     # Get players number
-    current_players = players_collection.count_documents({})
+    current_players = len(spatial_index) if spatial_index.is_loaded else players_collection.count_documents({})
+
+    return render_template('index.html', current_players=current_players, seeding_stats=seeding_stats,
+                           paused_players=TaskAssigner.get_paused_players_number(),
+                           task_workers=task_workers.get_statuses() if task_workers is not None else [],
+                           area_cache_stats=area_cache.get_stats() if area_cache is not None else None,
+                           boot_progress=boot_progress.to_dict(), task_start_rate=get_task_start_rate(),
+                           target_start_rate=app.config['TASK_START_RATE'])
+
+
+@app.route('/health')
+def health():
+
+    """
+    Liveness check view.
+    :return: json response
+    """
+
+    return jsonify({'status': 'ok', 'engine': run_engine})
+
+
+@app.route('/ready')
+def ready():
+
+    """
+    Readiness check view. Server is ready when the engine has booted without failure, the world has players and tasks
+    assignment of the engine is running.
+    :return: json response with 200 code if server is ready or 503 code if it is not
+    """
+
+    # Get players number
+    players_number = len(spatial_index) if spatial_index.is_loaded else players_collection.estimated_document_count()
+
+    # Check tasks assignment if it runs in this process
+    if task_assigner is not None:
+        assignment_running = task_assigner.is_running()
+    elif task_workers is not None:
+        assignment_running = all(worker.is_alive() for worker in task_workers.workers)
+    else:
+        assignment_running = None
+
+    is_ready = boot_progress.is_ready and players_number > 0 and assignment_running is not False
+
+    result = {'ready': is_ready, 'engine': run_engine, 'players': players_number,
+              'assignment_running': assignment_running, 'boot': boot_progress.to_dict()}
 
-    return render_template('index.html', current_players=current_players)
+    return jsonify(result), 200 if is_ready else 503
+
+
+@app.route('/metrics')
+def metrics_page():
+
+    """
+    Metrics page view in Prometheus text format.
+    :return: metrics response
+    """
+
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/server_config')
@@ -71,9 +443,8 @@ def server_config():
     with open('config.py', 'r') as file:
         current_config = file.read().splitlines()
 
-    return render_template('server_config.html', current_config=current_config)
+    # Get current metrics without comments
+    current_metrics = [line for line in metrics.registry.render().splitlines() if not line.startswith('#')]
 
+    return render_template('server_config.html', current_config=current_config, current_metrics=current_metrics)
 
-if __name__ == '__main__':
-
-    app.run()
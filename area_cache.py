@@ -0,0 +1,280 @@
+"""
+Module for cache of visible areas players with invalidation by players changes.
+"""
+
+
+import threading
+from collections import OrderedDict
+
+
+class AreaCache:
+
+    """
+    Class for LRU cache of prepared visible areas players. Areas are cached by area coordinates and spatial index
+    cells are cached too, so an area next to the cached one is assembled from the cached cells. Cache is invalidated
+    by spatial index changes: only the changed cell and areas containing the changed point are dropped.
+    """
+
+    def __init__(self, index, max_players):
+
+        """
+        Instance initialization.
+        :param index: in-memory spatial index to take players from
+        :type index: spatial_index.SpatialIndex
+        :param max_players: max number of cached players dicts in all entries
+        :type max_players: int
+        """
+
+        self.index = index
+        self.cell_size = index.cell_size
+        self.max_players = max_players
+
+        # Cache key ('area', area) or ('cell', cell) to players list mapping in LRU order
+        self._entries = OrderedDict()
+        self._size = 0
+        # Cell to keys of cached areas covering the cell mapping
+        self._area_keys = {}
+        # Cell to number of its changes mapping, to skip caching of data read before the change
+        self._versions = {}
+        # Number of whole cache clears, to skip caching of data read before the clear in any cell
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = {'area': 0, 'cell': 0}
+        self.misses = {'area': 0, 'cell': 0}
+
+        # Get notified about spatial index changes
+        index.listeners.append(self)
+
+    def get_area_cells(self, area):
+
+        """
+        Get spatial index cells covering area.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: list of cells coordinates
+        :rtype: list
+        """
+
+        return [(cell_x, cell_y)
+                for cell_x in range(area[0] // self.cell_size, area[1] // self.cell_size + 1)
+                for cell_y in range(area[2] // self.cell_size, area[3] // self.cell_size + 1)]
+
+    def _get_version(self, cell):
+
+        """
+        Get cell version to compare with after reading cell players. Lock must be acquired by the caller.
+        :param cell: cell coordinates
+        :type cell: tuple
+        :return: cache generation and cell changes number
+        :rtype: tuple
+        """
+
+        return self._generation, self._versions.get(cell, 0)
+
+    def _put(self, key, players):
+
+        """
+        Put entry to the cache and evict least recently used entries over the limit. Lock must be acquired by the
+        caller.
+        :param key: cache key
+        :type key: tuple
+        :param players: players list
+        :type players: list
+        :return: None
+        """
+
+        self._pop(key)
+        self._entries[key] = players
+        self._size += len(players)
+
+        if key[0] == 'area':
+
+            for cell in self.get_area_cells(key[1]):
+                self._area_keys.setdefault(cell, set()).add(key)
+
+        while self._size > self.max_players and self._entries:
+            self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+
+        """
+        Drop entry from the cache. Lock must be acquired by the caller.
+        :param key: cache key
+        :type key: tuple
+        :return: None
+        """
+
+        players = self._entries.pop(key, None)
+
+        if players is None:
+            return
+
+        self._size -= len(players)
+
+        if key[0] == 'area':
+
+            for cell in self.get_area_cells(key[1]):
+
+                area_keys = self._area_keys.get(cell)
+
+                if area_keys is not None:
+
+                    area_keys.discard(key)
+
+                    if not area_keys:
+                        del self._area_keys[cell]
+
+    def _get(self, key):
+
+        """
+        Get entry from the cache and count hit or miss. Lock must be acquired by the caller.
+        :param key: cache key
+        :type key: tuple
+        :return: players list or None
+        :rtype: list
+        """
+
+        players = self._entries.get(key)
+
+        if players is None:
+            self.misses[key[0]] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits[key[0]] += 1
+
+        return players
+
+    def get_cell_players(self, cell, version):
+
+        """
+        Get prepared players of spatial index cell.
+        :param cell: cell coordinates
+        :type cell: tuple
+        :param version: cell version read before the call
+        :type version: tuple
+        :return: players list
+        :rtype: list
+        """
+
+        key = ('cell', cell)
+
+        with self._lock:
+            players = self._get(key)
+
+        if players is not None:
+            return players
+
+        cell_area = (cell[0] * self.cell_size, (cell[0] + 1) * self.cell_size - 1,
+                     cell[1] * self.cell_size, (cell[1] + 1) * self.cell_size - 1)
+        players = self.index.get_area_players(cell_area)
+
+        for player in players:
+            player['_id'] = str(player['_id'])
+
+        with self._lock:
+
+            # Cell could be changed while players were read
+            if self._get_version(cell) == version:
+                self._put(key, players)
+
+        return players
+
+    def get_area_players(self, area):
+
+        """
+        Get prepared players (with str ids) within area. Players dicts are shared and must not be changed.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: new list of players dicts
+        :rtype: list
+        """
+
+        key = ('area', area)
+        cells = self.get_area_cells(area)
+
+        with self._lock:
+
+            players = self._get(key)
+
+            if players is not None:
+                return list(players)
+
+            versions = [self._get_version(cell) for cell in cells]
+
+        players = []
+
+        # Assemble area from cells, border cells are only partially covered by the area
+        for cell, version in zip(cells, versions):
+
+            for player in self.get_cell_players(cell, version):
+
+                if area[0] <= player['x'] <= area[1] and area[2] <= player['y'] <= area[3]:
+                    players.append(player)
+
+        with self._lock:
+
+            # Area could be changed while players were read
+            if all(self._get_version(cell) == version for cell, version in zip(cells, versions)):
+                self._put(key, players)
+
+        return list(players)
+
+    def invalidate_point(self, x, y):
+
+        """
+        Drop cached cell and areas which contain changed point.
+        :param x: x coordinate
+        :type x: int
+        :param y: y coordinate
+        :type y: int
+        :return: None
+        """
+
+        cell = (x // self.cell_size, y // self.cell_size)
+
+        with self._lock:
+
+            self._versions[cell] = self._versions.get(cell, 0) + 1
+            self._pop(('cell', cell))
+
+            for key in list(self._area_keys.get(cell, ())):
+
+                area = key[1]
+
+                if area[0] <= x <= area[1] and area[2] <= y <= area[3]:
+                    self._pop(key)
+
+    def clear(self):
+
+        """
+        Drop all cached entries.
+        :return: None
+        """
+
+        with self._lock:
+
+            # New generation skips caching of any cell or area being read right now, even never cached before, so
+            # cells versions can start over
+            self._generation += 1
+            self._versions.clear()
+            self._entries.clear()
+            self._area_keys.clear()
+            self._size = 0
+
+    def get_stats(self):
+
+        """
+        Get cache hits and misses counters and size.
+        :return: cache stats
+        :rtype: dict
+        """
+
+        with self._lock:
+
+            return {'hits': dict(self.hits),
+                    'misses': dict(self.misses),
+                    'entries': len(self._entries),
+                    'players': self._size,
+                    'max_players': self.max_players}
@@ -0,0 +1,690 @@
+"""
+Benchmark and load generation suite for the game server. Measures world seeding, task scheduler ticks, area queries,
+responses serialization, api endpoints throughput and startup time to first request, prints p50/p99 latencies and
+writes results as json to compare them between runs.
+
+Usage: python benchmark.py [--store memory|mongo] [--output results.json] [--compare previous.json]
+"""
+
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import bson
+import numpy as np
+import config
+import benchmark_serializers
+import serializers
+from world_initialization import WorldCreator
+from task_scheduler import TaskScheduler
+from spatial_index import SpatialIndex
+from area_cache import AreaCache
+
+
+class MemoryCollection:
+
+    """
+    Class for in-memory stand-in of MongoDB collection with operations used by world seeding only. Measures seeding
+    cost on the server side without database round trips.
+    """
+
+    def __init__(self):
+
+        """
+        Instance initialization.
+        """
+
+        self.documents = []
+
+    def create_index(self, keys, **kwargs):
+
+        """
+        Ignore index creation.
+        :param keys: index keys
+        :type keys: list
+        :return: None
+        """
+
+    def insert_many(self, documents, ordered=True):
+
+        """
+        Insert documents with new ids.
+        :param documents: documents to insert
+        :type documents: list
+        :param ordered: ignored
+        :type ordered: bool
+        :return: None
+        """
+
+        for document in documents:
+            document.setdefault('_id', bson.ObjectId())
+
+        self.documents.extend(documents)
+
+    def find(self, *args, **kwargs):
+
+        """
+        Get all documents.
+        :return: list of documents copies
+        :rtype: list
+        """
+
+        return [dict(document) for document in self.documents]
+
+
+def get_mongo_client_class(store):
+
+    """
+    Get MongoDB client class for the store.
+    :param store: 'mongo' for MongoDB server from config or 'memory' for mongomock in-memory server
+    :type store: str
+    :return: MongoDB client class or None if store is not available
+    """
+
+    if store == 'mongo':
+
+        import pymongo
+
+        return pymongo.MongoClient
+
+    try:
+        import mongomock
+    except ImportError:
+        return None
+
+    return mongomock.MongoClient
+
+
+def summarize(samples, seconds=None):
+
+    """
+    Make latency summary of samples.
+    :param samples: latencies in seconds
+    :type samples: list
+    :param seconds: total time of samples in seconds to calculate throughput
+    :type seconds: float
+    :return: summary with latencies in milliseconds
+    :rtype: dict
+    """
+
+    samples = np.array(samples, dtype=float) * 1000
+
+    summary = {'count': len(samples),
+               'mean_ms': round(float(samples.mean()), 4),
+               'p50_ms': round(float(np.percentile(samples, 50)), 4),
+               'p99_ms': round(float(np.percentile(samples, 99)), 4),
+               'max_ms': round(float(samples.max()), 4)}
+
+    if seconds:
+        summary['per_second'] = round(len(samples) / seconds, 1)
+
+    return summary
+
+
+def bench_seeding(args, collection):
+
+    """
+    Measure world generation and WorldCreator.save_world time.
+    :param args: parsed command line arguments
+    :param collection: collection to save players to
+    :return: results
+    :rtype: dict
+    """
+
+    creator = WorldCreator(args.map_width, args.map_height, args.players)
+
+    start_time = time.perf_counter()
+    world = creator.generate_new_world()
+    generation_seconds = time.perf_counter() - start_time
+
+    seeding_stats = creator.save_world(collection, world, args.seed_batch_size)
+
+    return {'generation_seconds': round(generation_seconds, 4),
+            'save_seconds': seeding_stats['seconds'],
+            'rows_per_second': seeding_stats['rows_per_second'],
+            'players': seeding_stats['players']}
+
+
+def bench_scheduler(args, app):
+
+    """
+    Measure TaskScheduler schedule cost and tasks completion lag through TaskAssigner tick path: scheduler callback
+    resumes task coroutine which deletes the task in memory tasks repository, updates in-memory views and saves log
+    notes. Every player gets max number of tasks and all of them end within one second, so the loop ticks under the load
+    of the whole world expiring at once.
+    :param args: parsed command line arguments
+    :param app: booted app module
+    :return: results
+    :rtype: dict
+    """
+
+    from task_assignment import TaskAssigner
+    from task_repository import InMemoryTaskRepository
+
+    players = list(app.players_collection.find({}, {'x': 1, 'y': 1}))
+    task_ids = [f'Task {i}' for i in range(1, config.MAX_PLAYER_TASKS + 1)]
+    tasks_number = len(players) * len(task_ids)
+
+    # Measure scheduling of tasks ending in far future
+    loop = asyncio.new_event_loop()
+    scheduler = TaskScheduler(loop)
+    end_time = time.time() + 3600
+    schedule_samples = []
+    start_time = time.perf_counter()
+
+    for player in players:
+
+        for _ in task_ids:
+
+            schedule_start_time = time.perf_counter()
+            scheduler.schedule(end_time + random.random(), TaskAssigner.finish_task_waiting, loop.create_future(),
+                               group=player['_id'])
+            schedule_samples.append(time.perf_counter() - schedule_start_time)
+
+    schedule_seconds = time.perf_counter() - start_time
+    loop.close()
+
+    # Measure completion lag of tasks which start ending after all of them are scheduled
+    task_assigner = TaskAssigner(None, None, repository=InMemoryTaskRepository())
+    lags = []
+
+    async def complete_task(player, task_id, task_end_time):
+
+        """
+        Async function to wait till the end of the task, finish it and record its completion lag.
+        :param player: player's dict
+        :type player: dict
+        :param task_id: task id
+        :type task_id: str
+        :param task_end_time: time of the task end (Unix timestamp)
+        :type task_end_time: float
+        :return: None
+        """
+
+        await task_assigner.resume_task(player, task_id, task_end_time)
+        lags.append(time.time() - task_end_time)
+
+    async def complete_tasks():
+
+        """
+        Async function to run task coroutines of all players which start ending after all of them are scheduled.
+        :return: None
+        """
+
+        start_time = time.time() + schedule_seconds * 2 + 0.2
+
+        await asyncio.gather(*(complete_task(player, task_id, start_time + random.random())
+                               for player in players for task_id in task_ids))
+
+    task_assigner.main_loop.run_until_complete(complete_tasks())
+    task_assigner.stop()
+    task_assigner.main_loop.close()
+
+    return {'schedule': summarize(schedule_samples, schedule_seconds), 'completion_lag': summarize(lags),
+            'tasks': tasks_number}
+
+
+def bench_area_queries(args, collection):
+
+    """
+    Measure visible area queries of spatial index and area cache with random centers.
+    :param args: parsed command line arguments
+    :param collection: seeded collection to load players from
+    :type collection: MemoryCollection
+    :return: results
+    :rtype: dict
+    """
+
+    index = SpatialIndex(config.SPATIAL_INDEX_CELL_SIZE)
+    index.load(collection)
+    cache = AreaCache(index, config.AREA_CACHE_MAX_PLAYERS)
+    half_width = config.VISIBLE_AREA_WIDTH // 2
+    half_height = config.VISIBLE_AREA_HEIGHT // 2
+
+    areas = []
+
+    for _ in range(args.queries):
+
+        x = random.randrange(args.map_width)
+        y = random.randrange(args.map_height)
+        areas.append((x - half_width, x + half_width, y - half_height, y + half_height))
+
+    results = {}
+
+    for name, get_area_players in (('spatial_index', index.get_area_players),
+                                   ('area_cache', cache.get_area_players)):
+
+        samples = []
+        start_time = time.perf_counter()
+
+        for area in areas:
+
+            query_start_time = time.perf_counter()
+            get_area_players(area)
+            samples.append(time.perf_counter() - query_start_time)
+
+        results[name] = summarize(samples, time.perf_counter() - start_time)
+
+    results['area_cache']['stats'] = cache.get_stats()
+
+    return results
+
+
+def bench_serialization(args, players):
+
+    """
+    Measure serialization of get_players response with every installed backend.
+    :param args: parsed command line arguments
+    :param players: players dicts
+    :type players: list
+    :return: results
+    :rtype: dict
+    """
+
+    results = {}
+    paths = {'previous': benchmark_serializers.encode_previous}
+
+    for name, serializer in serializers.get_available_serializers().items():
+        paths[name] = lambda data, serializer=serializer: serializer.dumps({'players': data, 'next_after': None})
+
+    for name, encode in paths.items():
+
+        seconds, size = benchmark_serializers.measure(encode, players, args.repeats)
+        results[name] = {'ms': round(seconds * 1000, 4), 'bytes': size,
+                         'players_per_second': round(len(players) / seconds)}
+
+    return results
+
+
+def boot_app(args, client_class):
+
+    """
+    Boot the app in this process with benchmark world against the store, tasks are assigned only with --assign-tasks.
+    :param args: parsed command line arguments
+    :param client_class: MongoDB client class
+    :return: app module
+    """
+
+    import pymongo
+
+    # Boot the app with benchmark world and without tasks assignment
+    config.MAP_WIDTH = args.map_width
+    config.MAP_HEIGHT = args.map_height
+    config.PLAYERS_NUMBER = args.players
+    config.DATABASE_NAME = args.database
+    config.ASSIGN_ON_BOOT = int(args.assign_tasks)
+    config.DEBUG = False
+    pymongo.MongoClient = client_class
+
+    import app
+
+    return app
+
+
+def bench_endpoints(args, app):
+
+    """
+    Measure api endpoints latency and throughput through Flask test client of the app booted with the configured
+    world against the store.
+    :param args: parsed command line arguments
+    :param app: booted app module
+    :return: results
+    :rtype: dict
+    """
+
+    client = app.app.test_client()
+    player_ids = [str(player['_id']) for player in app.players_collection.find({}, {'_id': 1})]
+
+    endpoints = {'get_player': lambda: f'/api/get_player?player_id={random.choice(player_ids)}',
+                 'get_players_page': lambda: '/api/get_players?limit=100',
+                 'get_players_batch': lambda: '/api/get_players_batch?' + '&'.join(
+                     f'player_id={player_id}' for player_id in random.sample(player_ids, min(50, len(player_ids)))),
+                 'tasks_stats': lambda: '/api/tasks_stats'}
+
+    results = {}
+
+    for name, make_url in endpoints.items():
+
+        urls = [make_url() for _ in range(args.requests)]
+        samples = []
+        start_time = time.perf_counter()
+
+        for url in urls:
+
+            request_start_time = time.perf_counter()
+            client.get(url)
+            samples.append(time.perf_counter() - request_start_time)
+
+        results[name] = summarize(samples, time.perf_counter() - start_time)
+
+    return results
+
+
+def wait_for(check, timeout, interval=0.01):
+
+    """
+    Call check function till it returns True.
+    :param check: function to call
+    :param timeout: max waiting time in seconds
+    :type timeout: float
+    :param interval: delay between calls in seconds
+    :type interval: float
+    :return: True if check passed before timeout
+    :rtype: bool
+    """
+
+    deadline = time.perf_counter() + timeout
+
+    while not check():
+
+        if time.perf_counter() > deadline:
+            return False
+
+        time.sleep(interval)
+
+    return True
+
+
+def run_startup_child(args):
+
+    """
+    Boot the app in this process and print json with seconds from app import to the first served request, to the
+    first served players and to the finished engine boot. Runs in a separate process for every boot mode because the
+    app boots once per process.
+    :param args: parsed command line arguments
+    :return: None
+    """
+
+    import pymongo
+
+    client_class = get_mongo_client_class(args.store)
+
+    # Boot the app with benchmark world in configured boot mode
+    config.MAP_WIDTH = args.map_width
+    config.MAP_HEIGHT = args.map_height
+    config.PLAYERS_NUMBER = args.players
+    config.DATABASE_NAME = args.database
+    config.ASSIGN_ON_BOOT = int(args.assign_tasks)
+    config.FAST_BOOT = args.startup_child
+    config.SERVER_ROLE = 'engine'
+    config.DEBUG = False
+    pymongo.MongoClient = client_class
+
+    start_time = time.perf_counter()
+
+    import app
+
+    results = {'import_seconds': time.perf_counter() - start_time}
+    client = app.app.test_client()
+
+    # First request is served as soon as the app is imported, the world may still be seeded in background
+    client.get('/health')
+    results['first_request_seconds'] = time.perf_counter() - start_time
+
+    if wait_for(lambda: client.get('/api/get_players?limit=1').get_json()['players'], args.startup_timeout):
+        results['first_players_seconds'] = time.perf_counter() - start_time
+
+    if wait_for(lambda: app.boot_progress.stage in ('ready', 'failed'), args.startup_timeout):
+        results['boot_seconds'] = time.perf_counter() - start_time
+
+    results['boot_stage'] = app.boot_progress.stage
+
+    app.mongo_client.drop_database(args.database)
+
+    print(json.dumps(results))
+    sys.stdout.flush()
+
+    # Leave without draining tasks assignment, only boot is measured
+    os._exit(0)
+
+
+def bench_startup(args):
+
+    """
+    Measure startup time to first request with regular and fast boot, every boot runs in a new process against empty
+    database, so the world is seeded on boot.
+    :param args: parsed command line arguments
+    :return: results
+    :rtype: dict
+    """
+
+    results = {}
+
+    for fast_boot in (0, 1):
+
+        command = [sys.executable, os.path.abspath(__file__), '--store', args.store, '--database', args.database,
+                   '--map-width', str(args.map_width), '--map-height', str(args.map_height),
+                   '--players', str(args.players), '--startup-timeout', str(args.startup_timeout),
+                   '--startup-child', str(fast_boot)]
+
+        if args.assign_tasks:
+            command.append('--assign-tasks')
+
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        name = 'fast_boot' if fast_boot else 'regular_boot'
+
+        if process.returncode != 0:
+            results[name] = {'error': process.stderr.strip().splitlines()[-1:]}
+        else:
+            results[name] = json.loads(process.stdout.strip().splitlines()[-1])
+
+    return results
+
+
+def compare_results(previous, current):
+
+    """
+    Print p50 and p99 changes and startup times changes of current results against previous ones.
+    :param previous: previous results
+    :type previous: dict
+    :param current: current results
+    :type current: dict
+    :return: None
+    """
+
+    def flatten(results, prefix=''):
+
+        """
+        Flatten nested results to name to summary mapping.
+        :param results: nested results
+        :type results: dict
+        :param prefix: name prefix
+        :type prefix: str
+        :return: generator for (name, summary) tuples
+        """
+
+        for name, value in results.items():
+
+            if isinstance(value, dict) and 'p50_ms' in value:
+                yield prefix + name, value
+            elif isinstance(value, dict):
+                yield from flatten(value, f'{prefix}{name}.')
+
+    def get_change(previous_value, value):
+
+        """
+        Get value change in percents.
+        :param previous_value: previous value
+        :type previous_value: float
+        :param value: current value
+        :type value: float
+        :return: change in percents, 0 if previous value is 0
+        :rtype: float
+        """
+
+        return (value / previous_value - 1) * 100 if previous_value else 0
+
+    previous_summaries = dict(flatten(previous['results']))
+
+    for name, summary in flatten(current['results']):
+
+        previous_summary = previous_summaries.get(name)
+
+        if previous_summary is None:
+            continue
+
+        changes = ', '.join(f'{key} {previous_summary[key]:.3f} -> {summary[key]:.3f} ms '
+                            f'({get_change(previous_summary[key], summary[key]):+.1f}%)'
+                            for key in ('p50_ms', 'p99_ms'))
+
+        print(f'{name}: {changes}')
+
+    # Startup times are single measurements rather than latencies summaries
+    previous_startup = previous['results'].get('startup', {})
+
+    for name, times in current['results'].get('startup', {}).items():
+
+        previous_times = previous_startup.get(name)
+
+        if not isinstance(times, dict) or not isinstance(previous_times, dict):
+            continue
+
+        changes = ', '.join(f'{key} {previous_times[key]:.3f} -> {times[key]:.3f} s'
+                            for key in ('first_request_seconds', 'first_players_seconds', 'boot_seconds')
+                            if key in times and key in previous_times)
+
+        print(f'startup.{name}: {changes}')
+
+
+def parse_arguments(argv):
+
+    """
+    Parse command line arguments.
+    :param argv: command line arguments
+    :type argv: list
+    :return: parsed arguments
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--store', choices=('memory', 'mongo'), default='memory',
+                        help='store for seeding and endpoints: mongomock in memory or MongoDB server from config')
+    parser.add_argument('--database', default='benchmark', help='database name for mongo store')
+    parser.add_argument('--map-width', type=int, default=config.MAP_WIDTH)
+    parser.add_argument('--map-height', type=int, default=config.MAP_HEIGHT)
+    parser.add_argument('--players', type=int, default=config.PLAYERS_NUMBER)
+    parser.add_argument('--seed-batch-size', type=int, default=config.SEED_BATCH_SIZE)
+    parser.add_argument('--queries', type=int, default=10000, help='number of area queries')
+    parser.add_argument('--requests', type=int, default=500, help='number of requests per endpoint')
+    parser.add_argument('--repeats', type=int, default=3, help='number of serialization measurements')
+    parser.add_argument('--assign-tasks', action='store_true', help='assign tasks while endpoints are measured')
+    parser.add_argument('--startup-timeout', type=float, default=300,
+                        help='max seconds to wait for players and engine boot in startup benchmark')
+    parser.add_argument('--only', default='seeding,scheduler,area,serialization,endpoints,startup',
+                        help='comma separated benchmarks to run')
+    parser.add_argument('--output', default=os.path.join('results', 'benchmark_results.json'),
+                        help='results json file')
+    parser.add_argument('--compare', help='previous results json file to compare with')
+    parser.add_argument('--startup-child', type=int, choices=(0, 1), help=argparse.SUPPRESS)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+
+    """
+    Run benchmarks, print and save results.
+    :param argv: command line arguments, sys.argv by default
+    :type argv: list
+    :return: results
+    :rtype: dict
+    """
+
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+
+    # Boot the app for startup benchmark in this process
+    if args.startup_child is not None:
+        run_startup_child(args)
+
+    benchmarks = set(args.only.split(','))
+    client_class = get_mongo_client_class(args.store)
+    results = {}
+    skipped = {'skipped': 'mongomock missing'}
+
+    # Benchmarks against the store can not run for memory store without mongomock
+    store_benchmarks = sorted(benchmarks & {'seeding', 'scheduler', 'endpoints', 'startup'})
+
+    if client_class is None and store_benchmarks:
+        print(f'skipped: mongomock missing, install dev packages to run {", ".join(store_benchmarks)} benchmarks')
+
+    # Seed in memory to get players for in-memory benchmarks, the store is seeded by the app itself
+    memory_collection = MemoryCollection()
+    results['seeding_memory'] = bench_seeding(args, memory_collection)
+
+    if 'seeding' in benchmarks and client_class is not None:
+
+        store_client = client_class(config.MONGODB_HOST, config.MONGODB_PORT)
+
+        try:
+            results['seeding_store'] = bench_seeding(args, store_client[args.database]['seeding'])
+        finally:
+            store_client.drop_database(args.database)
+
+    elif 'seeding' in benchmarks:
+        results['seeding_store'] = skipped
+
+    if 'area' in benchmarks:
+        results['area_queries'] = bench_area_queries(args, memory_collection)
+
+    if 'serialization' in benchmarks:
+        results['serialization'] = bench_serialization(args, memory_collection.documents)
+
+    # Scheduler and endpoints are measured with the app booted against the store
+    app_benchmarks = [name for name in ('scheduler', 'endpoints') if name in benchmarks]
+
+    if app_benchmarks and client_class is not None:
+
+        app = boot_app(args, client_class)
+
+        try:
+
+            if 'scheduler' in benchmarks:
+                results['scheduler'] = bench_scheduler(args, app)
+
+            if 'endpoints' in benchmarks:
+                results['endpoints'] = bench_endpoints(args, app)
+
+        finally:
+            app.mongo_client.drop_database(args.database)
+
+    else:
+
+        for name in app_benchmarks:
+            results[name] = skipped
+
+    if 'startup' in benchmarks:
+
+        if client_class is not None:
+            results['startup'] = bench_startup(args)
+        else:
+            results['startup'] = skipped
+
+    report = {'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'arguments': vars(args),
+              'results': results}
+
+    print(json.dumps(results, indent=2))
+
+    # Create results directory if it does not exist
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.compare:
+
+        with open(args.compare, 'r') as file:
+            compare_results(json.load(file), report)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
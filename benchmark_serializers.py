@@ -0,0 +1,122 @@
+"""
+Benchmark of api responses serialization: the previous path (ids converted one by one and encoded with json module)
+against serializers with every installed backend.
+
+Usage: python benchmark_serializers.py [players_number] [repeats]
+"""
+
+
+import sys
+import json
+import random
+import time
+import bson
+import serializers
+
+
+def make_players(players_number, max_tasks=4):
+
+    """
+    Make players dicts as they are stored in MongoDB.
+    :param players_number: number of players
+    :type players_number: int
+    :param max_tasks: max number of player's tasks
+    :type max_tasks: int
+    :return: list of players dicts
+    :rtype: list
+    """
+
+    now = time.time()
+    players = []
+
+    for _ in range(players_number):
+
+        player = {'_id': bson.ObjectId(), 'x': random.randrange(512), 'y': random.randrange(512)}
+
+        for task_number in range(1, random.randint(0, max_tasks) + 1):
+            player[f'Task {task_number}'] = now + random.uniform(10, 600)
+
+        players.append(player)
+
+    return players
+
+
+def encode_previous(players):
+
+    """
+    Encode players response as resources did before serializers: convert ids one by one and encode with json module.
+    :param players: list of players dicts
+    :type players: list
+    :return: encoded response
+    :rtype: bytes
+    """
+
+    players_list = []
+
+    for player in players:
+
+        player = dict(player)
+        player['_id'] = str(player['_id'])
+        players_list.append(player)
+
+    return json.dumps({'players': players_list, 'next_after': None}).encode()
+
+
+def measure(encode, players, repeats):
+
+    """
+    Measure the best encoding time.
+    :param encode: function to encode players
+    :param players: list of players dicts
+    :type players: list
+    :param repeats: number of measurements
+    :type repeats: int
+    :return: best time in seconds and encoded size in bytes
+    :rtype: tuple
+    """
+
+    best_time = None
+    size = 0
+
+    for _ in range(repeats):
+
+        start_time = time.perf_counter()
+        size = len(encode(players))
+        spent_time = time.perf_counter() - start_time
+
+        best_time = spent_time if best_time is None else min(best_time, spent_time)
+
+    return best_time, size
+
+
+def main(players_number=20000, repeats=5):
+
+    """
+    Run the benchmark and print results.
+    :param players_number: number of players in the response
+    :type players_number: int
+    :param repeats: number of measurements for every serializer
+    :type repeats: int
+    :return: None
+    """
+
+    players = make_players(players_number)
+
+    paths = {'previous': encode_previous}
+
+    for name, serializer in serializers.get_available_serializers().items():
+        paths[name] = lambda data, serializer=serializer: serializer.dumps({'players': data, 'next_after': None})
+
+    previous_time = None
+
+    for name, encode in paths.items():
+
+        spent_time, size = measure(encode, players, repeats)
+        previous_time = previous_time or spent_time
+
+        print(f'{name:>10}: {spent_time * 1000:8.2f} ms, {players_number / spent_time:12.0f} players/s, '
+              f'{size:10d} bytes, x{previous_time / spent_time:.2f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
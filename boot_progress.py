@@ -0,0 +1,70 @@
+"""
+Module for simulation engine boot progress.
+"""
+
+
+import time
+
+
+class BootProgress:
+
+    """
+    Class describing simulation engine boot progress: current stage, seeded players and players with assigned tasks.
+    Stages are 'waiting', 'checking', 'seeding', 'loading', 'assigning', 'ready' and 'failed'.
+    """
+
+    def __init__(self):
+
+        """
+        Instance initialization.
+        """
+
+        self.stage = 'waiting'
+        self.total_players = 0
+        self.seeded_players = 0
+        self.assigned_players = 0
+        # Tasks expired while the server was down and closed on boot
+        self.closed_tasks = 0
+        self.started_at = time.time()
+        # Seconds from boot start to the ready stage
+        self.boot_seconds = None
+
+    def set_stage(self, stage):
+
+        """
+        Move boot to the next stage.
+        :param stage: stage name
+        :type stage: str
+        :return: None
+        """
+
+        self.stage = stage
+
+        if stage == 'ready':
+            self.boot_seconds = round(time.time() - self.started_at, 3)
+
+    @property
+    def is_ready(self):
+
+        """
+        Check if boot is finished.
+        :return: True if boot is finished
+        :rtype: bool
+        """
+
+        return self.stage == 'ready'
+
+    def to_dict(self):
+
+        """
+        Make boot progress dict.
+        :return: boot progress
+        :rtype: dict
+        """
+
+        return {'stage': self.stage,
+                'total_players': self.total_players,
+                'seeded_players': self.seeded_players,
+                'assigned_players': self.assigned_players,
+                'closed_tasks': self.closed_tasks,
+                'boot_seconds': self.boot_seconds}
@@ -1,9 +1,22 @@
 # Flask app settings
 DEBUG = True
 
+# API serialization settings, json backend is 'json', 'orjson' or 'auto' for the fastest installed one
+JSON_BACKEND = 'auto'
+MSGPACK_OUTPUT = 1
+
+# Serving settings, server role is 'all' to run simulation engine in one of the server processes elected with the
+# lock file, 'engine' for separate engine process (engine.py) or 'api' for request workers only
+SERVER_ROLE = 'all'
+ENGINE_LOCK_FILE = 'engine.lock'
+ENGINE_COMMANDS_COLLECTION = 'engine_commands'
+ENGINE_COMMANDS_INTERVAL = 1
+SHUTDOWN_TIMEOUT = 10
+
 # MongoDB settings
 MONGODB_HOST = 'localhost'
 MONGODB_PORT = 27017
+MONGODB_MAX_POOL_SIZE = 100
 DATABASE_NAME = 'game'
 PLAYERS_COLLECTION = 'players'
 LOG_COLLECTION = 'log'
@@ -12,17 +25,84 @@ LOG_COLLECTION = 'log'
 MAP_WIDTH = 512
 MAP_HEIGHT = 512
 PLAYERS_NUMBER = 20000
+SEED_BATCH_SIZE = 1000
+SEED_ORDERED_WRITES = 1
+
+# Fast boot setting: serve requests right away while the world is seeded and tasks assignment is started in
+# background, players get tasks in batches of WARMUP_BATCH_SIZE with WARMUP_BATCH_DELAY seconds between batches
+FAST_BOOT = 0
+WARMUP_BATCH_SIZE = 1000
+WARMUP_BATCH_DELAY = 0.1
 
 # Task assignment setting
 ASSIGN_ON_BOOT = 1
+# Resume tasks saved by the previous server run instead of assigning new ones, tasks expired while the server was
+# down are closed on boot in one batch
+RESUME_TASKS = 1
 MAX_PLAYER_TASKS = 4
 MIN_TASK_DURATION = 10
 MAX_TASK_DURATION = 600
 DEFAULT_TASK_DELAY = 1
 
+# Task arrivals settings, arrivals kind - 'immediate' (all player's tasks start at once), 'jitter' (random start
+# offsets up to TASK_ARRIVAL_JITTER seconds) or 'poisson' (mean gap of TASK_ARRIVAL_INTERVAL seconds between starts)
+TASK_ARRIVALS = 'immediate'
+TASK_ARRIVAL_JITTER = 5
+TASK_ARRIVAL_INTERVAL = 2
+# Global limit of tasks starts per second with TASK_START_BURST starts at once, 0 for no limit
+TASK_START_RATE = 0
+TASK_START_BURST = 100
+# Window of achieved tasks starts rate measurement in seconds
+TASK_RATE_WINDOW = 10
+
+# Tasks persistence settings, repository kind - 'buffered' (write-behind buffer), 'mongo' (thread pool) or 'memory'
+TASK_REPOSITORY = 'buffered'
+WRITE_BUFFER_SIZE = 1000
+WRITE_BUFFER_INTERVAL = 1
+MAX_IN_FLIGHT_WRITES = 32
+
+# Lazy task expiry settings, expired tasks are deleted by the sweeper instead of completion write if enabled
+LAZY_TASK_EXPIRY = 0
+TASK_SWEEP_INTERVAL = 30
+LOG_TTL = 0
+
+# Sharded task assignment settings, 0 workers to assign tasks in the app process
+TASK_WORKERS = 0
+TASK_WORKERS_STATUS_INTERVAL = 1
+
 # Visible area settings
 VISIBLE_AREA_WIDTH = 32
 VISIBLE_AREA_HEIGHT = 32
+# Max number of players ids and areas centers in one batch request
+MAX_BATCH_SIZE = 500
+
+# Visible area feed settings
+TASK_EVENTS_BUFFER = 10000
+AREA_FEED_TIMEOUT = 25
+
+# Spatial index settings
+SPATIAL_INDEX = 1
+SPATIAL_INDEX_CELL_SIZE = 16
+PLAYER_TABLE = 1
+
+# Visible areas response cache settings, max players is the total number of cached players dicts
+AREA_CACHE = 1
+AREA_CACHE_MAX_PLAYERS = 200000
+
+# Players lookup cache settings, used when players are looked up in MongoDB
+PLAYER_CACHE = 1
+PLAYER_CACHE_SIZE = 100000
+PLAYER_CACHE_TTL = 30
+PLAYER_CACHE_NEGATIVE_TTL = 5
+
+# World state settings, in-memory world is the source of truth if enabled
+WORLD_STATE = 0
+WORLD_CHANGE_LOG = 'world_changes.log'
+WORLD_SNAPSHOT_INTERVAL = 60
 
 # Logging settings
 DEFAULT_LOGGING_DELAY = 1
+ASYNC_LOGGING = 1
+LOG_BATCH_SIZE = 500
+LOG_MAX_BYTES = 10485760
+LOG_BACKUP_COUNT = 3
@@ -0,0 +1,40 @@
+"""
+Separate simulation engine process for production serving mode: seeds the world, assigns players tasks and applies
+players control commands sent by api workers (config.SERVER_ROLE = 'api'). Runs till SIGTERM or SIGINT, then drains
+tasks assignment.
+
+Usage: python engine.py
+"""
+
+
+import signal
+import threading
+import config
+
+
+# Run simulation engine in this process regardless of the configured role
+config.SERVER_ROLE = 'engine'
+
+
+import app
+
+
+def main():
+
+    """
+    Wait for the stop signal, the engine is booted on app import and drained on interpreter exit.
+    :return: None
+    """
+
+    stop_event = threading.Event()
+
+    # Stop on termination and interruption signals
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *args: stop_event.set())
+
+    while not stop_event.wait(1):
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Module for server processes lifecycle: simulation engine election and control commands for the engine process.
+"""
+
+
+import fcntl
+import logging
+import threading
+import datetime
+from pymongo.errors import PyMongoError
+
+
+# Lock file kept open by the elected engine process, lock is released by the OS when the process exits
+_engine_lock_file = None
+# Election result of this process, the engine is elected once per process
+_run_engine = None
+
+
+def elect_engine(role, lock_path):
+
+    """
+    Decide whether this process runs the simulation engine (world seeding, tasks assignment and sweeping). The
+    engine is elected once per process, second election in the same process always loses, so the engine is never
+    booted twice in one process.
+    :param role: server role - 'all' to run the engine in one of the processes elected with the lock file,
+    'engine' to always run it, 'api' to never run it
+    :type role: str
+    :param lock_path: lock file path shared by the server processes
+    :type lock_path: str
+    :return: True if this process runs the engine
+    :rtype: bool
+    """
+
+    global _engine_lock_file, _run_engine
+
+    # Raise value error if role is unknown
+    if role not in ('all', 'engine', 'api'):
+        raise ValueError(f'Unknown server role {role}!')
+
+    if _run_engine is not None:
+        return False
+
+    if role != 'all':
+        _run_engine = role == 'engine'
+        return _run_engine
+
+    lock_file = open(lock_path, 'a')
+
+    # Only one process gets exclusive lock
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        _run_engine = False
+        return False
+
+    _engine_lock_file = lock_file
+    _run_engine = True
+
+    return True
+
+
+class EngineCommands:
+
+    """
+    Class for players control commands sent by api processes to the engine process through MongoDB collection.
+    """
+
+    def __init__(self, db_collection, interval):
+
+        """
+        Instance initialization.
+        :param db_collection: MongoDB commands collection
+        :param interval: delay between commands polls in seconds
+        :type interval: float
+        """
+
+        self.db_collection = db_collection
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def send(self, player_id, control):
+
+        """
+        Send player's control command to the engine process.
+        :param player_id: player's id
+        :param control: control trigger - 0 to stop all current tasks, 1 to start new tasks
+        :type control: int
+        :return: None
+        """
+
+        self.db_collection.insert_one({'player_id': player_id, 'control': control,
+                                       'created_at': datetime.datetime.utcnow()})
+
+    def poll(self, apply_command):
+
+        """
+        Apply all sent commands in order and delete them.
+        :param apply_command: function to apply command with player's id and control trigger
+        :return: number of applied commands
+        :rtype: int
+        """
+
+        commands = list(self.db_collection.find().sort('_id'))
+
+        for command in commands:
+            apply_command(command['player_id'], command['control'])
+
+        if commands:
+            self.db_collection.delete_many({'_id': {'$in': [command['_id'] for command in commands]}})
+
+        return len(commands)
+
+    def run(self, apply_command):
+
+        """
+        Poll commands every interval till polling is stopped.
+        :param apply_command: function to apply command with player's id and control trigger
+        :return: None
+        """
+
+        while not self._stop_event.wait(self.interval):
+
+            try:
+                self.poll(apply_command)
+            except PyMongoError:
+                self.logger.exception('Failed to poll engine commands')
+
+    def start(self, apply_command):
+
+        """
+        Start polling commands in new Thread.
+        :param apply_command: function to apply command with player's id and control trigger
+        :return: None
+        """
+
+        self._thread = threading.Thread(target=self.run, args=(apply_command,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+
+        """
+        Stop polling commands.
+        :return: None
+        """
+
+        self._stop_event.set()
+
+        if self._thread is not None:
+            self._thread.join()
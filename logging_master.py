@@ -3,23 +3,232 @@ Module for logs handling.
 """
 
 
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
 import time
 
 
-def init_logger(logger_name):
+class BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+
+    """
+    Class for rotating by size log file handler which writes batch of records with one flush.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+
+        """
+        Instance initialization. Log file is opened in append mode, so records of other processes and of the previous
+        run are kept.
+        :param filename: log file name
+        :type filename: str
+        :param max_bytes: log file size to rotate at, 0 to never rotate
+        :type max_bytes: int
+        :param backup_count: number of rotated log files to keep
+        :type backup_count: int
+        """
+
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count)
+
+    def emit_batch(self, records):
+
+        """
+        Write records to the log file and flush it once.
+        :param records: log records
+        :type records: list
+        :return: None
+        """
+
+        self.acquire()
+
+        try:
+
+            for record in records:
+
+                if self.shouldRollover(record):
+                    self.doRollover()
+
+                self.stream.write(self.format(record) + self.terminator)
+
+            self.flush()
+
+        except Exception:
+            self.handleError(records[-1])
+
+        finally:
+            self.release()
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+
+    """
+    Class for queue handler which leaves record formatting to the writer thread.
+    """
+
+    def prepare(self, record):
+
+        """
+        Prepare record for queuing without formatting it.
+        :param record: log record
+        :return: log record
+        """
+
+        return record
+
+
+# Background writers of queued log records started by this process
+_log_writers = []
+
+
+class QueueLogWriter:
+
+    """
+    Class for background writer of queued log records. Records are taken from the queue in batches.
+    """
+
+    def __init__(self, records_queue, handler, batch_size):
+
+        """
+        Instance initialization.
+        :param records_queue: queue of log records
+        :param handler: handler to write batches of records with
+        :type handler: BatchRotatingFileHandler
+        :param batch_size: max number of records in one batch
+        :type batch_size: int
+        """
+
+        self.queue = records_queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+        # Write everything left on interpreter exit
+        _log_writers.append(self)
+        atexit.register(self.stop)
+
+    def run(self):
+
+        """
+        Write batches of records till None is taken from the queue.
+        :return: None
+        """
+
+        while True:
+
+            records = [self.queue.get()]
+
+            # Take all available records up to the batch size without waiting
+            while len(records) < self.batch_size:
+
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = records[-1] is None
+            records = [record for record in records if record is not None]
+
+            if records:
+                self.handler.emit_batch(records)
+
+            if stop:
+                return
+
+    def stop(self):
+
+        """
+        Stop writer thread after writing all queued records.
+        :return: None
+        """
+
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+
+
+def stop_log_writers():
+
+    """
+    Stop all background log writers after writing their queued records, for processes leaving without atexit calls.
+    :return: None
+    """
+
+    for writer in _log_writers:
+        writer.stop()
+
+
+class LazyLogNote:
+
+    """
+    Class for log note which is made only when log record is written.
+    """
+
+    __slots__ = ('make_log_note', 'args', 'kwargs')
+
+    def __init__(self, make_log_note, *args, **kwargs):
+
+        """
+        Instance initialization.
+        :param make_log_note: function to make log note
+        :param args: function arguments
+        :param kwargs: function keyword arguments
+        """
+
+        self.make_log_note = make_log_note
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+
+        """
+        Make log note.
+        :return: log note
+        :rtype: str
+        """
+
+        return self.make_log_note(*self.args, **self.kwargs)
+
+
+def init_logger(logger_name, queued=False, batch_size=500, max_bytes=0, backup_count=0):
 
     """
     Logger initialization.
     :param logger_name: logger name
     :type logger_name: str
+    :param queued: write records to the log file from background thread in batches
+    :type queued: bool
+    :param batch_size: max number of records written at once in queued mode
+    :type batch_size: int
+    :param max_bytes: log file size to rotate at in queued mode, 0 to never rotate
+    :type max_bytes: int
+    :param backup_count: number of rotated log files to keep in queued mode
+    :type backup_count: int
     :return: logger
     """
 
     # Create new logger
     logger = logging.getLogger(logger_name)
+
+    # Return logger as it is if it has been already initialized
+    if logger.handlers:
+        return logger
+
     # Set logging level
     logger.setLevel(logging.INFO)
+
+    if queued:
+
+        # Create queue handler and background writer for it
+        records_queue = queue.SimpleQueue()
+        file_handler = BatchRotatingFileHandler(f'{logger_name}.log', max_bytes, backup_count)
+        QueueLogWriter(records_queue, file_handler, batch_size)
+        logger.addHandler(LazyQueueHandler(records_queue))
+
+        return logger
+
     # Create new file handler
     file_handler = logging.FileHandler(f'{logger_name}.log', mode='w')
     # Add handler to logger
@@ -28,23 +237,28 @@ def init_logger(logger_name):
     return logger
 
 
-def make_player_log_note(player):
+def make_player_log_note(player, now=None):
 
     """
     Make log note from player's dict.
     :param player: player's dict
     :type player: dict
+    :param now: time to count tasks time left from (Unix timestamp), current time by default
+    :type now: float
     :return: log note
     :rtype: str
     """
 
+    if now is None:
+        now = time.time()
+
     tasks = []
 
     for key, value in player.items():
 
         if 'Task' in key:
 
-            time_left = time.strftime('%Mm:%Ss',  time.gmtime(value - time.time()))
+            time_left = time.strftime('%Mm:%Ss',  time.gmtime(value - now))
             tasks.append(f'{key}, timeLeft {time_left};')
 
     tasks = ' '.join(tasks)
@@ -54,7 +268,7 @@ def make_player_log_note(player):
     return log_note
 
 
-def make_task_log_note(player, task_id, task_status, duration=''):
+def make_task_log_note(player, task_id, task_status, duration='', log_time=None):
 
     """
     Make task log note.
@@ -66,6 +280,8 @@ def make_task_log_note(player, task_id, task_status, duration=''):
     :type task_status: int
     :param duration: task duration in seconds
     :type duration: int
+    :param log_time: time of the task event (Unix timestamp), current time by default
+    :type log_time: float
     :return: log note
     :rtype: str
     """
@@ -75,7 +291,10 @@ def make_task_log_note(player, task_id, task_status, duration=''):
     else:
         status = 'finished'
 
-    log_time = time.strftime('%H:%M:%S',  time.gmtime(time.time()))
+    if log_time is None:
+        log_time = time.time()
+
+    log_time = time.strftime('%H:%M:%S',  time.gmtime(log_time))
     log_note = f'{log_time} Player[{player["x"]},{player["y"]}] {task_id} {status}'
 
     if duration:
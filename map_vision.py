@@ -4,75 +4,214 @@ Module for working with visible area on the map.
 
 
 import time
+import itertools
+import logging
 import threading
 import app
 import logging_master
+import metrics
 
 
-class MapVision:
+class AreaLoggingEngine:
 
     """
-    Class for working with visible area on the map.
+    Class for logging of several visible areas. One thread serves all the areas, players of all the areas which
+    should be logged at the moment are taken with one query and every player is logged once even if areas overlap.
     """
 
-    # Logging trigger attribute
-    _logging_thread = False
+    def __init__(self):
+
+        """
+        Instance initialization.
+        """
+
+        self.logger = None
+        self.errors_logger = logging.getLogger(__name__)
+        self.db_collection = None
+        # Area id to area coordinates, logging interval and next logging time mapping
+        self._areas = {}
+        self._area_ids = itertools.count(1)
+        # Lock for areas changes
+        self._lock = threading.Lock()
+        # Event to wake up logging thread when areas are changed
+        self._wake_event = threading.Event()
+        self._thread = None
 
-    def visible_area_logging(self, area, db_collection):
+    def start_area(self, area, db_collection, interval):
 
         """
-        Visible area logging.
+        Start area logging.
         :param area: area coordinates
         :type area: tuple
         :param db_collection: MongoDB players collection
+        :param interval: delay between area log notes in seconds
+        :type interval: float
+        :return: area id
+        :rtype: int
+        """
+
+        with self._lock:
+
+            # Initiate logger once for all the areas
+            if self.logger is None:
+                self.logger = logging_master.init_logger('visible_area', app.app.config['ASYNC_LOGGING'],
+                                                         app.app.config['LOG_BATCH_SIZE'],
+                                                         app.app.config['LOG_MAX_BYTES'],
+                                                         app.app.config['LOG_BACKUP_COUNT'])
+
+            area_id = next(self._area_ids)
+            self._areas[area_id] = {'area': area, 'interval': interval, 'next_time': time.time()}
+            self.db_collection = db_collection
+
+            # Start logging thread if it is not running
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, daemon=True)
+                self._thread.start()
+
+        self._wake_event.set()
+
+        return area_id
+
+    def stop_area(self, area_id=None):
+
+        """
+        Stop area logging.
+        :param area_id: area id, all areas are stopped if it is not specified
+        :type area_id: int
+        :return: number of stopped areas
+        :rtype: int
+        """
+
+        with self._lock:
+
+            if area_id is None:
+                stopped = len(self._areas)
+                self._areas.clear()
+            else:
+                stopped = int(self._areas.pop(area_id, None) is not None)
+
+        self._wake_event.set()
+
+        return stopped
+
+    def get_areas(self):
+
+        """
+        Get logged areas.
+        :return: area id to area coordinates and logging interval mapping
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {area_id: {'area': entry['area'], 'interval': entry['interval']}
+                    for area_id, entry in self._areas.items()}
+
+    def log_areas(self, areas, db_collection):
+
+        """
+        Log all players within areas.
+        :param areas: area id to area coordinates mapping
+        :type areas: dict
+        :param db_collection: MongoDB players collection
+        :return: None
+        """
+
+        # Get all players within areas with one query
+        area_players = MapVision.get_areas_players(list(areas.values()), db_collection)
+
+        now = time.time()
+
+        # Add one log note for each player with ids of areas player is within, note is made only when it is written
+        for player in area_players:
+
+            area_ids = [area_id for area_id, area in areas.items()
+                        if area[0] <= player['x'] <= area[1] and area[2] <= player['y'] <= area[3]]
+
+            self.logger.info('Area%s %s', area_ids, logging_master.LazyLogNote(logging_master.make_player_log_note,
+                                                                              player, now))
+
+    def run(self):
+
+        """
+        Log areas which logging time has come till all areas are stopped.
         :return: None
         """
 
-        # Initiate new logger
-        logger = logging_master.init_logger('visible_area')
+        while True:
+
+            with self._lock:
 
-        # Continue logging while logging trigger attribute is True
-        while MapVision._logging_thread:
+                # Stop thread if there is nothing to log
+                if not self._areas:
+                    self._thread = None
+                    return
 
-            # Get MongoDB collection cursor for all players within visible area
-            area_players = self.get_area_players(area, db_collection)
+                now = time.time()
+                due_areas = {}
 
-            # Add log note for each player within visible area
-            for player in area_players:
+                for area_id, entry in self._areas.items():
 
-                log_note = logging_master.make_player_log_note(player)
-                logger.info(log_note)
+                    if entry['next_time'] <= now:
+                        due_areas[area_id] = entry['area']
+                        entry['next_time'] = now + entry['interval']
 
-            # Delay between log notes
-            time.sleep(app.app.config['DEFAULT_LOGGING_DELAY'])
+                next_time = min(entry['next_time'] for entry in self._areas.values())
+                db_collection = self.db_collection
 
-    def start_visible_area_logging(self, area, db_collection):
+            # Keep logging thread alive on failed logging, otherwise areas are never logged again
+            try:
+
+                if due_areas:
+                    self.log_areas(due_areas, db_collection)
+
+            except Exception:
+                self.errors_logger.exception('Failed to log visible areas')
+
+            # Delay till the next area logging or areas change
+            self._wake_event.wait(max(next_time - time.time(), 0))
+            self._wake_event.clear()
+
+
+class MapVision:
+
+    """
+    Class for working with visible area on the map.
+    """
+
+    # Engine for visible areas logging
+    _logging_engine = AreaLoggingEngine()
+
+    @staticmethod
+    def start_visible_area_logging(area, db_collection, interval=None):
 
         """
-        Start visible area logging in new Thread.
+        Start visible area logging.
         :param area: area coordinates
         :type area: tuple
         :param db_collection: MongoDB players collection
-        :return: None
+        :param interval: delay between log notes in seconds, config.DEFAULT_LOGGING_DELAY by default
+        :type interval: float
+        :return: area id
+        :rtype: int
         """
 
-        # Set logging trigger attribute to True
-        MapVision._logging_thread = True
+        if interval is None:
+            interval = app.app.config['DEFAULT_LOGGING_DELAY']
 
-        # Start visible area logging in new Thread
-        thread = threading.Thread(target=self.visible_area_logging, args=(area, db_collection))
-        thread.start()
+        return MapVision._logging_engine.start_area(area, db_collection, interval)
 
     @staticmethod
-    def stop_area_players_logging():
+    def stop_area_players_logging(area_id=None):
 
         """
         Stop visible area logging.
-        :return: None
+        :param area_id: area id, all areas are stopped if it is not specified
+        :type area_id: int
+        :return: number of stopped areas
+        :rtype: int
         """
 
-        # Set logging trigger attribute to False
-        MapVision._logging_thread = False
+        return MapVision._logging_engine.stop_area(area_id)
 
     @staticmethod
     def calculate_visible_area_coordinates(center_x, center_y, width, height):
@@ -107,17 +246,82 @@ class MapVision:
         return area_coordinates
 
     @staticmethod
-    def get_area_players(area, db_collection):
+    def get_area_players(area, db_collection, exclude_id=None, projection=None, limit=0):
 
         """
-        Get MongoDB collection cursor for all players within visible area.
+        Get all players within visible area. Players are taken from in-memory spatial index if it is loaded and from
+        MongoDB collection on a cold start.
         :param area: area coordinates
         :type area: tuple
         :param db_collection: MongoDB collection
-        :return: cursor for all players within visible area
+        :param exclude_id: id of the player to skip
+        :type exclude_id: bson.ObjectId
+        :param projection: fields to return as in MongoDB projection, all fields if it is None
+        :type projection: dict
+        :param limit: max number of players, 0 for all players
+        :type limit: int
+        :return: list of all players within visible area
+        """
+
+        # Use in-memory spatial index if it is already loaded
+        if app.spatial_index.is_loaded:
+
+            with metrics.area_query_seconds.time('index'):
+                index_players = app.spatial_index.get_area_players(area)
+
+            area_players = []
+
+            for player in index_players:
+
+                if player['_id'] == exclude_id:
+                    continue
+
+                if projection is not None:
+                    player = {field: value for field, value in player.items() if field == '_id' or field in projection}
+
+                area_players.append(player)
+
+                if len(area_players) == limit:
+                    break
+
+            return area_players
+
+        players_filter = {'x': {'$gte': area[0], '$lte': area[1]}, 'y': {'$gte': area[2], '$lte': area[3]}}
+
+        # Skip the player on MongoDB side
+        if exclude_id is not None:
+            players_filter['_id'] = {'$ne': exclude_id}
+
+        # Read players from MongoDB within the timer
+        with metrics.area_query_seconds.time('mongo'):
+            area_players = list(db_collection.find(players_filter, projection, limit=limit))
+
+        return area_players
+
+    @staticmethod
+    def get_areas_players(areas, db_collection):
+
+        """
+        Get all players within several areas, players within overlapping areas are returned once.
+        :param areas: list of areas coordinates
+        :type areas: list
+        :param db_collection: MongoDB collection
+        :return: list or cursor for all players within areas
         """
 
-        area_players = db_collection.find({'x': {'$gte': area[0], '$lte': area[1]},
-                                           'y': {'$gte': area[2], '$lte': area[3]}})
+        # Use in-memory spatial index if it is already loaded
+        if app.spatial_index.is_loaded:
+
+            area_players = {}
+
+            for area in areas:
+
+                for player in app.spatial_index.get_area_players(area):
+                    area_players[player['_id']] = player
+
+            return list(area_players.values())
+
+        area_players = db_collection.find({'$or': [{'x': {'$gte': area[0], '$lte': area[1]},
+                                                    'y': {'$gte': area[2], '$lte': area[3]}} for area in areas]})
 
         return area_players
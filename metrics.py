@@ -0,0 +1,431 @@
+"""
+Module for server metrics: counters, gauges and histograms rendered in Prometheus text format.
+"""
+
+
+import bisect
+import functools
+import threading
+import time
+from flask import request
+
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(label_names, label_values, extra=None):
+
+    """
+    Format labels as in Prometheus text format.
+    :param label_names: labels names
+    :type label_names: tuple
+    :param label_values: labels values
+    :type label_values: tuple
+    :param extra: additional label name and value
+    :type extra: tuple
+    :return: formatted labels or empty string if there are no labels
+    :rtype: str
+    """
+
+    pairs = list(zip(label_names, label_values))
+
+    if extra is not None:
+        pairs.append(extra)
+
+    if not pairs:
+        return ''
+
+    labels = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                      for name, value in pairs)
+
+    return '{' + labels + '}'
+
+
+def format_value(value):
+
+    """
+    Format sample value as in Prometheus text format.
+    :param value: sample value
+    :type value: float
+    :return: formatted value
+    :rtype: str
+    """
+
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+
+    """
+    Base class for metrics with values per labels values.
+    """
+
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, label_names=()):
+
+        """
+        Instance initialization.
+        :param name: metric name
+        :type name: str
+        :param documentation: metric description
+        :type documentation: str
+        :param label_names: labels names
+        :type label_names: tuple
+        """
+
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        # Labels values to metric value mapping
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_samples(self):
+
+        """
+        Get metric samples.
+        :return: list of (name suffix, labels, value) tuples
+        :rtype: list
+        """
+
+        with self._lock:
+
+            return [('', format_labels(self.label_names, label_values), value)
+                    for label_values, value in sorted(self._values.items())]
+
+    def render(self):
+
+        """
+        Render metric in Prometheus text format.
+        :return: metric lines
+        :rtype: list
+        """
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+
+        for suffix, labels, value in self.get_samples():
+            lines.append(f'{self.name}{suffix}{labels} {format_value(value)}')
+
+        return lines
+
+
+class Counter(Metric):
+
+    """
+    Class for monotonically increasing counter.
+    """
+
+    type_name = 'counter'
+
+    def inc(self, *label_values, amount=1):
+
+        """
+        Increase counter.
+        :param label_values: labels values
+        :param amount: amount to add
+        :type amount: float
+        :return: None
+        """
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+
+    """
+    Class for value which goes up and down. Value can be taken from function when metrics are rendered.
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, label_names=()):
+
+        """
+        Instance initialization.
+        :param name: metric name
+        :type name: str
+        :param documentation: metric description
+        :type documentation: str
+        :param label_names: labels names
+        :type label_names: tuple
+        """
+
+        super().__init__(name, documentation, label_names)
+        self._function = None
+
+    def set(self, value, *label_values):
+
+        """
+        Set gauge value.
+        :param value: new value
+        :type value: float
+        :param label_values: labels values
+        :return: None
+        """
+
+        with self._lock:
+            self._values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+
+        """
+        Increase gauge value.
+        :param label_values: labels values
+        :param amount: amount to add, negative to decrease
+        :type amount: float
+        :return: None
+        """
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set_function(self, function):
+
+        """
+        Take gauge value from function when metrics are rendered.
+        :param function: function without arguments returning value
+        :return: None
+        """
+
+        self._function = function
+
+    def get_samples(self):
+
+        """
+        Get metric samples.
+        :return: list of (name suffix, labels, value) tuples
+        :rtype: list
+        """
+
+        if self._function is not None:
+            return [('', '', self._function())]
+
+        return super().get_samples()
+
+
+class Histogram(Metric):
+
+    """
+    Class for distribution of observed values over buckets.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+
+        """
+        Instance initialization.
+        :param name: metric name
+        :type name: str
+        :param documentation: metric description
+        :type documentation: str
+        :param label_names: labels names
+        :type label_names: tuple
+        :param buckets: sorted upper bounds of buckets
+        :type buckets: tuple
+        """
+
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value, *label_values):
+
+        """
+        Observe value.
+        :param value: observed value
+        :type value: float
+        :param label_values: labels values
+        :return: None
+        """
+
+        bucket = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+
+            # Buckets counts (not cumulative), sum and count
+            values = self._values.get(label_values)
+
+            if values is None:
+                values = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+
+            values[0][bucket] += 1
+            values[1] += value
+            values[2] += 1
+
+    def time(self, *label_values):
+
+        """
+        Make context manager observing time spent within it.
+        :param label_values: labels values
+        :return: context manager
+        :rtype: Timer
+        """
+
+        return Timer(self, label_values)
+
+    def get_samples(self):
+
+        """
+        Get metric samples.
+        :return: list of (name suffix, labels, value) tuples
+        :rtype: list
+        """
+
+        samples = []
+
+        with self._lock:
+
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+
+                cumulative = 0
+
+                for upper_bound, bucket_count in zip(self.buckets, counts):
+
+                    cumulative += bucket_count
+                    labels = format_labels(self.label_names, label_values, ('le', format_value(upper_bound)))
+                    samples.append(('_bucket', labels, cumulative))
+
+                labels = format_labels(self.label_names, label_values)
+                samples.append(('_sum', labels, total))
+                samples.append(('_count', labels, count))
+
+        return samples
+
+
+class Timer:
+
+    """
+    Class for context manager observing time spent within it in histogram.
+    """
+
+    __slots__ = ('histogram', 'label_values', 'start_time')
+
+    def __init__(self, histogram, label_values):
+
+        """
+        Instance initialization.
+        :param histogram: histogram to observe time in
+        :type histogram: Histogram
+        :param label_values: labels values
+        :type label_values: tuple
+        """
+
+        self.histogram = histogram
+        self.label_values = label_values
+        self.start_time = None
+
+    def __enter__(self):
+
+        """
+        Start timer.
+        :return: timer
+        :rtype: Timer
+        """
+
+        self.start_time = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        """
+        Observe spent time.
+        :return: None
+        """
+
+        self.histogram.observe(time.perf_counter() - self.start_time, *self.label_values)
+
+
+class MetricsRegistry:
+
+    """
+    Class for collection of metrics rendered together.
+    """
+
+    def __init__(self):
+
+        """
+        Instance initialization.
+        """
+
+        self._metrics = []
+
+    def register(self, metric):
+
+        """
+        Add metric to the registry.
+        :param metric: metric
+        :type metric: Metric
+        :return: metric
+        :rtype: Metric
+        """
+
+        self._metrics.append(metric)
+
+        return metric
+
+    def render(self):
+
+        """
+        Render all metrics in Prometheus text format.
+        :return: metrics text
+        :rtype: str
+        """
+
+        lines = []
+
+        for metric in self._metrics:
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+# Server metrics
+registry = MetricsRegistry()
+
+requests_total = registry.register(Counter('game_api_requests_total', 'Api requests number.', ('endpoint', 'code')))
+request_seconds = registry.register(Histogram('game_api_request_seconds', 'Api requests latency.', ('endpoint',)))
+area_query_seconds = registry.register(Histogram('game_area_query_seconds', 'Visible area players queries latency.',
+                                                 ('source',)))
+mongo_seconds = registry.register(Histogram('game_mongo_seconds', 'MongoDB calls latency.', ('operation',)))
+tasks_total = registry.register(Counter('game_tasks_total', 'Started and finished tasks number.', ('status',)))
+live_tasks = registry.register(Gauge('game_live_tasks', 'Number of running task coroutines.'))
+scheduled_tasks = registry.register(Gauge('game_scheduled_tasks', 'Number of tasks waiting in the scheduler.'))
+paused_players = registry.register(Gauge('game_paused_players', 'Number of paused players.'))
+event_loop_lag = registry.register(Gauge('game_event_loop_lag_seconds', 'Delay of the last tasks event loop probe.'))
+task_start_rate = registry.register(Gauge('game_task_start_rate', 'Achieved tasks starts per second.'))
+player_cache_hit_rate = registry.register(Gauge('game_player_cache_hit_rate', 'Share of cached players lookups.'))
+
+
+def observe_resource(view):
+
+    """
+    Decorator for api views counting requests and observing their latency by endpoint.
+    :param view: view function
+    :return: decorated view function
+    """
+
+    @functools.wraps(view)
+    def observed_view(*args, **kwargs):
+
+        """
+        Call view and observe it.
+        :return: view response
+        """
+
+        start_time = time.perf_counter()
+        response = view(*args, **kwargs)
+        endpoint = request.endpoint or 'unknown'
+
+        request_seconds.observe(time.perf_counter() - start_time, endpoint)
+        requests_total.inc(endpoint, getattr(response, 'status_code', 200))
+
+        return response
+
+    return observed_view
@@ -0,0 +1,125 @@
+"""
+Module for thread-safe registry of paused players.
+"""
+
+
+import asyncio
+import threading
+
+
+class PauseRegistry:
+
+    """
+    Class to keep paused players ids. Players are paused and resumed from Flask threads while asyncio loop
+    coroutines wait for the resume of their player, waiting coroutines are woken up directly through the loop.
+    """
+
+    def __init__(self):
+
+        """
+        Instance initialization.
+        """
+
+        self.loop = None
+        # Paused players ids
+        self._paused = set()
+        # Player's id to asyncio event of coroutine waiting for the resume mapping
+        self._events = {}
+        # Lock for paused players ids changes
+        self._lock = threading.Lock()
+
+    def __len__(self):
+
+        """
+        Number of paused players.
+        :return: number of paused players
+        :rtype: int
+        """
+
+        return len(self._paused)
+
+    def __contains__(self, player_id):
+
+        """
+        Check if player is paused.
+        :param player_id: player's id
+        :return: True if player is paused
+        :rtype: bool
+        """
+
+        return player_id in self._paused
+
+    def bind_loop(self, loop):
+
+        """
+        Bind asyncio loop which coroutines wait for players resume.
+        :param loop: asyncio event loop
+        :return: None
+        """
+
+        self.loop = loop
+
+    def pause(self, player_id):
+
+        """
+        Pause player.
+        :param player_id: player's id
+        :return: True if player was not paused before
+        :rtype: bool
+        """
+
+        with self._lock:
+
+            if player_id in self._paused:
+                return False
+
+            self._paused.add(player_id)
+
+            return True
+
+    def resume(self, player_id):
+
+        """
+        Resume player and wake up coroutine waiting for it.
+        :param player_id: player's id
+        :return: True if player was paused before
+        :rtype: bool
+        """
+
+        with self._lock:
+
+            if player_id not in self._paused:
+                return False
+
+            self._paused.discard(player_id)
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake, player_id)
+
+        return True
+
+    def _wake(self, player_id):
+
+        """
+        Wake up coroutine waiting for the player's resume. Called in asyncio loop thread.
+        :param player_id: player's id
+        :return: None
+        """
+
+        event = self._events.pop(player_id, None)
+
+        if event is not None:
+            event.set()
+
+    async def wait_resumed(self, player_id):
+
+        """
+        Async function to wait till the player is resumed.
+        :param player_id: player's id
+        :return: None
+        """
+
+        while player_id in self._paused:
+
+            event = self._events.setdefault(player_id, asyncio.Event())
+            await event.wait()
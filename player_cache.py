@@ -0,0 +1,181 @@
+"""
+Module for cache of players MongoDB documents looked up by str ids.
+"""
+
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PlayerCache:
+
+    """
+    Class for TTL and LRU cache of players documents by str ids as they come in requests, so cached ids are not
+    parsed. Unknown and invalid ids are cached too with a shorter time to live. Player's entry is dropped when its
+    tasks are changed, lookups which started before the drop are not cached. Processes which are not notified about
+    tasks changes cache only players fields which are never changed.
+    """
+
+    def __init__(self, max_size, ttl, negative_ttl, fields=None):
+
+        """
+        Instance initialization.
+        :param max_size: max number of cached ids
+        :type max_size: int
+        :param ttl: time to live of found players in seconds
+        :type ttl: float
+        :param negative_ttl: time to live of unknown and invalid ids in seconds
+        :type negative_ttl: float
+        :param fields: players fields to cache, whole players documents if it is None
+        :type fields: tuple
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.fields = fields
+
+        # Str id to (expiration time, player's dict or None) mapping in LRU order
+        self._entries = OrderedDict()
+        # Str id to number of player's drops mapping, lookups are cached only if player was not dropped meanwhile
+        self._versions = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+
+        """
+        Number of cached ids.
+        :return: number of cached ids
+        :rtype: int
+        """
+
+        return len(self._entries)
+
+    def get(self, player_id):
+
+        """
+        Get cached player.
+        :param player_id: str player's id from request
+        :type player_id: str
+        :return: True and player's dict copy (None for unknown or invalid id) if id is cached, False and None otherwise
+        :rtype: tuple
+        """
+
+        now = time.monotonic()
+
+        with self._lock:
+
+            entry = self._entries.get(player_id)
+
+            if entry is None or entry[0] <= now:
+
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(player_id)
+
+            if entry[1] is None:
+                self.negative_hits += 1
+                return True, None
+
+            self.hits += 1
+
+            return True, dict(entry[1])
+
+    def get_version(self, player_id):
+
+        """
+        Get player's version to read before the player is looked up.
+        :param player_id: str player's id from request
+        :type player_id: str
+        :return: player's version
+        :rtype: int
+        """
+
+        with self._lock:
+            return self._versions.get(player_id, 0)
+
+    def put(self, player_id, player, version=None):
+
+        """
+        Cache player or unknown id.
+        :param player_id: str player's id from request
+        :type player_id: str
+        :param player: player's dict or None if player does not exist
+        :type player: dict
+        :param version: player's version read before the lookup, player is not cached if it was dropped after that
+        :type version: int
+        :return: None
+        """
+
+        # Players are invalidated by canonical str ids, so ids written in other ways are not cached
+        if player is not None and player_id != str(player['_id']):
+            return
+
+        ttl = self.ttl if player is not None else self.negative_ttl
+
+        if player is not None and self.fields is not None:
+            player = {field: player[field] for field in self.fields if field in player}
+        elif player is not None:
+            player = dict(player)
+
+        with self._lock:
+
+            # Skip the lookup which lost the race with player's drop
+            if version is not None and self._versions.get(player_id, 0) != version:
+                return
+
+            self._entries[player_id] = (time.monotonic() + ttl, player)
+            self._entries.move_to_end(player_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, player_id):
+
+        """
+        Drop cached player.
+        :param player_id: player's id
+        :return: None
+        """
+
+        player_id = str(player_id)
+
+        with self._lock:
+
+            self._entries.pop(player_id, None)
+            self._versions[player_id] = self._versions.get(player_id, 0) + 1
+
+    def get_hit_rate(self):
+
+        """
+        Get share of lookups served from the cache.
+        :return: hit rate from 0 to 1
+        :rtype: float
+        """
+
+        lookups = self.hits + self.negative_hits + self.misses
+
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+    def get_stats(self):
+
+        """
+        Get cache hits and misses counters and size.
+        :return: cache stats
+        :rtype: dict
+        """
+
+        with self._lock:
+
+            return {'hits': self.hits,
+                    'negative_hits': self.negative_hits,
+                    'misses': self.misses,
+                    'hit_rate': round(self.get_hit_rate(), 4),
+                    'entries': len(self._entries),
+                    'max_size': self.max_size}
@@ -0,0 +1,229 @@
+"""
+Module for columnar in-memory players table based on numpy arrays.
+"""
+
+
+import threading
+import time
+import numpy as np
+
+
+class PlayerTable:
+
+    """
+    Class for columnar players table. Players coordinates are kept in two arrays and tasks end times in a matrix
+    with one column per task, so region and tasks queries are made with single numpy operations.
+    """
+
+    def __init__(self, max_tasks):
+
+        """
+        Instance initialization.
+        :param max_tasks: max number of player's tasks
+        :type max_tasks: int
+        """
+
+        self.max_tasks = max_tasks
+        # Row to player's id mapping
+        self.ids = []
+        # Player's id to row mapping
+        self.rows = {}
+        self.xs = np.zeros(0, dtype=np.int32)
+        self.ys = np.zeros(0, dtype=np.int32)
+        # Tasks end times, NaN for inactive tasks
+        self.end_times = np.full((0, max_tasks), np.nan)
+        # Lock to synchronize asyncio loop thread writes with Flask threads reads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+
+        """
+        Number of players in the table.
+        :return: number of players
+        :rtype: int
+        """
+
+        return len(self.ids)
+
+    def load_world(self, world, ids):
+
+        """
+        Replace table content with players of the world generated by WorldCreator, coordinates are taken from the
+        map arrays without players dicts.
+        :param world: map with randomly distributed players as 2D array
+        :type world: np.ndarray
+        :param ids: players ids in order of players on the map (as they are saved by WorldCreator.save_world)
+        :type ids: list
+        :return: None
+        """
+
+        xs, ys = np.where(world)
+
+        with self._lock:
+
+            self.ids = list(ids)
+            self.rows = {player_id: row for row, player_id in enumerate(self.ids)}
+            self.xs = xs.astype(np.int32)
+            self.ys = ys.astype(np.int32)
+            self.end_times = np.full((len(self.ids), self.max_tasks), np.nan)
+
+    def get_task_column(self, task_id):
+
+        """
+        Get tasks matrix column for task id like 'Task 1'.
+        :param task_id: task id
+        :type task_id: str
+        :return: column number or None if task id has another format or exceeds max number of tasks
+        :rtype: int
+        """
+
+        try:
+            column = int(task_id.rsplit(' ', 1)[-1]) - 1
+        except ValueError:
+            return None
+
+        return column if 0 <= column < self.max_tasks else None
+
+    def load(self, players):
+
+        """
+        Replace table content with players.
+        :param players: players dicts
+        :type players: iterable
+        :return: None
+        """
+
+        players = list(players)
+
+        with self._lock:
+
+            self.ids = [player['_id'] for player in players]
+            self.rows = {player_id: row for row, player_id in enumerate(self.ids)}
+            self.xs = np.array([player['x'] for player in players], dtype=np.int32)
+            self.ys = np.array([player['y'] for player in players], dtype=np.int32)
+            self.end_times = np.full((len(players), self.max_tasks), np.nan)
+
+            for row, player in enumerate(players):
+
+                for key, value in player.items():
+
+                    column = self.get_task_column(key) if key.startswith('Task') else None
+
+                    if column is not None:
+                        self.end_times[row, column] = value
+
+    def add_player(self, player_id, x, y):
+
+        """
+        Add player or move existed one.
+        :param player_id: player's id
+        :param x: x coordinate
+        :type x: int
+        :param y: y coordinate
+        :type y: int
+        :return: None
+        """
+
+        with self._lock:
+
+            row = self.rows.get(player_id)
+
+            if row is None:
+                row = len(self.ids)
+                self.ids.append(player_id)
+                self.rows[player_id] = row
+                self.xs = np.append(self.xs, np.int32(x))
+                self.ys = np.append(self.ys, np.int32(y))
+                self.end_times = np.vstack((self.end_times, np.full((1, self.max_tasks), np.nan)))
+            else:
+                self.xs[row] = x
+                self.ys[row] = y
+
+    def set_task(self, player_id, task_id, end_time):
+
+        """
+        Set player's task end time.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp), None to unset the task
+        :type end_time: float
+        :return: None
+        """
+
+        row = self.rows.get(player_id)
+        column = self.get_task_column(task_id)
+
+        if row is None or column is None:
+            return
+
+        with self._lock:
+            self.end_times[row, column] = np.nan if end_time is None else end_time
+
+    def get_area_mask(self, area):
+
+        """
+        Get mask of players within area.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: boolean mask of players rows
+        :rtype: np.ndarray
+        """
+
+        with self._lock:
+            return (self.xs >= area[0]) & (self.xs <= area[1]) & (self.ys >= area[2]) & (self.ys <= area[3])
+
+    def get_area_players_ids(self, area):
+
+        """
+        Get ids of all players within area.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: list of players ids
+        :rtype: list
+        """
+
+        return [self.ids[row] for row in np.flatnonzero(self.get_area_mask(area))]
+
+    def get_active_mask(self):
+
+        """
+        Get mask of active tasks.
+        :return: boolean matrix of active tasks
+        :rtype: np.ndarray
+        """
+
+        with self._lock:
+            return ~np.isnan(self.end_times)
+
+    def count_expiring_tasks(self, seconds, now=None):
+
+        """
+        Count tasks which end within the next seconds, already expired tasks which are not swept yet are skipped.
+        :param seconds: number of seconds from now
+        :type seconds: float
+        :param now: current time (Unix timestamp), time.time() by default
+        :type now: float
+        :return: number of tasks
+        :rtype: int
+        """
+
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+
+            # NaN comparison is False, so inactive tasks are skipped
+            return int(np.count_nonzero((self.end_times > now) & (self.end_times <= now + seconds)))
+
+    def get_active_tasks_histogram(self):
+
+        """
+        Get number of players for every number of active tasks.
+        :return: list where index is number of active tasks and value is number of players
+        :rtype: list
+        """
+
+        active_tasks = self.get_active_mask().sum(axis=1)
+
+        return np.bincount(active_tasks, minlength=self.max_tasks + 1).tolist()
@@ -0,0 +1,199 @@
+"""
+Module for api responses serialization with pluggable backends.
+"""
+
+
+import json
+import datetime
+import bson
+from flask import make_response
+
+# Optional faster json backend
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional compact binary backend
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def encode_default(value):
+
+    """
+    Encode values unknown to serialization backends. ObjectIds are converted while the whole response is encoded, so
+    resources do not need to convert players ids one by one. Datetimes are encoded as ISO 8601 strings like orjson
+    does, so all backends return the same.
+    :param value: value to encode
+    :return: encodable value
+    :rtype: str
+    """
+
+    if isinstance(value, bson.ObjectId):
+        return str(value)
+
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    raise TypeError(f'Object of type {type(value).__name__} is not serializable')
+
+
+class JsonSerializer:
+
+    """
+    Class for json serialization with standard library json module.
+    """
+
+    name = 'json'
+    mimetype = 'application/json'
+
+    @staticmethod
+    def dumps(data):
+
+        """
+        Encode data.
+        :param data: data to encode
+        :return: encoded data
+        :rtype: bytes
+        """
+
+        return json.dumps(data, default=encode_default).encode()
+
+
+class OrjsonSerializer:
+
+    """
+    Class for json serialization with orjson package.
+    """
+
+    name = 'orjson'
+    mimetype = 'application/json'
+
+    @staticmethod
+    def dumps(data):
+
+        """
+        Encode data.
+        :param data: data to encode
+        :return: encoded data
+        :rtype: bytes
+        """
+
+        return orjson.dumps(data, default=encode_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+class MsgpackSerializer:
+
+    """
+    Class for MessagePack serialization with msgpack package.
+    """
+
+    name = 'msgpack'
+    mimetype = 'application/x-msgpack'
+
+    @staticmethod
+    def dumps(data):
+
+        """
+        Encode data.
+        :param data: data to encode
+        :return: encoded data
+        :rtype: bytes
+        """
+
+        return msgpack.packb(data, default=encode_default)
+
+
+def get_available_serializers():
+
+    """
+    Get serializers which backends are installed.
+    :return: serializer name to serializer class mapping
+    :rtype: dict
+    """
+
+    serializers = {'json': JsonSerializer}
+
+    if orjson is not None:
+        serializers['orjson'] = OrjsonSerializer
+
+    if msgpack is not None:
+        serializers['msgpack'] = MsgpackSerializer
+
+    return serializers
+
+
+def make_json_serializer(backend='auto'):
+
+    """
+    Make json serializer for backend name.
+    :param backend: 'json', 'orjson' or 'auto' for the fastest installed backend
+    :type backend: str
+    :return: serializer class
+    """
+
+    serializers = get_available_serializers()
+
+    if backend == 'auto':
+        backend = 'orjson' if 'orjson' in serializers else 'json'
+
+    # Raise value error if backend is unknown or is not installed
+    if backend not in serializers or serializers[backend].mimetype != 'application/json':
+        raise ValueError(f'Json backend {backend} is not available!')
+
+    return serializers[backend]
+
+
+def make_representation(serializer):
+
+    """
+    Make flask-restful representation function for serializer.
+    :param serializer: serializer class
+    :return: function making response from data, code and headers
+    """
+
+    def output(data, code, headers=None):
+
+        """
+        Make response with serialized data.
+        :param data: data to encode
+        :param code: response status code
+        :type code: int
+        :param headers: response headers
+        :type headers: dict
+        :return: response
+        """
+
+        response = make_response(serializer.dumps(data), code)
+        response.headers.update(headers or {})
+        response.mimetype = serializer.mimetype
+
+        return response
+
+    return output
+
+
+def register_representations(api, json_backend='auto', binary_output=True):
+
+    """
+    Register serializers as api representations. Json is the default, MessagePack is returned for
+    'Accept: application/x-msgpack' requests if it is enabled and msgpack is installed.
+    :param api: flask-restful api
+    :type api: flask_restful.Api
+    :param json_backend: json backend name as in make_json_serializer
+    :type json_backend: str
+    :param binary_output: enable MessagePack output
+    :type binary_output: bool
+    :return: json serializer class
+    """
+
+    json_serializer = make_json_serializer(json_backend)
+    api.representations['application/json'] = make_representation(json_serializer)
+
+    if binary_output and msgpack is not None:
+        api.representations[MsgpackSerializer.mimetype] = make_representation(MsgpackSerializer)
+
+    return json_serializer
@@ -0,0 +1,411 @@
+"""
+Module for in-memory spatial index of players on the map based on uniform bucket grid.
+"""
+
+
+import bisect
+import threading
+
+
+class PlayerState:
+
+    """
+    Class describing player in memory. Takes less memory than player's dict.
+    """
+
+    __slots__ = ('_id', 'x', 'y', 'tasks')
+
+    def __init__(self, player):
+
+        """
+        Instance initialization.
+        :param player: player's dict
+        :type player: dict
+        """
+
+        self._id = player['_id']
+        self.x = player['x']
+        self.y = player['y']
+        # Task id to task end time mapping
+        self.tasks = {key: value for key, value in player.items() if key not in ('_id', 'x', 'y')}
+
+    def to_dict(self):
+
+        """
+        Make player's dict as it is stored in MongoDB.
+        :return: player's dict
+        :rtype: dict
+        """
+
+        player = {'_id': self._id, 'x': self.x, 'y': self.y}
+        player.update(self.tasks)
+
+        return player
+
+
+class SpatialIndex:
+
+    """
+    Class for in-memory spatial index of players. The map is split into square cells of equal size and every cell
+    keeps ids of the players within it, so area query touches only cells which overlap the area.
+    """
+
+    def __init__(self, cell_size, player_table=None):
+
+        """
+        Instance initialization.
+        :param cell_size: grid cell size in map squares
+        :type cell_size: int
+        :param player_table: columnar players table to keep in sync with the index
+        :type player_table: player_table.PlayerTable
+        """
+
+        # Raise value error if cell size is not positive
+        if cell_size < 1:
+            raise ValueError('Spatial index cell size must be positive!')
+
+        self.cell_size = cell_size
+        self.player_table = player_table
+        self.is_loaded = False
+        # Player's id to player's state mapping
+        self._players = {}
+        # Sorted players ids, made on demand
+        self._sorted_ids = None
+        # Cell coordinates to set of players ids mapping
+        self._cells = {}
+        # Lock to synchronize asyncio loop thread writes with Flask threads reads
+        self._lock = threading.Lock()
+        # Objects with invalidate_point(x, y) and clear() methods notified about changes after the lock is released
+        self.listeners = []
+
+    def __len__(self):
+
+        """
+        Number of players in the index.
+        :return: number of players
+        :rtype: int
+        """
+
+        return len(self._players)
+
+    def _get_cell(self, x, y):
+
+        """
+        Get grid cell coordinates for map coordinates.
+        :param x: x coordinate
+        :type x: int
+        :param y: y coordinate
+        :type y: int
+        :return: cell coordinates
+        :rtype: tuple of two ints
+        """
+
+        return x // self.cell_size, y // self.cell_size
+
+    def _notify_listeners(self, points):
+
+        """
+        Notify listeners about changed points of the map, None point means the whole map.
+        :param points: changed points as (x, y) tuples or None
+        :type points: iterable
+        :return: None
+        """
+
+        for listener in self.listeners:
+
+            for point in points:
+
+                if point is None:
+                    listener.clear()
+                else:
+                    listener.invalidate_point(*point)
+
+    def _add_player(self, player):
+
+        """
+        Add player to the index. Lock must be acquired by the caller.
+        :param player: player's dict or state
+        :type player: dict or PlayerState
+        :return: None
+        """
+
+        if isinstance(player, dict):
+            player = PlayerState(player)
+
+        # New player changes ids order
+        if player._id not in self._players:
+            self._sorted_ids = None
+
+        self._players[player._id] = player
+        self._cells.setdefault(self._get_cell(player.x, player.y), set()).add(player._id)
+
+    def _remove_player(self, player_id):
+
+        """
+        Remove player from the index. Lock must be acquired by the caller.
+        :param player_id: player's id
+        :return: removed player's state or None
+        :rtype: PlayerState
+        """
+
+        player = self._players.pop(player_id, None)
+
+        if player is None:
+            return None
+
+        self._sorted_ids = None
+
+        cell = self._get_cell(player.x, player.y)
+        cell_players = self._cells[cell]
+        cell_players.discard(player_id)
+
+        # Drop empty cells to keep the grid compact
+        if not cell_players:
+            del self._cells[cell]
+
+        return player
+
+    def load(self, db_collection, load_table=True):
+
+        """
+        Load all players from MongoDB collection into the index (cold start).
+        :param db_collection: MongoDB players collection
+        :param load_table: load players into columnar players table too, False if it is already loaded
+        :type load_table: bool
+        :return: None
+        """
+
+        players = db_collection.find()
+
+        with self._lock:
+
+            self._players.clear()
+            self._cells.clear()
+            self._sorted_ids = None
+
+            for player in players:
+                self._add_player(player)
+
+            if self.player_table is not None and load_table:
+                self.player_table.load(player.to_dict() for player in self._players.values())
+
+            self.is_loaded = True
+
+        self._notify_listeners([None])
+
+    def add_player(self, player):
+
+        """
+        Add new player or replace existed one.
+        :param player: player's dict
+        :type player: dict
+        :return: None
+        """
+
+        with self._lock:
+
+            old_player = self._remove_player(player['_id'])
+            self._add_player(player)
+
+            if self.player_table is not None:
+
+                self.player_table.add_player(player['_id'], player['x'], player['y'])
+
+                for key, value in player.items():
+
+                    if key not in ('_id', 'x', 'y'):
+                        self.player_table.set_task(player['_id'], key, value)
+
+        points = [(player['x'], player['y'])]
+
+        if old_player is not None:
+            points.append((old_player.x, old_player.y))
+
+        self._notify_listeners(points)
+
+    def remove_player(self, player_id):
+
+        """
+        Remove player from the index.
+        :param player_id: player's id
+        :return: None
+        """
+
+        with self._lock:
+            player = self._remove_player(player_id)
+
+        if player is not None:
+            self._notify_listeners([(player.x, player.y)])
+
+    def update_player(self, player_id, set_fields=None, unset_fields=None):
+
+        """
+        Apply changes of player's MongoDB document to the index.
+        :param player_id: player's id
+        :param set_fields: fields to set as in MongoDB $set
+        :type set_fields: dict
+        :param unset_fields: fields names to delete as in MongoDB $unset
+        :type unset_fields: iterable
+        :return: None
+        """
+
+        with self._lock:
+
+            player = self._players.get(player_id)
+
+            # Ignore players which are unknown to the index
+            if player is None:
+                return
+
+            points = [(player.x, player.y)]
+            set_fields = dict(set_fields or {})
+            x = set_fields.pop('x', player.x)
+            y = set_fields.pop('y', player.y)
+
+            # Move player to another cell if position is changed
+            if (x, y) != (player.x, player.y):
+
+                player = self._remove_player(player_id)
+                player.x, player.y = x, y
+                self._add_player(player)
+                points.append((x, y))
+
+                if self.player_table is not None:
+                    self.player_table.add_player(player_id, x, y)
+
+            player.tasks.update(set_fields)
+
+            for field in unset_fields or ():
+                player.tasks.pop(field, None)
+
+            # Keep columnar players table in sync
+            if self.player_table is not None:
+
+                for field, value in set_fields.items():
+                    self.player_table.set_task(player_id, field, value)
+
+                for field in unset_fields or ():
+                    self.player_table.set_task(player_id, field, None)
+
+        self._notify_listeners(points)
+
+    def get_expired_tasks(self, now):
+
+        """
+        Get tasks expired by now of all players.
+        :param now: time to compare tasks end time with (Unix timestamp)
+        :type now: float
+        :return: player's id to expired tasks ids mapping
+        :rtype: dict
+        """
+
+        expired_tasks = {}
+
+        with self._lock:
+
+            for player in self._players.values():
+
+                task_ids = [task_id for task_id, end_time in player.tasks.items() if end_time <= now]
+
+                if task_ids:
+                    expired_tasks[player._id] = task_ids
+
+        return expired_tasks
+
+    def drop_expired_tasks(self, now):
+
+        """
+        Delete tasks expired by now from all players.
+        :param now: time to compare tasks end time with (Unix timestamp)
+        :type now: float
+        :return: number of deleted tasks
+        :rtype: int
+        """
+
+        dropped = 0
+        points = []
+
+        with self._lock:
+
+            for player in self._players.values():
+
+                for task_id in [task_id for task_id, end_time in player.tasks.items() if end_time <= now]:
+
+                    del player.tasks[task_id]
+                    dropped += 1
+                    points.append((player.x, player.y))
+
+                    if self.player_table is not None:
+                        self.player_table.set_task(player._id, task_id, None)
+
+        self._notify_listeners(points)
+
+        return dropped
+
+    def get_player(self, player_id):
+
+        """
+        Get player's dict copy by id.
+        :param player_id: player's id
+        :return: player's dict or None
+        :rtype: dict
+        """
+
+        with self._lock:
+
+            player = self._players.get(player_id)
+
+            return player.to_dict() if player is not None else None
+
+    def get_players(self, after=None, limit=0):
+
+        """
+        Get players sorted by id.
+        :param after: id of the player to start after, from the first player by default
+        :param limit: max number of players, 0 for all players
+        :type limit: int
+        :return: list of players dicts
+        :rtype: list
+        """
+
+        with self._lock:
+
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self._players)
+
+            start = bisect.bisect_right(self._sorted_ids, after) if after is not None else 0
+            end = start + limit if limit > 0 else len(self._sorted_ids)
+
+            return [self._players[player_id].to_dict() for player_id in self._sorted_ids[start:end]]
+
+    def get_area_players(self, area):
+
+        """
+        Get all players within area.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: list of players dicts copies within area
+        :rtype: list
+        """
+
+        left_x, right_x, lower_y, upper_y = area
+        left_cell, lower_cell = self._get_cell(left_x, lower_y)
+        right_cell, upper_cell = self._get_cell(right_x, upper_y)
+
+        area_players = []
+
+        with self._lock:
+
+            for cell_x in range(left_cell, right_cell + 1):
+
+                for cell_y in range(lower_cell, upper_cell + 1):
+
+                    for player_id in self._cells.get((cell_x, cell_y), ()):
+
+                        player = self._players[player_id]
+
+                        # Border cells are only partially covered by the area
+                        if left_x <= player.x <= right_x and lower_y <= player.y <= upper_y:
+                            area_players.append(player.to_dict())
+
+        return area_players
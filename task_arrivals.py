@@ -0,0 +1,191 @@
+"""
+Module for shaping players tasks starts: arrival delays of new tasks, global limit of tasks starts per second and
+measurement of the achieved starts rate.
+"""
+
+
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+
+class ArrivalModel:
+
+    """
+    Class to generate start delays of player's new tasks. 'immediate' starts all tasks at once, 'jitter' starts every
+    task at random offset up to jitter seconds, 'poisson' starts tasks one after another with exponentially
+    distributed gaps of mean interval seconds, so starts of all players form Poisson process.
+    """
+
+    kinds = ('immediate', 'jitter', 'poisson')
+
+    def __init__(self, kind, jitter=0, mean_interval=0):
+
+        """
+        Instance initialization.
+        :param kind: arrival distribution - 'immediate', 'jitter' or 'poisson'
+        :type kind: str
+        :param jitter: max start offset in seconds for 'jitter' arrivals
+        :type jitter: float
+        :param mean_interval: mean gap between player's tasks starts in seconds for 'poisson' arrivals
+        :type mean_interval: float
+        """
+
+        # Raise value error if arrival distribution is unknown
+        if kind not in self.kinds:
+            raise ValueError(f'Unknown task arrivals kind: {kind}!')
+
+        self.kind = kind
+        self.jitter = jitter
+        self.mean_interval = mean_interval
+
+    def get_start_delays(self, tasks_number):
+
+        """
+        Generate start delays of player's new tasks.
+        :param tasks_number: number of tasks
+        :type tasks_number: int
+        :return: delays in seconds from now
+        :rtype: list
+        """
+
+        if self.kind == 'jitter' and self.jitter > 0:
+            return [random.uniform(0, self.jitter) for _ in range(tasks_number)]
+
+        if self.kind == 'poisson' and self.mean_interval > 0:
+
+            delays = []
+            delay = 0
+
+            for _ in range(tasks_number):
+
+                delay += random.expovariate(1 / self.mean_interval)
+                delays.append(delay)
+
+            return delays
+
+        return [0] * tasks_number
+
+
+class TokenBucket:
+
+    """
+    Class for token bucket limit of tasks starts per second shared by all coroutines of asyncio loop. Every start
+    reserves a token right away and waits till the token is refilled, so waiting starts keep their order and the
+    bucket does no work while the rate is not exceeded. Methods must be called from the asyncio loop thread.
+    """
+
+    def __init__(self, rate, burst):
+
+        """
+        Instance initialization.
+        :param rate: max number of starts per second, 0 for no limit
+        :type rate: float
+        :param burst: max number of starts at once after idle time
+        :type burst: int
+        """
+
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # Available tokens, negative number of tokens is reserved by waiting starts
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    async def acquire(self):
+
+        """
+        Async function to wait for the token of the next start.
+        :return: None
+        """
+
+        if not self.rate:
+            return
+
+        now = time.monotonic()
+
+        # Refill tokens for the time passed since the last start
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+
+        if self.tokens < 0:
+
+            try:
+                await asyncio.sleep(-self.tokens / self.rate)
+            except asyncio.CancelledError:
+                # Give the reserved token back, so cancelled starts do not delay later ones
+                self.tokens += 1
+                raise
+
+
+class RateMeter:
+
+    """
+    Class to measure events rate per second over sliding window of whole seconds. Thread-safe.
+    """
+
+    def __init__(self, window):
+
+        """
+        Instance initialization.
+        :param window: window length in seconds
+        :type window: int
+        """
+
+        self.window = window
+        # Deque of [second, number of events] lists in time order
+        self._counts = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, second):
+
+        """
+        Drop counts of seconds out of the window ending before the second.
+        :param second: current second (Unix timestamp)
+        :type second: int
+        :return: None
+        """
+
+        while self._counts and self._counts[0][0] < second - self.window:
+            self._counts.popleft()
+
+    def mark(self, now=None):
+
+        """
+        Count an event.
+        :param now: time of the event (Unix timestamp), current time by default
+        :type now: float
+        :return: None
+        """
+
+        second = int(time.time() if now is None else now)
+
+        with self._lock:
+
+            if self._counts and self._counts[-1][0] == second:
+                self._counts[-1][1] += 1
+            else:
+                self._counts.append([second, 1])
+
+            self._trim(second)
+
+    def get_rate(self, now=None):
+
+        """
+        Get mean events rate over the window of whole seconds before the current one.
+        :param now: current time (Unix timestamp), current time by default
+        :type now: float
+        :return: events per second
+        :rtype: float
+        """
+
+        second = int(time.time() if now is None else now)
+
+        with self._lock:
+
+            self._trim(second)
+            events = sum(count for count_second, count in self._counts if count_second < second)
+
+        return events / self.window
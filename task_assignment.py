@@ -4,12 +4,18 @@ Module for asynchronous players tasks assignment based on asyncio.
 
 
 import time
+import datetime
 from random import randint
 import asyncio
 import threading
 from concurrent.futures import ALL_COMPLETED
 import app
 import logging_master
+import metrics
+from task_repository import make_task_repository
+from task_scheduler import TaskScheduler
+from task_arrivals import ArrivalModel, TokenBucket, RateMeter
+from pause_registry import PauseRegistry
 
 
 class TaskAssigner:
@@ -18,26 +24,54 @@ class TaskAssigner:
     Class to assign and control asynchronous players tasks.
     """
 
-    # List for storing players that should be stopped
-    _players_to_stop = []
+    # Registry of players that should be stopped
+    _paused_players = PauseRegistry()
 
-    def __init__(self, players_collection, log_collection):
+    def __init__(self, players_collection, log_collection, logger_name='world_events', repository=None,
+                 start_rate=None):
 
         """
         Instance initialization.
         :param players_collection: MongoDB players collection
         :param log_collection: MongoDB log collection
+        :param logger_name: name of the world events logger
+        :type logger_name: str
+        :param repository: players tasks repository, config.TASK_REPOSITORY kind of repository by default
+        :type repository: task_repository.TaskRepository
+        :param start_rate: max number of tasks starts per second, config.TASK_START_RATE by default
+        :type start_rate: float
         """
 
         self.players_collection = players_collection
         self.log_collection = log_collection
         self.main_loop = asyncio.new_event_loop()
-        self.logger = logging_master.init_logger('world_events')
+        self.scheduler = TaskScheduler(self.main_loop)
+        TaskAssigner._paused_players.bind_loop(self.main_loop)
+        self.logger = logging_master.init_logger(logger_name, app.app.config['ASYNC_LOGGING'],
+                                                 app.app.config['LOG_BATCH_SIZE'], app.app.config['LOG_MAX_BYTES'],
+                                                 app.app.config['LOG_BACKUP_COUNT'])
 
-    def insert_log_note(self, player, task_id, task_status):
+        if repository is None:
+            repository = make_task_repository(app.app.config['TASK_REPOSITORY'], players_collection, log_collection,
+                                              app.app.config, app.world_state)
+
+        self.repository = repository
+        self.repository.add_flush_listener(self.invalidate_cached_players)
+        self._thread = None
+
+        if start_rate is None:
+            start_rate = app.app.config['TASK_START_RATE']
+
+        # Shape tasks starts with arrival delays and global starts limit, measure achieved starts rate
+        self.arrivals = ArrivalModel(app.app.config['TASK_ARRIVALS'], app.app.config['TASK_ARRIVAL_JITTER'],
+                                     app.app.config['TASK_ARRIVAL_INTERVAL'])
+        self.start_limiter = TokenBucket(start_rate, app.app.config['TASK_START_BURST'])
+        self.start_meter = RateMeter(app.app.config['TASK_RATE_WINDOW'])
+
+    async def insert_log_note(self, player, task_id, task_status):
 
         """
-        Insert log note into MongoDB log collection.
+        Async function to insert log note into MongoDB log collection.
         :param player: player's dict
         :type player: dict
         :param task_id: task id
@@ -55,10 +89,125 @@ class TaskAssigner:
                     'task_status': task_status,
                     'time': time.time()}
 
-        # Insert log note into MongoDB log collection
-        self.log_collection.insert_one(log_note)
+        # Add date for MongoDB TTL index to expire log notes
+        if app.app.config['LOG_TTL']:
+            log_note['created_at'] = datetime.datetime.utcnow()
+
+        # Save log note through tasks repository
+        await self.repository.insert_log_note(log_note)
+
+    @staticmethod
+    def finish_task_waiting(task_end):
+
+        """
+        Scheduler callback to resume task coroutine waiting for the end of the task.
+        :param task_end: future the task coroutine waits for
+        :type task_end: asyncio.Future
+        :return: None
+        """
+
+        if not task_end.done():
+            task_end.set_result(None)
+
+    @staticmethod
+    def resume_player(player_id):
+
+        """
+        Resume player's tasks assignment. Safe to call from any thread.
+        :param player_id: player's id
+        :return: True if player was paused before
+        :rtype: bool
+        """
+
+        return TaskAssigner._paused_players.resume(player_id)
+
+    @staticmethod
+    def pause_player(player_id, task_assigner=None):
+
+        """
+        Stop all player's tasks and pause new tasks assignment. Safe to call from any thread.
+        :param player_id: player's id
+        :param task_assigner: running task assigner to finish player's tasks with
+        :type task_assigner: TaskAssigner
+        :return: True if player was not paused before
+        :rtype: bool
+        """
+
+        paused = TaskAssigner._paused_players.pause(player_id)
+
+        # Finish running tasks without waiting for their timers
+        if paused and task_assigner is not None:
+            task_assigner.cancel_player_tasks(player_id)
+
+        return paused
+
+    @staticmethod
+    def get_paused_players_number():
+
+        """
+        Get number of currently paused players.
+        :return: number of paused players
+        :rtype: int
+        """
+
+        return len(TaskAssigner._paused_players)
+
+    def cancel_player_tasks(self, player_id):
+
+        """
+        Finish all running player's tasks right now. Safe to call from any thread.
+        :param player_id: player's id
+        :return: None
+        """
+
+        self.main_loop.call_soon_threadsafe(self.scheduler.expire_group, player_id)
+
+    @staticmethod
+    def invalidate_cached_players(player_ids):
+
+        """
+        Drop players documents from lookup cache when their buffered tasks changes are written, so documents read
+        from MongoDB before the write are not served till they expire.
+        :param player_ids: players ids
+        :type player_ids: list
+        :return: None
+        """
+
+        if app.player_cache is not None:
+
+            for player_id in player_ids:
+                app.player_cache.invalidate(player_id)
 
-    async def assign_task(self, player, task_id):
+    def notify_task_change(self, player, task_id, task_status, end_time=None):
+
+        """
+        Keep in-memory spatial index in sync with player's MongoDB document and publish task event for subscribers.
+        :param player: player's dict
+        :type player: dict
+        :param task_id: task id
+        :type task_id: str
+        :param task_status: task status - 1 for start, 0 for end
+        :type task_status: int
+        :param end_time: time of the task end (Unix timestamp) for started task
+        :type end_time: float
+        :return: None
+        """
+
+        # Spatial index is already updated if it is kept by the repository
+        if not self.repository.updates_index:
+
+            if task_status:
+                app.spatial_index.update_player(player['_id'], set_fields={task_id: end_time})
+            else:
+                app.spatial_index.update_player(player['_id'], unset_fields=(task_id,))
+
+        # Drop player's document with outdated tasks from lookup cache
+        if app.player_cache is not None:
+            app.player_cache.invalidate(player['_id'])
+
+        app.task_events.publish(player, task_id, task_status)
+
+    async def assign_task(self, player, task_id, start_delay=0):
 
         """
         Async function to assign and control player's task.
@@ -66,57 +215,178 @@ class TaskAssigner:
         :type player: dict
         :param task_id: task id
         :type task_id: str
+        :param start_delay: task arrival delay in seconds
+        :type start_delay: float
         """
 
+        # Wait for the task arrival and for the token of global tasks starts limit
+        if start_delay:
+            await asyncio.sleep(start_delay)
+
+        await self.start_limiter.acquire()
+
+        # Skip the task if player has been stopped while the task was waiting to start
+        if player['_id'] in TaskAssigner._paused_players:
+            return
+
         # Generate random task's duration time
         duration = randint(app.app.config['MIN_TASK_DURATION'], app.app.config['MAX_TASK_DURATION'])
         # Calculate time till the end of the task (Unix timestamp)
         end_time = time.time() + duration
-        # Make player's id filter to perform search in MongoDB collection
-        player_filter = {'_id': player['_id']}
+        # Count the started task
+        metrics.live_tasks.inc()
+        metrics.tasks_total.inc('started')
 
-        # Update player's MongoDB document with assigned task
-        self.players_collection.update_one(player_filter, {'$set': {task_id: end_time}})
-        # Insert log note into MongoDB log collection
-        self.insert_log_note(player, task_id, task_status=1)
-        # Logger logging
-        self.logger.info(logging_master.make_task_log_note(player, task_id, task_status=1, duration=duration))
+        # Live task is uncounted when it is finished or cancelled
+        try:
+
+            # Update player's MongoDB document with assigned task
+            await self.repository.set_task(player['_id'], task_id, end_time)
+            # Count the start in achieved starts rate
+            self.start_meter.mark()
+            # Notify in-memory views about the started task
+            self.notify_task_change(player, task_id, task_status=1, end_time=end_time)
+            # Insert log note into MongoDB log collection
+            await self.insert_log_note(player, task_id, task_status=1)
+            # Logger logging, log note is made only when it is written
+            self.logger.info(logging_master.LazyLogNote(logging_master.make_task_log_note, player, task_id,
+                                                        task_status=1, duration=duration, log_time=time.time()))
+
+            await self.complete_task(player, task_id, end_time)
+
+        finally:
+            metrics.live_tasks.inc(amount=-1)
+
+    async def resume_task(self, player, task_id, end_time):
 
-        # Loop to release coroutine every config.DEFAULT_TASK_DELAY seconds till the end of the task or task cancel
-        for _ in range(int(duration / app.app.config['DEFAULT_TASK_DELAY'])):
+        """
+        Async function to control player's task saved by the previous server run, the task is not written again.
+        :param player: player's dict
+        :type player: dict
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        """
+
+        # Count the resumed task
+        metrics.live_tasks.inc()
+        metrics.tasks_total.inc('resumed')
 
-            await asyncio.sleep(app.app.config['DEFAULT_TASK_DELAY'])
+        # Live task is uncounted when it is finished or cancelled
+        try:
+            await self.complete_task(player, task_id, end_time)
+        finally:
+            metrics.live_tasks.inc(amount=-1)
 
-            # Cancel assigned task
-            if player['_id'] in TaskAssigner._players_to_stop:
-                break
+    async def complete_task(self, player, task_id, end_time):
 
+        """
+        Async function to wait till the end of player's started task and finish it.
+        :param player: player's dict
+        :type player: dict
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        """
+
+        # Wait till the end of the task or task cancel, scheduler resolves the future once
+        task_end = self.main_loop.create_future()
+        self.scheduler.schedule(end_time, self.finish_task_waiting, task_end, group=player['_id'])
+
+        # Cancel assigned task if player has been stopped before the task start
+        if player['_id'] in TaskAssigner._paused_players:
+            self.scheduler.expire_group(player['_id'])
+
+        await task_end
+
+        # Skip completion write for task finished by its timer in lazy task expiry mode
+        if app.app.config['LAZY_TASK_EXPIRY'] and time.time() >= end_time:
+            await self.repository.expire_task(player['_id'], task_id)
         # Update player's MongoDB document with finished task (delete task)
-        self.players_collection.update_one(player_filter, {'$unset': {task_id: end_time}})
+        else:
+            await self.repository.unset_task(player['_id'], task_id)
+
+        # Notify in-memory views about the finished task
+        self.notify_task_change(player, task_id, task_status=0)
         # Insert log note into MongoDB log collection
-        self.insert_log_note(player, task_id, task_status=0)
-        # Logger logging
-        self.logger.info(logging_master.make_task_log_note(player, task_id, task_status=0))
+        await self.insert_log_note(player, task_id, task_status=0)
+        # Logger logging, log note is made only when it is written
+        self.logger.info(logging_master.LazyLogNote(logging_master.make_task_log_note, player, task_id, task_status=0,
+                                                    log_time=time.time()))
+        # Count the finished task
+        metrics.tasks_total.inc('finished')
 
-    async def assign_player_tasks(self, player):
+    @staticmethod
+    def get_live_tasks(player, now=None):
+
+        """
+        Get player's tasks saved by the previous server run which are not finished yet.
+        :param player: player's dict with tasks end times
+        :type player: dict
+        :param now: time to compare tasks end time with (Unix timestamp), current time by default
+        :type now: float
+        :return: task id to task end time mapping
+        :rtype: dict
+        """
+
+        if now is None:
+            now = time.time()
+
+        live_tasks = {}
+
+        for i in range(1, app.app.config['MAX_PLAYER_TASKS'] + 1):
+
+            end_time = player.get(f'Task {i}')
+
+            if end_time is not None and end_time > now:
+                live_tasks[f'Task {i}'] = end_time
+
+        return live_tasks
+
+    def get_resumed_tasks(self, player):
+
+        """
+        Get player's saved tasks to resume on tasks assignment start if config.RESUME_TASKS is set.
+        :param player: player's dict with tasks end times
+        :type player: dict
+        :return: task id to task end time mapping or None if tasks are not resumed
+        :rtype: dict
+        """
+
+        if not app.app.config['RESUME_TASKS']:
+            return None
+
+        # Tasks expired while the server was down are closed on boot, tasks expired since then are finished right away
+        return self.get_live_tasks(player, now=0)
+
+    async def assign_player_tasks(self, player, live_tasks=None):
 
         """
         Async recursive function to assign and control player's tasks as coroutines.
         :param player: player's dict
         :type player: dict
+        :param live_tasks: task id to end time mapping of tasks saved by the previous server run to resume instead of
+        assigning new tasks
+        :type live_tasks: dict
         :return: async function itself
         """
 
-        # Generate futures of future for each task of randomly generated tasks
-        futures = [self.assign_task(player, f'Task {i}') for i in
-                   range(1, randint(2, app.app.config['MAX_PLAYER_TASKS'] + 1))]
+        # Resume saved tasks or generate futures of future for each task of randomly generated tasks
+        if live_tasks:
+            futures = [self.main_loop.create_task(self.resume_task(player, task_id, end_time)) for task_id, end_time
+                       in live_tasks.items()]
+        else:
+            start_delays = self.arrivals.get_start_delays(randint(1, app.app.config['MAX_PLAYER_TASKS']))
+            futures = [self.main_loop.create_task(self.assign_task(player, f'Task {i}', start_delay)) for i, start_delay
+                       in enumerate(start_delays, 1)]
 
         # Wait until all tasks will be finished or canceled
         await asyncio.wait(futures, return_when=ALL_COMPLETED)
 
-        # Loop to release coroutine every config.DEFAULT_TASK_DELAY seconds while player's tasks are canceled
-        while player['_id'] in TaskAssigner._players_to_stop:
-            await asyncio.sleep(app.app.config['DEFAULT_TASK_DELAY'])
+        # Wait while player's tasks are canceled
+        await TaskAssigner._paused_players.wait_resumed(player['_id'])
 
         return await self.assign_player_tasks(player)
 
@@ -128,10 +398,64 @@ class TaskAssigner:
         """
 
         # Generate futures of future for each player
-        futures = [self.assign_player_tasks(player) for player in players]
+        futures = [self.main_loop.create_task(self.assign_player_tasks(player, self.get_resumed_tasks(player)))
+                   for player in players]
+
+        # Keep the loop running for players added later with add_players
+        if not futures:
+            futures = [self.main_loop.create_future()]
 
         await asyncio.wait(futures)
 
+    def create_players_tasks(self, players):
+
+        """
+        Start tasks assignment coroutines for players. Must be called from the asyncio loop thread.
+        :param players: players dicts
+        :type players: list
+        :return: None
+        """
+
+        for player in players:
+            self.main_loop.create_task(self.assign_player_tasks(player, self.get_resumed_tasks(player)))
+
+    def add_players(self, players):
+
+        """
+        Start tasks assignment for more players while the asyncio loop is running. Safe to call from any thread.
+        :param players: players dicts
+        :type players: iterable
+        :return: None
+        """
+
+        self.main_loop.call_soon_threadsafe(self.create_players_tasks, list(players))
+
+    def get_start_rate(self):
+
+        """
+        Get achieved tasks starts rate.
+        :return: tasks starts per second
+        :rtype: float
+        """
+
+        return self.start_meter.get_rate()
+
+    def probe_event_loop(self, probe_time=None):
+
+        """
+        Measure delay of the scheduled probe call as event loop lag and schedule the next probe in a second.
+        :param probe_time: time the probe was scheduled at (Unix timestamp), None for the first probe
+        :type probe_time: float
+        :return: None
+        """
+
+        now = time.time()
+
+        if probe_time is not None:
+            metrics.event_loop_lag.set(max(now - probe_time, 0))
+
+        self.main_loop.call_later(1, self.probe_event_loop, now + 1)
+
     def run_async_loop(self, players):
 
         """
@@ -140,10 +464,17 @@ class TaskAssigner:
         :return: None
         """
 
-        # Set asyncio event loop
+        # Set asyncio event loop and start measuring its lag
         asyncio.set_event_loop(self.main_loop)
-        # Run asyncio event loop
-        self.main_loop.run_until_complete(self.assign_players_tasks(players))
+        self.main_loop.call_soon(self.probe_event_loop)
+
+        # Run asyncio event loop till tasks assignment is stopped
+        try:
+            self.main_loop.run_until_complete(self.assign_players_tasks(players))
+        except asyncio.CancelledError:
+            # Let cancelled task coroutines finish before the loop stops
+            pending = asyncio.all_tasks(self.main_loop)
+            self.main_loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
 
     def start_task_assignment(self, players):
 
@@ -153,7 +484,44 @@ class TaskAssigner:
         :return: None
         """
 
-        # Create new thread to run asyncio loop
-        main_thread = threading.Thread(target=self.run_async_loop, args=(players,))
+        # Create new thread to run asyncio loop, it is stopped with stop() on exit
+        self._thread = threading.Thread(target=self.run_async_loop, args=(players,), daemon=True)
         # Run separate thread
-        main_thread.start()
+        self._thread.start()
+
+    def is_running(self):
+
+        """
+        Check if tasks assignment asyncio loop thread is running.
+        :return: True if it is running
+        :rtype: bool
+        """
+
+        return self._thread is not None and self._thread.is_alive()
+
+    def cancel_all_tasks(self):
+
+        """
+        Cancel all task coroutines. Must be called from the asyncio loop thread.
+        :return: None
+        """
+
+        for task in asyncio.all_tasks(self.main_loop):
+            task.cancel()
+
+    def stop(self, timeout=None):
+
+        """
+        Stop tasks assignment and drain it: cancel task coroutines, wait for the asyncio loop thread and write
+        everything buffered by the repository. Running tasks stay saved with their end times.
+        :param timeout: max time to wait for the asyncio loop thread in seconds, None to wait till it stops
+        :type timeout: float
+        :return: None
+        """
+
+        if self._thread is not None and self._thread.is_alive():
+
+            self.main_loop.call_soon_threadsafe(self.cancel_all_tasks)
+            self._thread.join(timeout)
+
+        self.repository.close()
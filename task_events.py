@@ -0,0 +1,124 @@
+"""
+Module for versioned feed of players tasks events.
+"""
+
+
+import time
+import threading
+from collections import deque
+
+
+class TaskEventFeed:
+
+    """
+    Class to keep recent players tasks events. Every event gets next version number, so subscribers can ask for the
+    events they have not seen yet and wait for new ones.
+    """
+
+    def __init__(self, max_events):
+
+        """
+        Instance initialization.
+        :param max_events: number of recent events to keep
+        :type max_events: int
+        """
+
+        self.version = 0
+        self._events = deque(maxlen=max_events)
+        # Condition to wake up subscribers waiting for new events
+        self._condition = threading.Condition()
+
+    def publish(self, player, task_id, task_status):
+
+        """
+        Add new task event.
+        :param player: player's dict
+        :type player: dict
+        :param task_id: task id
+        :type task_id: str
+        :param task_status: task status - 1 for start, 0 for end
+        :type task_status: int
+        :return: None
+        """
+
+        with self._condition:
+
+            self.version += 1
+
+            event = {'version': self.version,
+                     'player_id': player['_id'],
+                     'x': player['x'],
+                     'y': player['y'],
+                     'task_id': task_id,
+                     'task_status': task_status,
+                     'time': time.time()}
+
+            self._events.append(event)
+            self._condition.notify_all()
+
+    def _get_area_events(self, area, version):
+
+        """
+        Get area events newer than version. Lock must be acquired by the caller.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :param version: last seen version
+        :type version: int
+        :return: list of events or None if events newer than version are not kept anymore
+        :rtype: list
+        """
+
+        # Version is unknown or too old
+        if version > self.version or (self._events and version < self._events[0]['version'] - 1):
+            return None
+
+        area_events = []
+
+        # Walk from the newest event till the last seen one
+        for event in reversed(self._events):
+
+            if event['version'] <= version:
+                break
+
+            if area[0] <= event['x'] <= area[1] and area[2] <= event['y'] <= area[3]:
+                area_events.append(dict(event))
+
+        area_events.reverse()
+
+        return area_events
+
+    def wait_area_events(self, area, version, timeout):
+
+        """
+        Wait for area events newer than version.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :param version: last seen version
+        :type version: int
+        :param timeout: max waiting time in seconds
+        :type timeout: float
+        :return: current version and list of events or None if events newer than version are not kept anymore
+        :rtype: tuple
+        """
+
+        deadline = time.time() + timeout
+        area_events = []
+
+        with self._condition:
+
+            while True:
+
+                # Check only events published since the previous check
+                new_events = self._get_area_events(area, version)
+
+                if new_events is None:
+                    return self.version, None
+
+                area_events.extend(new_events)
+                version = self.version
+                remaining = deadline - time.time()
+
+                if area_events or remaining <= 0:
+                    return version, area_events
+
+                self._condition.wait(remaining)
@@ -0,0 +1,503 @@
+"""
+Module for players tasks persistence used by asynchronous tasks assignment.
+"""
+
+
+import abc
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from write_buffer import WriteBehindBuffer
+import metrics
+
+
+class TaskRepository(abc.ABC):
+
+    """
+    Abstract class for players tasks persistence. Methods are coroutines, so they must not block asyncio loop.
+    """
+
+    # Repository applies tasks changes to in-memory spatial index itself
+    updates_index = False
+
+    @abc.abstractmethod
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to save player's task.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :return: None
+        """
+
+    @abc.abstractmethod
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to delete player's task.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+    @abc.abstractmethod
+    async def insert_log_note(self, log_note):
+
+        """
+        Async function to save log note.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+    async def expire_task(self, player_id, task_id):
+
+        """
+        Async function to handle player's task expired by its timer in lazy task expiry mode. Nothing is written,
+        expired task is dropped on read and deleted by the sweeper.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+    def add_flush_listener(self, listener):
+
+        """
+        Add function to call with players ids when their tasks changes are written. Repositories which write changes
+        before they are notified do not call it.
+        :param listener: function to call with list of players ids
+        :return: None
+        """
+
+    def close(self):
+
+        """
+        Finish all pending writes.
+        :return: None
+        """
+
+
+class MongoTaskRepository(TaskRepository):
+
+    """
+    Class for players tasks persistence in MongoDB. Blocking pymongo calls run in a thread pool, number of
+    operations in flight is bounded, connections are taken from MongoClient connection pool.
+    """
+
+    def __init__(self, players_collection, log_collection, max_in_flight):
+
+        """
+        Instance initialization.
+        :param players_collection: MongoDB players collection
+        :param log_collection: MongoDB log collection
+        :param max_in_flight: max number of operations in flight
+        :type max_in_flight: int
+        """
+
+        self.players_collection = players_collection
+        self.log_collection = log_collection
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._semaphore = None
+
+    @staticmethod
+    def call(operation, function, *args):
+
+        """
+        Call blocking MongoDB function within the latency timer.
+        :param operation: operation name for metrics
+        :type operation: str
+        :param function: blocking function
+        :param args: function arguments
+        :return: function result
+        """
+
+        with metrics.mongo_seconds.time(operation):
+            return function(*args)
+
+    async def run(self, operation, function, *args):
+
+        """
+        Async function to run blocking MongoDB function in the thread pool.
+        :param operation: operation name for metrics
+        :type operation: str
+        :param function: blocking function
+        :param args: function arguments
+        :return: function result
+        """
+
+        # Create semaphore lazily to bind it to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.call, operation, function,
+                                                                    *args)
+
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to save player's task in MongoDB.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :return: None
+        """
+
+        await self.run('update_one', self.players_collection.update_one, {'_id': player_id},
+                       {'$set': {task_id: end_time}})
+
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to delete player's task in MongoDB.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+        await self.run('update_one', self.players_collection.update_one, {'_id': player_id}, {'$unset': {task_id: ''}})
+
+    async def insert_log_note(self, log_note):
+
+        """
+        Async function to save log note in MongoDB.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+        await self.run('insert_one', self.log_collection.insert_one, log_note)
+
+    def close(self):
+
+        """
+        Finish all pending writes.
+        :return: None
+        """
+
+        self.executor.shutdown(wait=True)
+
+
+class BufferedTaskRepository(TaskRepository):
+
+    """
+    Class for players tasks persistence in MongoDB through write-behind buffer.
+    """
+
+    def __init__(self, players_collection, log_collection, max_size, flush_interval):
+
+        """
+        Instance initialization.
+        :param players_collection: MongoDB players collection
+        :param log_collection: MongoDB log collection
+        :param max_size: number of pending writes which triggers flush
+        :type max_size: int
+        :param flush_interval: max delay between flushes in seconds
+        :type flush_interval: float
+        """
+
+        self.write_buffer = WriteBehindBuffer(players_collection, log_collection, max_size, flush_interval)
+
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to save player's task through write-behind buffer.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :return: None
+        """
+
+        self.write_buffer.set_fields(player_id, {task_id: end_time})
+
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to delete player's task through write-behind buffer.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+        self.write_buffer.unset_fields(player_id, (task_id,))
+
+    async def insert_log_note(self, log_note):
+
+        """
+        Async function to save log note through write-behind buffer.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+        self.write_buffer.add_log_note(log_note)
+
+    def add_flush_listener(self, listener):
+
+        """
+        Add function to call with players ids when their buffered tasks changes are written.
+        :param listener: function to call with list of players ids
+        :return: None
+        """
+
+        self.write_buffer.flush_listeners.append(listener)
+
+    def close(self):
+
+        """
+        Finish all pending writes.
+        :return: None
+        """
+
+        self.write_buffer.close()
+
+
+class WorldStateTaskRepository(TaskRepository):
+
+    """
+    Class for players tasks persistence in authoritative in-memory world state. Log notes are saved to MongoDB
+    through write-behind buffer. Expired tasks are deleted by the sweeper through the world state in lazy task expiry
+    mode.
+    """
+
+    updates_index = True
+
+    def __init__(self, world_state, log_collection, max_size, flush_interval):
+
+        """
+        Instance initialization.
+        :param world_state: in-memory world state
+        :type world_state: world_state.WorldState
+        :param log_collection: MongoDB log collection
+        :param max_size: number of pending writes which triggers flush
+        :type max_size: int
+        :param flush_interval: max delay between flushes in seconds
+        :type flush_interval: float
+        """
+
+        self.world_state = world_state
+        self.write_buffer = WriteBehindBuffer(None, log_collection, max_size, flush_interval)
+
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to save player's task in the world state.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :return: None
+        """
+
+        self.world_state.record_change(player_id, set_fields={task_id: end_time})
+
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to delete player's task in the world state.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+        self.world_state.record_change(player_id, unset_fields=(task_id,))
+
+    async def insert_log_note(self, log_note):
+
+        """
+        Async function to save log note through write-behind buffer.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+        self.write_buffer.add_log_note(log_note)
+
+    def close(self):
+
+        """
+        Finish all pending writes.
+        :return: None
+        """
+
+        self.write_buffer.close()
+
+
+class ForwardedTaskRepository(TaskRepository):
+
+    """
+    Class for players tasks persistence of task worker process when the main process keeps authoritative in-memory
+    world state. Tasks changes are not written, they reach the world state as forwarded spatial index updates. Log
+    notes are saved to MongoDB through write-behind buffer.
+    """
+
+    def __init__(self, log_collection, max_size, flush_interval):
+
+        """
+        Instance initialization.
+        :param log_collection: MongoDB log collection
+        :param max_size: number of pending writes which triggers flush
+        :type max_size: int
+        :param flush_interval: max delay between flushes in seconds
+        :type flush_interval: float
+        """
+
+        self.write_buffer = WriteBehindBuffer(None, log_collection, max_size, flush_interval)
+
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to skip player's task write, the change is forwarded to the world state.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :return: None
+        """
+
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to skip player's task deletion, the change is forwarded to the world state.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+    async def insert_log_note(self, log_note):
+
+        """
+        Async function to save log note through write-behind buffer.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+        self.write_buffer.add_log_note(log_note)
+
+    def close(self):
+
+        """
+        Finish all pending writes.
+        :return: None
+        """
+
+        self.write_buffer.close()
+
+
+class InMemoryTaskRepository(TaskRepository):
+
+    """
+    Class for players tasks persistence in memory to test and benchmark tasks assignment without MongoDB.
+    """
+
+    def __init__(self, latency=0):
+
+        """
+        Instance initialization.
+        :param latency: simulated delay of every operation in seconds
+        :type latency: float
+        """
+
+        self.latency = latency
+        # Player's id to player's tasks mapping
+        self.players = {}
+        self.log_notes = []
+
+    async def simulate_latency(self):
+
+        """
+        Async function to simulate operation delay.
+        :return: None
+        """
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to save player's task in memory.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :return: None
+        """
+
+        await self.simulate_latency()
+        self.players.setdefault(player_id, {})[task_id] = end_time
+
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to delete player's task in memory.
+        :param player_id: player's id
+        :param task_id: task id
+        :type task_id: str
+        :return: None
+        """
+
+        await self.simulate_latency()
+        self.players.get(player_id, {}).pop(task_id, None)
+
+    async def insert_log_note(self, log_note):
+
+        """
+        Async function to save log note in memory.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+        await self.simulate_latency()
+        self.log_notes.append(log_note)
+
+
+def make_task_repository(kind, players_collection, log_collection, config, world_state=None):
+
+    """
+    Make players tasks repository.
+    :param kind: repository kind - 'buffered', 'mongo' or 'memory'
+    :type kind: str
+    :param players_collection: MongoDB players collection
+    :param log_collection: MongoDB log collection
+    :param config: app config
+    :type config: dict
+    :param world_state: authoritative in-memory world state, overrides repository kind
+    :type world_state: world_state.WorldState
+    :return: players tasks repository
+    :rtype: TaskRepository
+    """
+
+    if world_state is not None:
+        return WorldStateTaskRepository(world_state, log_collection, config['WRITE_BUFFER_SIZE'],
+                                        config['WRITE_BUFFER_INTERVAL'])
+
+    if kind == 'buffered':
+        return BufferedTaskRepository(players_collection, log_collection, config['WRITE_BUFFER_SIZE'],
+                                      config['WRITE_BUFFER_INTERVAL'])
+
+    if kind == 'mongo':
+        return MongoTaskRepository(players_collection, log_collection, config['MAX_IN_FLIGHT_WRITES'])
+
+    if kind == 'memory':
+        return InMemoryTaskRepository()
+
+    raise ValueError(f'Unknown task repository kind: {kind}!')
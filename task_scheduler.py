@@ -0,0 +1,215 @@
+"""
+Module for scheduling task completion callbacks on asyncio loop based on heap keyed by task's end time.
+"""
+
+
+import heapq
+import itertools
+import time
+
+
+class ScheduledTask:
+
+    """
+    Class describing scheduled task completion callback.
+    """
+
+    __slots__ = ('end_time', 'callback', 'args', 'group', 'cancelled')
+
+    def __init__(self, end_time, callback, args, group):
+
+        """
+        Instance initialization.
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :param callback: function to call when the task ends
+        :param args: callback arguments
+        :type args: tuple
+        :param group: key to expire or cancel tasks together, e.g. player's id
+        """
+
+        self.end_time = end_time
+        self.callback = callback
+        self.args = args
+        self.group = group
+        self.cancelled = False
+
+
+class TaskScheduler:
+
+    """
+    Class to call tasks completion callbacks at the tasks end time. Only one asyncio timer is armed at a time - for
+    the earliest task, so scheduler does work only for expiring tasks no matter how many tasks are alive.
+    Methods must be called from the asyncio loop thread.
+    """
+
+    def __init__(self, loop):
+
+        """
+        Instance initialization.
+        :param loop: asyncio event loop
+        """
+
+        self.loop = loop
+        # Heap of (end_time, sequence number, scheduled task) tuples
+        self._heap = []
+        # Group key to set of scheduled tasks mapping
+        self._groups = {}
+        # Sequence numbers keep heap order stable for tasks with the same end time
+        self._sequence = itertools.count()
+        # Number of cancelled tasks which are still in the heap
+        self._cancelled_number = 0
+        # Armed asyncio timer and its time
+        self._timer = None
+        self._timer_time = None
+
+    def __len__(self):
+
+        """
+        Number of scheduled tasks.
+        :return: number of scheduled tasks
+        :rtype: int
+        """
+
+        return len(self._heap) - self._cancelled_number
+
+    def schedule(self, end_time, callback, *args, group=None):
+
+        """
+        Schedule callback call at the task end time.
+        :param end_time: time of the task end (Unix timestamp)
+        :type end_time: float
+        :param callback: function to call when the task ends
+        :param args: callback arguments
+        :param group: key to expire or cancel tasks together, e.g. player's id
+        :return: scheduled task
+        :rtype: ScheduledTask
+        """
+
+        task = ScheduledTask(end_time, callback, args, group)
+
+        heapq.heappush(self._heap, (end_time, next(self._sequence), task))
+        self._groups.setdefault(group, set()).add(task)
+
+        # Rearm timer if the new task is the earliest one
+        if self._timer_time is None or end_time < self._timer_time:
+            self._arm_timer()
+
+        return task
+
+    def _mark_cancelled(self, task):
+
+        """
+        Mark task as cancelled. Task stays in the heap till it is popped or heap is compacted.
+        :param task: scheduled task
+        :type task: ScheduledTask
+        :return: None
+        """
+
+        task.cancelled = True
+        self._cancelled_number += 1
+
+        # Rebuild heap without cancelled tasks if they take more than a half of it
+        if self._cancelled_number > len(self._heap) / 2:
+
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled_number = 0
+
+    def _remove_from_group(self, task):
+
+        """
+        Remove task from its group.
+        :param task: scheduled task
+        :type task: ScheduledTask
+        :return: None
+        """
+
+        group_tasks = self._groups[task.group]
+        group_tasks.discard(task)
+
+        if not group_tasks:
+            del self._groups[task.group]
+
+    def cancel(self, task):
+
+        """
+        Cancel scheduled task without callback call.
+        :param task: scheduled task
+        :type task: ScheduledTask
+        :return: True if task was cancelled or False if it has already ended or been cancelled
+        :rtype: bool
+        """
+
+        if task.cancelled or task not in self._groups.get(task.group, ()):
+            return False
+
+        self._remove_from_group(task)
+        self._mark_cancelled(task)
+
+        return True
+
+    def expire_group(self, group):
+
+        """
+        End all group tasks right now and call their callbacks.
+        :param group: group key
+        :return: number of expired tasks
+        :rtype: int
+        """
+
+        tasks = self._groups.pop(group, set())
+
+        for task in tasks:
+
+            self._mark_cancelled(task)
+            task.callback(*task.args)
+
+        return len(tasks)
+
+    def _arm_timer(self):
+
+        """
+        Arm asyncio timer for the earliest scheduled task.
+        :return: None
+        """
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+        self._timer = None
+        self._timer_time = None
+
+        # Drop cancelled tasks from the heap top
+        while self._heap and self._heap[0][2].cancelled:
+
+            heapq.heappop(self._heap)
+            self._cancelled_number -= 1
+
+        if not self._heap:
+            return
+
+        self._timer_time = self._heap[0][0]
+        self._timer = self.loop.call_later(max(self._timer_time - time.time(), 0), self._run_expired)
+
+    def _run_expired(self):
+
+        """
+        Call callbacks of all expired tasks and arm timer for the next one.
+        :return: None
+        """
+
+        now = time.time()
+
+        while self._heap and self._heap[0][0] <= now:
+
+            _, _, task = heapq.heappop(self._heap)
+
+            if task.cancelled:
+                self._cancelled_number -= 1
+                continue
+
+            self._remove_from_group(task)
+            task.callback(*task.args)
+
+        self._arm_timer()
@@ -0,0 +1,193 @@
+"""
+Module for periodic deletion of expired players tasks in lazy task expiry mode and closing of tasks expired while the
+server was down.
+"""
+
+
+import time
+import datetime
+import logging
+import threading
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+
+class TaskSweeper:
+
+    """
+    Class to delete expired tasks from players MongoDB documents in bulk. Every task field has sparse index, so
+    one update per task field touches only documents with expired tasks.
+    """
+
+    def __init__(self, players_collection, log_collection, max_tasks, interval, log_ttl=0, index=None,
+                 world_state=None):
+
+        """
+        Instance initialization.
+        :param players_collection: MongoDB players collection
+        :param log_collection: MongoDB log collection
+        :param max_tasks: max number of player's tasks
+        :type max_tasks: int
+        :param interval: delay between sweeps in seconds
+        :type interval: float
+        :param log_ttl: log notes time to live in seconds, 0 to keep log notes forever
+        :type log_ttl: int
+        :param index: in-memory spatial index to delete expired tasks from too
+        :type index: spatial_index.SpatialIndex
+        :param world_state: authoritative in-memory world state to delete expired tasks through instead of the index
+        and MongoDB
+        :type world_state: world_state.WorldState
+        """
+
+        self.players_collection = players_collection
+        self.log_collection = log_collection
+        self.task_ids = [f'Task {i}' for i in range(1, max_tasks + 1)]
+        self.interval = interval
+        self.log_ttl = log_ttl
+        self.index = index
+        self.world_state = world_state
+        self.logger = logging.getLogger(__name__)
+        self._stop_event = threading.Event()
+
+    def create_indexes(self, task_indexes=True):
+
+        """
+        Create task end time indexes and log notes TTL index.
+        :param task_indexes: create task end time indexes, they are needed only if expired tasks are swept
+        :type task_indexes: bool
+        :return: None
+        """
+
+        if task_indexes:
+
+            for task_id in self.task_ids:
+                self.players_collection.create_index([(task_id, ASCENDING)], sparse=True)
+
+        if self.log_ttl:
+            self.log_collection.create_index([('created_at', ASCENDING)], expireAfterSeconds=self.log_ttl)
+
+    def sweep(self, now=None):
+
+        """
+        Delete tasks expired by now from players MongoDB documents and in-memory spatial index or from the world
+        state.
+        :param now: time to compare tasks end time with (Unix timestamp), current time by default
+        :type now: float
+        :return: number of changed documents or deleted tasks of the world state
+        :rtype: int
+        """
+
+        if now is None:
+            now = time.time()
+
+        # World state changes reach MongoDB with snapshots
+        if self.world_state is not None:
+            return self.world_state.drop_expired_tasks(now)
+
+        if self.index is not None and self.index.is_loaded:
+            self.index.drop_expired_tasks(now)
+
+        modified = 0
+
+        for task_id in self.task_ids:
+
+            result = self.players_collection.update_many({task_id: {'$lte': now}}, {'$unset': {task_id: ''}})
+            modified += result.modified_count
+
+        return modified
+
+    def find_expired_tasks(self, now):
+
+        """
+        Find tasks expired by now in in-memory spatial index or in bulk in players MongoDB documents.
+        :param now: time to compare tasks end time with (Unix timestamp)
+        :type now: float
+        :return: list of (player's dict, task id) tuples
+        :rtype: list
+        """
+
+        if self.index is not None and self.index.is_loaded:
+            players = self.index.get_players()
+        else:
+            projection = dict.fromkeys(['x', 'y'] + self.task_ids, 1)
+            players = self.players_collection.find({'$or': [{task_id: {'$lte': now}} for task_id in self.task_ids]},
+                                                   projection)
+
+        return [(player, task_id) for player in players for task_id in self.task_ids
+                if task_id in player and player[task_id] <= now]
+
+    def close_expired_tasks(self, now=None):
+
+        """
+        Close tasks expired while the server was down: delete them in bulk and insert their end log notes in one
+        batch.
+        :param now: time to compare tasks end time with (Unix timestamp), current time by default
+        :type now: float
+        :return: number of closed tasks
+        :rtype: int
+        """
+
+        if now is None:
+            now = time.time()
+
+        expired_tasks = self.find_expired_tasks(now)
+
+        if not expired_tasks:
+            return 0
+
+        self.sweep(now)
+
+        # Make end log notes as tasks assignment does with the time each task has finished at
+        log_notes = [{'player_id': player['_id'],
+                      'x': player['x'],
+                      'y': player['y'],
+                      'task_id': task_id,
+                      'task_status': 0,
+                      'time': player[task_id]} for player, task_id in expired_tasks]
+
+        if self.log_ttl:
+
+            created_at = datetime.datetime.utcnow()
+
+            for log_note in log_notes:
+                log_note['created_at'] = created_at
+
+        self.log_collection.insert_many(log_notes, ordered=False)
+
+        return len(log_notes)
+
+    def run(self):
+
+        """
+        Sweep expired tasks every interval till sweeper is stopped.
+        :return: None
+        """
+
+        while not self._stop_event.wait(self.interval):
+
+            try:
+                self.sweep()
+            except PyMongoError:
+                self.logger.exception('Failed to sweep expired tasks')
+
+    def start(self):
+
+        """
+        Create indexes and start sweeping in new Thread.
+        :return: None
+        """
+
+        # MongoDB is not queried for expired tasks if they are deleted through the world state
+        self.create_indexes(task_indexes=self.world_state is None)
+
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def stop(self):
+
+        """
+        Stop sweeping.
+        :return: None
+        """
+
+        self._stop_event.set()
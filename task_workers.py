@@ -0,0 +1,392 @@
+"""
+Module for sharded players tasks assignment in separate worker processes.
+"""
+
+
+import os
+import queue
+import threading
+import multiprocessing
+from pymongo import MongoClient
+import app
+import logging_master
+from task_assignment import TaskAssigner
+from task_repository import ForwardedTaskRepository
+
+
+def get_player_shard(player_id, shards_number):
+
+    """
+    Get number of the shard player belongs to basing on player's id.
+    :param player_id: player's id
+    :type player_id: bson.ObjectId
+    :param shards_number: number of shards
+    :type shards_number: int
+    :return: shard number
+    :rtype: int
+    """
+
+    return int(str(player_id), 16) % shards_number
+
+
+class SpatialIndexForwarder:
+
+    """
+    Class to forward spatial index updates from worker process to the main process spatial index.
+    """
+
+    is_loaded = False
+
+    def __init__(self, events):
+
+        """
+        Instance initialization.
+        :param events: queue of events for the main process
+        """
+
+        self.events = events
+
+    def update_player(self, player_id, set_fields=None, unset_fields=None):
+
+        """
+        Forward player's document changes to the main process.
+        :param player_id: player's id
+        :param set_fields: fields to set as in MongoDB $set
+        :type set_fields: dict
+        :param unset_fields: fields names to delete as in MongoDB $unset
+        :type unset_fields: iterable
+        :return: None
+        """
+
+        self.events.put(('index', player_id, set_fields, unset_fields))
+
+
+class TaskEventsForwarder:
+
+    """
+    Class to forward tasks events from worker process to the main process tasks events feed.
+    """
+
+    def __init__(self, events):
+
+        """
+        Instance initialization.
+        :param events: queue of events for the main process
+        """
+
+        self.events = events
+
+    def publish(self, player, task_id, task_status):
+
+        """
+        Forward task event to the main process.
+        :param player: player's dict
+        :type player: dict
+        :param task_id: task id
+        :type task_id: str
+        :param task_status: task status - 1 for start, 0 for end
+        :type task_status: int
+        :return: None
+        """
+
+        player = {'_id': player['_id'], 'x': player['x'], 'y': player['y']}
+
+        self.events.put(('task_event', player, task_id, task_status))
+
+
+class PlayerCacheForwarder:
+
+    """
+    Class to forward players lookup cache invalidations from worker process to the main process cache.
+    """
+
+    def __init__(self, events):
+
+        """
+        Instance initialization.
+        :param events: queue of events for the main process
+        """
+
+        self.events = events
+
+    def invalidate(self, player_id):
+
+        """
+        Forward cached player drop to the main process.
+        :param player_id: player's id
+        :return: None
+        """
+
+        self.events.put(('player_cache', player_id))
+
+
+def wait_for_start(commands):
+
+    """
+    Wait for the start command with shard players, players control commands sent before it are applied to the paused
+    players registry.
+    :param commands: queue of control commands from the main process
+    :return: start command arguments or None if worker is stopped before the start
+    :rtype: tuple
+    """
+
+    while True:
+
+        command, argument = commands.get()
+
+        if command == 'start':
+            return argument
+        elif command == 'stop':
+            return None
+        elif command == 'pause':
+            TaskAssigner.pause_player(argument)
+        elif command == 'resume':
+            TaskAssigner.resume_player(argument)
+
+
+def run_task_worker(shard, commands, events):
+
+    """
+    Worker process function to assign tasks for shard players and execute control commands. Worker is forked before
+    the main process starts any threads and gets shard players with the start command.
+    :param shard: shard number
+    :type shard: int
+    :param commands: queue of control commands from the main process
+    :param events: queue of events for the main process
+    :return: None
+    """
+
+    start = wait_for_start(commands)
+
+    if start is None:
+        os._exit(0)
+
+    players, keep_world_state, cache_players = start
+
+    # Use own MongoDB connection, connections of the main process are not fork-safe
+    mongo_client = MongoClient(app.app.config['MONGODB_HOST'], app.app.config['MONGODB_PORT'],
+                               maxPoolSize=app.app.config['MONGODB_MAX_POOL_SIZE'])
+    database = mongo_client[app.app.config['DATABASE_NAME']]
+
+    # World state is kept by the main process and gets tasks changes through forwarded spatial index updates, so
+    # tasks changes are not written by the worker
+    repository = None
+
+    if keep_world_state:
+        repository = ForwardedTaskRepository(database[app.app.config['LOG_COLLECTION']],
+                                             app.app.config['WRITE_BUFFER_SIZE'],
+                                             app.app.config['WRITE_BUFFER_INTERVAL'])
+
+    # Forward tasks changes to the main process spatial index, tasks events feed and players cache
+    app.world_state = None
+    app.spatial_index = SpatialIndexForwarder(events)
+    app.task_events = TaskEventsForwarder(events)
+    app.player_cache = PlayerCacheForwarder(events) if cache_players else None
+
+    # Global tasks starts limit is split between workers
+    task_assigner = TaskAssigner(database[app.app.config['PLAYERS_COLLECTION']],
+                                 database[app.app.config['LOG_COLLECTION']], logger_name=f'world_events_{shard}',
+                                 repository=repository,
+                                 start_rate=app.app.config['TASK_START_RATE'] / app.app.config['TASK_WORKERS'])
+    task_assigner.start_task_assignment(players)
+
+    while True:
+
+        # Wait for control command and report status every config.TASK_WORKERS_STATUS_INTERVAL seconds
+        try:
+            command, player_id = commands.get(timeout=app.app.config['TASK_WORKERS_STATUS_INTERVAL'])
+        except queue.Empty:
+            command, player_id = None, None
+
+        if command == 'stop':
+            break
+        elif command == 'pause':
+            TaskAssigner.pause_player(player_id, task_assigner)
+        elif command == 'resume':
+            TaskAssigner.resume_player(player_id)
+
+        status = {'shard': shard,
+                  'pid': os.getpid(),
+                  'players': len(players),
+                  'scheduled_tasks': len(task_assigner.scheduler),
+                  'start_rate': task_assigner.get_start_rate(),
+                  'paused_players': TaskAssigner.get_paused_players_number()}
+
+        events.put(('status', shard, status))
+
+    # Drain tasks assignment, write everything buffered and queued log records and leave, os._exit skips atexit calls
+    task_assigner.stop(app.app.config['SHUTDOWN_TIMEOUT'])
+    logging_master.stop_log_writers()
+    os._exit(0)
+
+
+class TaskWorkersPool:
+
+    """
+    Class to run players tasks assignment in several worker processes. Workers are forked before the main process
+    starts any threads, players are split between workers by id when the world is booted, every worker runs its own
+    asyncio loop with its own MongoDB connection.
+    """
+
+    def __init__(self, workers_number):
+
+        """
+        Instance initialization.
+        :param workers_number: number of worker processes
+        :type workers_number: int
+        """
+
+        # Raise value error if there are no workers
+        if workers_number < 1:
+            raise ValueError('Number of task workers must be positive!')
+
+        # Worker processes inherit app state, so fork start method is required
+        try:
+            self.context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise RuntimeError('Sharded tasks assignment requires fork start method, set TASK_WORKERS to 0!')
+
+        self.workers_number = workers_number
+        self.workers = []
+        self.commands = []
+        self.events = self.context.Queue()
+        # Shard number to last reported worker status mapping
+        self.statuses = {}
+
+    def fork(self):
+
+        """
+        Start worker processes waiting for their players. Must be called before the process starts any threads.
+        :return: None
+        """
+
+        for shard in range(self.workers_number):
+
+            commands = self.context.Queue()
+            worker = self.context.Process(target=run_task_worker, args=(shard, commands, self.events), daemon=True)
+            worker.start()
+
+            self.commands.append(commands)
+            self.workers.append(worker)
+
+    def start(self, players, keep_world_state=False, cache_players=False):
+
+        """
+        Split players between shards and send them to the forked worker processes.
+        :param players: MongoDB collection cursor for players
+        :param keep_world_state: world state is kept by the main process, so workers do not write tasks changes
+        :type keep_world_state: bool
+        :param cache_players: players are cached by the main process, so workers forward cached players drops
+        :type cache_players: bool
+        :return: None
+        """
+
+        shards = [[] for _ in range(self.workers_number)]
+
+        for player in players:
+            shards[get_player_shard(player['_id'], self.workers_number)].append(player)
+
+        for commands, shard_players in zip(self.commands, shards):
+            commands.put(('start', (shard_players, keep_world_state, cache_players)))
+
+        # Start thread to handle events from workers
+        thread = threading.Thread(target=self.handle_events, daemon=True)
+        thread.start()
+
+    def handle_event(self, event):
+
+        """
+        Apply spatial index update, publish task event, drop cached player or save status reported by worker.
+        :param event: event tuple with event kind first
+        :type event: tuple
+        :return: None
+        """
+
+        if event[0] == 'index' and app.world_state is not None:
+            app.world_state.record_change(*event[1:])
+        elif event[0] == 'index':
+            app.spatial_index.update_player(*event[1:])
+        elif event[0] == 'task_event':
+            app.task_events.publish(*event[1:])
+        elif event[0] == 'player_cache' and app.player_cache is not None:
+            app.player_cache.invalidate(event[1])
+        elif event[0] == 'status':
+            self.statuses[event[1]] = event[2]
+
+    def handle_events(self):
+
+        """
+        Handle events reported by workers.
+        :return: None
+        """
+
+        while True:
+            self.handle_event(self.events.get())
+
+    def get_start_rate(self):
+
+        """
+        Get achieved tasks starts rate of all workers from their last reported statuses.
+        :return: tasks starts per second
+        :rtype: float
+        """
+
+        return sum(status.get('start_rate', 0) for status in list(self.statuses.values()))
+
+    def control_player(self, player_id, control):
+
+        """
+        Pause or resume player's tasks in the worker process of the player.
+        :param player_id: player's id
+        :param control: control trigger - 0 to stop all current tasks, 1 to start new tasks
+        :type control: int
+        :return: None
+        """
+
+        # Keep paused players in the main process too to count them
+        if control:
+            TaskAssigner.resume_player(player_id)
+        else:
+            TaskAssigner.pause_player(player_id)
+
+        command = 'resume' if control else 'pause'
+        self.commands[get_player_shard(player_id, self.workers_number)].put((command, player_id))
+
+    def get_statuses(self):
+
+        """
+        Get workers statuses.
+        :return: list of workers statuses
+        :rtype: list
+        """
+
+        statuses = []
+
+        for shard, worker in enumerate(self.workers):
+
+            status = dict(self.statuses.get(shard, {'shard': shard, 'pid': worker.pid}))
+            status['alive'] = worker.is_alive()
+            statuses.append(status)
+
+        return statuses
+
+    def stop(self, timeout=None):
+
+        """
+        Stop all worker processes, workers which are not stopped in time are terminated.
+        :param timeout: max time to wait for every worker process in seconds, None to wait till it stops
+        :type timeout: float
+        :return: None
+        """
+
+        for commands in self.commands:
+            commands.put(('stop', None))
+
+        for worker in self.workers:
+
+            worker.join(timeout)
+
+            # Terminate stuck worker, its buffered writes are lost
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
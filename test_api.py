@@ -5,6 +5,7 @@ Module for testing flask application api basing on unittest.
 
 import unittest
 import config
+from serializers import msgpack
 
 
 # Set minimal server config
@@ -61,6 +62,40 @@ class TestFlaskApi(unittest.TestCase):
 
         self.assertEqual(status_code, 200)
 
+    def test_health_page(self):
+
+        """
+        Test liveness check.
+        """
+
+        response = self.app.get('/health')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_ready_page(self):
+
+        """
+        Test readiness check of the seeded world.
+        """
+
+        response = self.app.get('/ready')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_json()['ready'])
+        self.assertEqual(response.get_json()['boot']['stage'], 'ready')
+
+    def test_metrics_page(self):
+
+        """
+        Test metrics page in Prometheus text format.
+        """
+
+        self.app.get(f'/api/get_player?player_id={self.player_id}')
+        response = self.app.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('game_api_requests_total{endpoint="getplayer",code="200"}', response.get_data(as_text=True))
+
     def test_get_player_api(self):
 
         """
@@ -72,6 +107,19 @@ class TestFlaskApi(unittest.TestCase):
 
         self.assertEqual(status_code, 200)
 
+    def test_get_player_max_players_api(self):
+
+        """
+        Test Get one player info api with limited visible players.
+        """
+
+        response = self.app.get(f'/api/get_player?player_id={self.player_id}&max_players=1&fields=x')
+        visible_players = response.get_json()['visible_players']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(visible_players), 1)
+        self.assertNotIn(self.player_id, [player['_id'] for player in visible_players])
+
     def test_get_players_api(self):
 
         """
@@ -83,6 +131,113 @@ class TestFlaskApi(unittest.TestCase):
 
         self.assertEqual(status_code, 200)
 
+    def test_get_players_pagination_api(self):
+
+        """
+        Test Get batch of players info api pages continuation.
+        """
+
+        first_page = self.app.get(f'/api/get_players?limit=1').get_json()
+        response = self.app.get(f'/api/get_players?limit=1&after={first_page["next_after"]}')
+        second_page = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(second_page['players'][0]['_id'], first_page['players'][0]['_id'])
+
+    @unittest.skipIf(msgpack is None or not config.MSGPACK_OUTPUT, 'MessagePack output is not available')
+    def test_get_players_msgpack_api(self):
+
+        """
+        Test Get batch of players info api with MessagePack accepted.
+        """
+
+        response = self.app.get(f'/api/get_players?limit=1', headers={'Accept': 'application/x-msgpack'})
+        players_page = msgpack.unpackb(response.data, raw=False)
+        json_page = self.app.get(f'/api/get_players?limit=1').get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-msgpack')
+        self.assertEqual(len(players_page['players']), 1)
+        self.assertEqual(players_page['players'][0]['_id'], json_page['players'][0]['_id'])
+
+    def test_get_players_wrong_after_api(self):
+
+        """
+        Test Get batch of players info api with invalid last player's id.
+        """
+
+        response = self.app.get(f'/api/get_players?after=wrong')
+        status_code = response.status_code
+
+        self.assertEqual(status_code, 400)
+
+    def test_get_players_stream_api(self):
+
+        """
+        Test Get batch of players info api in stream mode.
+        """
+
+        response = self.app.get(f'/api/get_players?fields=x&stream=1')
+        lines = response.get_data(as_text=True).splitlines()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(lines), app.app.config['PLAYERS_NUMBER'])
+
+    def test_tasks_stats_api(self):
+
+        """
+        Test Tasks statistics api.
+        """
+
+        response = self.app.get(f'/api/tasks_stats?within=10')
+        histogram = response.get_json()['active_tasks_histogram']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(histogram), app.app.config['PLAYERS_NUMBER'])
+
+    def test_get_players_batch_api(self):
+
+        """
+        Test Get many players with visible areas api.
+        """
+
+        response = self.app.get(f'/api/get_players_batch?player_id={self.player_id}&player_id=wrong&center=5,5')
+        result = response.get_json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(result['players']), 1)
+        self.assertEqual(len(result['areas']), 1)
+        self.assertEqual(result['wrong_player_ids'], ['wrong'])
+
+    def test_get_players_batch_wrong_center_api(self):
+
+        """
+        Test Get many players with visible areas api with wrong center.
+        """
+
+        response = self.app.get('/api/get_players_batch?center=5')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_cache_stats_api(self):
+
+        """
+        Test Cache statistics api.
+        """
+
+        # The second request for the same area is served from the cache
+        self.app.get(f'/api/get_player?player_id={self.player_id}')
+        self.app.get(f'/api/get_player?player_id={self.player_id}')
+
+        response = self.app.get('/api/cache_stats')
+        area_cache = response.get_json()['area_cache']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('player_cache', response.get_json())
+
+        if area_cache is not None:
+            self.assertGreaterEqual(area_cache['hits']['area'], 1)
+
     def test_tasks_control_0_api(self):
 
         """
@@ -105,6 +260,19 @@ class TestFlaskApi(unittest.TestCase):
 
         self.assertEqual(status_code, 200)
 
+    def test_area_feed_api(self):
+
+        """
+        Test Visible area feed api snapshot and waiting for events.
+        """
+
+        snapshot = self.app.get(f'/api/area_feed?player_id={self.player_id}&x=0&y=0').get_json()
+        response = self.app.get(f'/api/area_feed?player_id={self.player_id}&x=0&y=0&timeout=0'
+                                f'&version={snapshot["version"]}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(snapshot['reset'], 1)
+
     def test_visible_area_log_1_control(self):
 
         """
@@ -116,6 +284,18 @@ class TestFlaskApi(unittest.TestCase):
 
         self.assertEqual(status_code, 200)
 
+    def test_visible_area_log_stop_area_control(self):
+
+        """
+        Test Visible area log control api stopping one area by id.
+        """
+
+        started = self.app.get(f'/api/area_log?player_id={self.player_id}&control=1&x=0&y=0').get_json()
+        response = self.app.get(f'/api/area_log?area_id={started["area_id"]}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['stopped_areas'], 1)
+
     def test_visible_area_log_0_control(self):
 
         """
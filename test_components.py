@@ -0,0 +1,1309 @@
+"""
+Module for testing server components which work without MongoDB server basing on unittest.
+"""
+
+
+import os
+import sys
+import time
+import tempfile
+import asyncio
+import json
+import types
+import unittest
+import logging
+import queue
+import threading
+import datetime
+import bson
+from flask import Flask
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from spatial_index import SpatialIndex
+from task_events import TaskEventFeed
+
+
+# Components read config and in-memory views through the app module, light app module without MongoDB connection is
+# used if the server is not booted by other tests
+if 'app' not in sys.modules:
+
+    app_module = types.ModuleType('app')
+    app_module.app = Flask('app')
+    app_module.app.config.from_object('config')
+    app_module.spatial_index = SpatialIndex(app_module.app.config['SPATIAL_INDEX_CELL_SIZE'])
+    app_module.task_events = TaskEventFeed(app_module.app.config['TASK_EVENTS_BUFFER'])
+    app_module.player_cache = None
+    app_module.world_state = None
+    sys.modules['app'] = app_module
+
+
+import app
+from task_assignment import TaskAssigner
+from task_repository import InMemoryTaskRepository
+from task_sweeper import TaskSweeper
+from task_arrivals import ArrivalModel, TokenBucket, RateMeter
+from task_scheduler import TaskScheduler
+from pause_registry import PauseRegistry
+from world_state import WorldState
+from player_cache import PlayerCache
+from player_table import PlayerTable
+from area_cache import AreaCache
+from serializers import encode_default, get_available_serializers, msgpack
+from write_buffer import WriteBehindBuffer
+from map_vision import AreaLoggingEngine
+from task_workers import SpatialIndexForwarder, TaskEventsForwarder, PlayerCacheForwarder, TaskWorkersPool, \
+    wait_for_start
+
+
+class RecordingCollection:
+
+    """
+    Class for MongoDB collection stand-in which keeps documents in memory and records writes.
+    """
+
+    def __init__(self, documents=()):
+
+        """
+        Instance initialization.
+        :param documents: collection documents
+        :type documents: iterable
+        """
+
+        self.documents = [dict(document) for document in documents]
+        self.updates = []
+        self.inserted = []
+
+    def find(self, *args, **kwargs):
+
+        """
+        Get copies of all documents.
+        :return: list of documents
+        :rtype: list
+        """
+
+        return [dict(document) for document in self.documents]
+
+    def update_many(self, query, update):
+
+        """
+        Record update.
+        :param query: update query
+        :type query: dict
+        :param update: update operators
+        :type update: dict
+        :return: update result
+        """
+
+        self.updates.append((query, update))
+
+        return types.SimpleNamespace(modified_count=0)
+
+    def insert_many(self, documents, ordered=True):
+
+        """
+        Record inserted documents.
+        :param documents: documents to insert
+        :type documents: list
+        :param ordered: perform ordered inserts
+        :type ordered: bool
+        :return: None
+        """
+
+        self.inserted.extend(documents)
+
+
+class FailingCollection(RecordingCollection):
+
+    """
+    Class for MongoDB collection stand-in which records bulk writes and fails the first ones.
+    """
+
+    def __init__(self, failures=0):
+
+        """
+        Instance initialization.
+        :param failures: number of bulk writes to fail
+        :type failures: int
+        """
+
+        super().__init__()
+        self.failures = failures
+        self.bulk_writes = []
+
+    def bulk_write(self, requests, ordered=True):
+
+        """
+        Record bulk write requests or fail.
+        :param requests: write requests
+        :type requests: list
+        :param ordered: perform ordered writes
+        :type ordered: bool
+        :return: None
+        """
+
+        if self.failures:
+            self.failures -= 1
+            raise PyMongoError('bulk write failed')
+
+        self.bulk_writes.append(requests)
+
+
+class RecordingTaskRepository(InMemoryTaskRepository):
+
+    """
+    Class for in-memory tasks repository which records tasks writes in order.
+    """
+
+    def __init__(self):
+
+        """
+        Instance initialization.
+        """
+
+        super().__init__()
+        self.calls = []
+
+    async def set_task(self, player_id, task_id, end_time):
+
+        """
+        Async function to record and save player's task.
+        """
+
+        self.calls.append(('set_task', player_id, task_id))
+        await super().set_task(player_id, task_id, end_time)
+
+    async def unset_task(self, player_id, task_id):
+
+        """
+        Async function to record and delete player's task.
+        """
+
+        self.calls.append(('unset_task', player_id, task_id))
+        await super().unset_task(player_id, task_id)
+
+
+class TestTaskRecovery(unittest.TestCase):
+
+    """
+    Test case for resuming tasks saved by the previous server run.
+    """
+
+    def setUp(self):
+
+        """
+        Make players with expired and live tasks.
+        """
+
+        self.now = time.time()
+        self.players = [{'_id': bson.ObjectId(), 'x': 1, 'y': 1, 'Task 1': self.now - 5, 'Task 2': self.now + 0.2},
+                        {'_id': bson.ObjectId(), 'x': 2, 'y': 2, 'Task 3': self.now - 1}]
+
+    def test_get_live_tasks(self):
+
+        """
+        Test only tasks which are not finished yet are live.
+        """
+
+        self.assertEqual(TaskAssigner.get_live_tasks(self.players[0], self.now), {'Task 2': self.now + 0.2})
+        self.assertEqual(TaskAssigner.get_live_tasks(self.players[1], self.now), {})
+
+    def test_close_expired_tasks(self):
+
+        """
+        Test expired tasks are unset in bulk and get one end log note each with their end time.
+        """
+
+        players_collection = RecordingCollection(self.players)
+        log_collection = RecordingCollection()
+        index = SpatialIndex(16)
+        index.load(players_collection)
+        sweeper = TaskSweeper(players_collection, log_collection, 4, 30, index=index)
+
+        closed_tasks = sweeper.close_expired_tasks(self.now)
+
+        self.assertEqual(closed_tasks, 2)
+        self.assertEqual(len(players_collection.updates), 4)
+        self.assertIn(({'Task 1': {'$lte': self.now}}, {'$unset': {'Task 1': ''}}), players_collection.updates)
+        self.assertEqual(sorted((log_note['task_id'], log_note['time']) for log_note in log_collection.inserted),
+                         [('Task 1', self.now - 5), ('Task 3', self.now - 1)])
+        self.assertEqual({log_note['task_status'] for log_note in log_collection.inserted}, {0})
+        self.assertNotIn('Task 1', index.get_player(self.players[0]['_id']))
+        self.assertIn('Task 2', index.get_player(self.players[0]['_id']))
+
+    def test_resume_live_tasks(self):
+
+        """
+        Test live task is re-armed without write and finished at its saved end time.
+        """
+
+        player = {key: value for key, value in self.players[0].items() if key != 'Task 1'}
+        repository = RecordingTaskRepository()
+        task_assigner = TaskAssigner(None, None, repository=repository)
+
+        task_assigner.start_task_assignment([player])
+
+        try:
+            time.sleep(0.1)
+            self.assertEqual(repository.calls, [])
+            self.assertEqual(len(task_assigner.scheduler), 1)
+
+            time.sleep(0.3)
+            self.assertEqual(repository.calls[0], ('unset_task', player['_id'], 'Task 2'))
+        finally:
+            task_assigner.stop(5)
+
+
+class TestWorldState(unittest.TestCase):
+
+    """
+    Test case for authoritative in-memory world state changes.
+    """
+
+    def setUp(self):
+
+        """
+        Make world state with one player and change log in temporary directory.
+        """
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.index = SpatialIndex(16)
+        self.world_state = WorldState(self.index, None, os.path.join(self.directory.name, 'world_changes.log'), 60)
+        self.player_id = bson.ObjectId()
+        self.index.add_player({'_id': self.player_id, 'x': 1, 'y': 1, 'Task 1': 5, 'Task 2': 20})
+
+    def tearDown(self):
+
+        """
+        Close change log and drop temporary directory.
+        """
+
+        if self.world_state._change_log is not None:
+            self.world_state._change_log.close()
+
+        self.directory.cleanup()
+
+    def read_changes(self):
+
+        """
+        Read changes from the change log file.
+        :return: list of changes
+        :rtype: list
+        """
+
+        self.world_state.flush_change_log()
+
+        with open(self.world_state.change_log_path, 'r') as file:
+            return [json.loads(line) for line in file]
+
+    def test_drop_expired_tasks(self):
+
+        """
+        Test only expired tasks are dropped and the drop is logged.
+        """
+
+        self.assertEqual(self.world_state.drop_expired_tasks(10), 1)
+        self.assertEqual(self.index.get_player(self.player_id), {'_id': self.player_id, 'x': 1, 'y': 1, 'Task 2': 20})
+        self.assertEqual([change['unset'] for change in self.read_changes()], [['Task 1']])
+
+    def test_drop_restarted_task(self):
+
+        """
+        Test task started again with the same id after it was found expired is kept.
+        """
+
+        get_expired_tasks = self.index.get_expired_tasks
+
+        def get_expired_tasks_and_restart(now):
+
+            expired_tasks = get_expired_tasks(now)
+            # Task is started again by the tasks loop before the sweeper drops it
+            self.world_state.record_change(self.player_id, set_fields={'Task 1': 30})
+
+            return expired_tasks
+
+        self.index.get_expired_tasks = get_expired_tasks_and_restart
+
+        self.assertEqual(self.world_state.drop_expired_tasks(10), 0)
+        self.assertEqual(self.index.get_player(self.player_id)['Task 1'], 30)
+        self.assertEqual([change['unset'] for change in self.read_changes()], [[]])
+
+
+class TestPlayerCache(unittest.TestCase):
+
+    """
+    Test case for cache of players looked up by ids.
+    """
+
+    def setUp(self):
+
+        """
+        Make player to cache.
+        """
+
+        self.player = {'_id': bson.ObjectId(), 'x': 1, 'y': 2, 'Task 1': 10}
+        self.player_id = str(self.player['_id'])
+
+    def test_put_get(self):
+
+        """
+        Test found players and wrong ids are cached, copies are returned.
+        """
+
+        cache = PlayerCache(10, 30, 5)
+        cache.put(self.player_id, self.player)
+        cache.put('wrong', None)
+
+        found, player = cache.get(self.player_id)
+        player['Task 2'] = 20
+
+        self.assertTrue(found)
+        self.assertEqual(cache.get(self.player_id), (True, self.player))
+        self.assertEqual(cache.get('wrong'), (True, None))
+        self.assertEqual(cache.get(str(bson.ObjectId())), (False, None))
+
+    def test_invalidated_lookup(self):
+
+        """
+        Test lookup which started before player's drop is not cached.
+        """
+
+        cache = PlayerCache(10, 30, 5)
+        version = cache.get_version(self.player_id)
+
+        # Player's tasks are changed and the player is dropped while the lookup reads the old document
+        cache.invalidate(self.player['_id'])
+        cache.put(self.player_id, self.player, version)
+
+        self.assertEqual(cache.get(self.player_id), (False, None))
+
+        cache.put(self.player_id, self.player, cache.get_version(self.player_id))
+
+        self.assertEqual(cache.get(self.player_id), (True, self.player))
+
+    def test_cached_fields(self):
+
+        """
+        Test only specified fields of players are cached.
+        """
+
+        cache = PlayerCache(10, 30, 5, fields=('_id', 'x', 'y'))
+        cache.put(self.player_id, self.player)
+
+        self.assertEqual(cache.get(self.player_id), (True, {'_id': self.player['_id'], 'x': 1, 'y': 2}))
+
+
+class TestPlayerTable(unittest.TestCase):
+
+    """
+    Test case for columnar players table queries.
+    """
+
+    def setUp(self):
+
+        """
+        Make table with players having expired, expiring and later tasks.
+        """
+
+        self.table = PlayerTable(4)
+        self.table.load([{'_id': 1, 'x': 0, 'y': 0, 'Task 1': 95, 'Task 2': 105},
+                         {'_id': 2, 'x': 5, 'y': 5, 'Task 1': 110, 'Task 3': 200},
+                         {'_id': 3, 'x': 9, 'y': 9}])
+
+    def test_count_expiring_tasks(self):
+
+        """
+        Test only tasks ending within the next seconds are counted, expired ones which are not swept are skipped.
+        """
+
+        self.assertEqual(self.table.count_expiring_tasks(10, now=100), 2)
+        self.assertEqual(self.table.count_expiring_tasks(0, now=100), 0)
+
+        self.table.set_task(2, 'Task 1', None)
+
+        self.assertEqual(self.table.count_expiring_tasks(10, now=100), 1)
+
+    def test_area_players(self):
+
+        """
+        Test area mask and ids include players on the area border and skip players outside.
+        """
+
+        self.assertEqual(self.table.get_area_mask((0, 5, 0, 5)).tolist(), [True, True, False])
+        self.assertEqual(self.table.get_area_players_ids((5, 9, 5, 9)), [2, 3])
+        self.assertEqual(self.table.get_area_players_ids((1, 4, 1, 4)), [])
+
+        self.table.add_player(3, 2, 2)
+        self.table.add_player(4, 3, 3)
+
+        self.assertEqual(self.table.get_area_players_ids((1, 4, 1, 4)), [3, 4])
+
+    def test_active_tasks(self):
+
+        """
+        Test active mask marks set tasks only and histogram counts players by number of active tasks.
+        """
+
+        self.assertEqual(self.table.get_active_mask().tolist(), [[True, True, False, False],
+                                                                 [True, False, True, False],
+                                                                 [False, False, False, False]])
+        self.assertEqual(self.table.get_active_tasks_histogram(), [1, 0, 2, 0, 0])
+
+        self.table.set_task(1, 'Task 2', None)
+        self.table.set_task(3, 'Task 4', 300)
+        self.table.set_task(3, 'Task 5', 300)
+
+        self.assertEqual(self.table.get_active_tasks_histogram(), [0, 2, 1, 0, 0])
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+
+    """
+    Test case for write-behind buffering of players updates and log notes.
+    """
+
+    def make_buffer(self, failures=0):
+
+        """
+        Make buffer which is flushed by the test only.
+        :param failures: number of bulk writes to fail
+        :type failures: int
+        :return: write-behind buffer
+        :rtype: WriteBehindBuffer
+        """
+
+        write_buffer = WriteBehindBuffer(FailingCollection(failures), RecordingCollection(), 1000, 3600)
+        self.addCleanup(write_buffer.close)
+
+        return write_buffer
+
+    def test_coalescing(self):
+
+        """
+        Test updates of the same player are coalesced with the last write winning for every field.
+        """
+
+        write_buffer = self.make_buffer()
+        write_buffer.set_fields(1, {'Task 1': 10, 'Task 2': 20})
+        write_buffer.unset_fields(1, ['Task 1'])
+        write_buffer.set_fields(2, {'Task 1': 30})
+        write_buffer.unset_fields(2, ['Task 1'])
+        write_buffer.set_fields(2, {'Task 1': 40})
+
+        write_buffer.flush()
+
+        self.assertEqual(write_buffer.players_collection.bulk_writes,
+                         [[UpdateOne({'_id': 1}, {'$set': {'Task 2': 20}, '$unset': {'Task 1': ''}}),
+                           UpdateOne({'_id': 2}, {'$set': {'Task 1': 40}})]])
+
+    def test_requeue_after_failure(self):
+
+        """
+        Test failed batch and its log notes are written again before newer ones, newer values win.
+        """
+
+        write_buffer = self.make_buffer(failures=1)
+        write_buffer.set_fields(1, {'Task 1': 10, 'Task 2': 20})
+        write_buffer.add_log_note({'note': 1})
+
+        with self.assertRaises(PyMongoError):
+            write_buffer.flush()
+
+        write_buffer.unset_fields(1, ['Task 2'])
+        write_buffer.set_fields(2, {'Task 1': 30})
+        write_buffer.add_log_note({'note': 2})
+
+        write_buffer.flush()
+
+        self.assertEqual(write_buffer.players_collection.bulk_writes,
+                         [[UpdateOne({'_id': 1}, {'$set': {'Task 1': 10}, '$unset': {'Task 2': ''}}),
+                           UpdateOne({'_id': 2}, {'$set': {'Task 1': 30}})]])
+        self.assertEqual(write_buffer.log_collection.inserted, [{'note': 1}, {'note': 2}])
+
+    def test_flushing_thread_survives_errors(self):
+
+        """
+        Test flushing thread keeps writing after unexpected error.
+        """
+
+        write_buffer = WriteBehindBuffer(FailingCollection(), RecordingCollection(), 1, 3600)
+        self.addCleanup(write_buffer.close)
+        insert_many = write_buffer.log_collection.insert_many
+        write_buffer.log_collection.insert_many = lambda documents, ordered=True: 1 / 0
+
+        with self.assertLogs('write_buffer', 'ERROR'):
+            write_buffer.add_log_note({'note': 1})
+            time.sleep(0.1)
+
+        write_buffer.log_collection.insert_many = insert_many
+        write_buffer.add_log_note({'note': 2})
+        time.sleep(0.1)
+
+        self.assertTrue(write_buffer._thread.is_alive())
+        self.assertEqual(write_buffer.log_collection.inserted, [{'note': 2}])
+
+
+class TestAreaLoggingEngine(unittest.TestCase):
+
+    """
+    Test case for logging of several visible areas.
+    """
+
+    def test_logging_survives_errors(self):
+
+        """
+        Test areas are logged again after failed logging.
+        """
+
+        engine = AreaLoggingEngine()
+        engine.logger = logging.getLogger('test_visible_area')
+        logged = []
+
+        def log_areas(areas, db_collection):
+
+            logged.append(sorted(areas))
+
+            if len(logged) == 1:
+                raise PyMongoError('area query failed')
+
+        engine.log_areas = log_areas
+
+        with self.assertLogs('map_vision', 'ERROR'):
+            area_id = engine.start_area((0, 1, 0, 1), None, 0.01)
+            time.sleep(0.1)
+
+        self.assertEqual(engine.stop_area(), 1)
+        self.assertGreater(len(logged), 1)
+        self.assertEqual(logged[-1], [area_id])
+
+
+class TestTaskWorkersEvents(unittest.TestCase):
+
+    """
+    Test case for events forwarded by task worker processes and applied by the main process.
+    """
+
+    def setUp(self):
+
+        """
+        Add player to the main process spatial index and cache, make pool without worker processes.
+        """
+
+        self.player = {'_id': bson.ObjectId(), 'x': 3, 'y': 4}
+        app.spatial_index.add_player(self.player)
+        self.addCleanup(app.spatial_index.remove_player, self.player['_id'])
+
+        player_cache = app.player_cache
+        app.player_cache = PlayerCache(10, 30, 5)
+        self.addCleanup(setattr, app, 'player_cache', player_cache)
+
+        self.events = queue.Queue()
+        self.pool = TaskWorkersPool(1)
+
+    def forward_events(self):
+
+        """
+        Apply all forwarded events in the main process.
+        :return: None
+        """
+
+        while not self.events.empty():
+            self.pool.handle_event(self.events.get())
+
+    def test_forwarded_task_change(self):
+
+        """
+        Test task start forwarded by worker updates spatial index, publishes task event and drops cached player.
+        """
+
+        player_id = self.player['_id']
+        app.player_cache.put(str(player_id), self.player)
+        version = app.task_events.version
+
+        SpatialIndexForwarder(self.events).update_player(player_id, set_fields={'Task 1': 10})
+        TaskEventsForwarder(self.events).publish(dict(self.player, **{'Task 1': 10}), 'Task 1', 1)
+        PlayerCacheForwarder(self.events).invalidate(player_id)
+        self.forward_events()
+
+        self.assertEqual(app.spatial_index.get_player(player_id)['Task 1'], 10)
+        self.assertEqual(app.player_cache.get(str(player_id)), (False, None))
+
+        _, events = app.task_events.wait_area_events((3, 3, 4, 4), version, 0)
+
+        self.assertEqual([(event['player_id'], event['task_id']) for event in events], [(player_id, 'Task 1')])
+
+    def test_status(self):
+
+        """
+        Test reported status is kept by shard.
+        """
+
+        self.pool.handle_event(('status', 0, {'shard': 0, 'start_rate': 2.5}))
+
+        self.assertEqual(self.pool.get_start_rate(), 2.5)
+
+    def test_control_player(self):
+
+        """
+        Test control is applied in the main process and sent to the worker of the player.
+        """
+
+        self.pool.commands = [queue.Queue()]
+        self.addCleanup(TaskAssigner.resume_player, self.player['_id'])
+
+        self.pool.control_player(self.player['_id'], 0)
+
+        self.assertEqual(self.pool.commands[0].get_nowait(), ('pause', self.player['_id']))
+        self.assertEqual(TaskAssigner.get_paused_players_number(), 1)
+
+    def test_control_before_start(self):
+
+        """
+        Test control sent before worker's start is applied to the registry and players come with the start.
+        """
+
+        commands = queue.Queue()
+        self.addCleanup(TaskAssigner.resume_player, self.player['_id'])
+
+        commands.put(('pause', self.player['_id']))
+        commands.put(('start', ([self.player], False, True)))
+
+        self.assertEqual(wait_for_start(commands), ([self.player], False, True))
+        self.assertEqual(TaskAssigner.get_paused_players_number(), 1)
+
+
+class TestTaskEventFeed(unittest.TestCase):
+
+    """
+    Test case for versioned feed of players tasks events.
+    """
+
+    def setUp(self):
+
+        """
+        Make feed keeping three events.
+        """
+
+        self.feed = TaskEventFeed(3)
+        self.player = {'_id': bson.ObjectId(), 'x': 1, 'y': 1}
+
+    def test_wait_timeout(self):
+
+        """
+        Test waiting without new events returns empty list after timeout.
+        """
+
+        self.feed.publish(self.player, 'Task 1', 1)
+        start_time = time.time()
+
+        self.assertEqual(self.feed.wait_area_events((0, 9, 0, 9), 1, 0.1), (1, []))
+        self.assertGreaterEqual(time.time() - start_time, 0.1)
+
+    def test_wait_wakes_on_publish(self):
+
+        """
+        Test waiting subscriber gets area events published by another thread and skips events outside the area.
+        """
+
+        other_player = {'_id': bson.ObjectId(), 'x': 20, 'y': 20}
+        timer = threading.Timer(0.05, lambda: (self.feed.publish(other_player, 'Task 1', 1),
+                                               self.feed.publish(self.player, 'Task 2', 1)))
+        timer.start()
+
+        version, events = self.feed.wait_area_events((0, 9, 0, 9), 0, 5)
+        timer.join()
+
+        # Other player's event may wake the subscriber before the area event is published
+        if not events:
+            version, events = self.feed.wait_area_events((0, 9, 0, 9), version, 5)
+
+        self.assertEqual(version, 2)
+        self.assertEqual([(event['version'], event['task_id']) for event in events], [(2, 'Task 2')])
+
+    def test_events_are_copies(self):
+
+        """
+        Test changes of returned events do not change events kept by the feed.
+        """
+
+        self.feed.publish(self.player, 'Task 1', 1)
+
+        events = self.feed.wait_area_events((0, 9, 0, 9), 0, 0)[1]
+        events[0]['task_id'] = 'Changed'
+
+        self.assertEqual(self.feed.wait_area_events((0, 9, 0, 9), 0, 0)[1][0]['task_id'], 'Task 1')
+
+    def test_old_version(self):
+
+        """
+        Test versions older than kept events and unknown versions are reported with None events.
+        """
+
+        for number in range(5):
+            self.feed.publish(self.player, f'Task {number}', 1)
+
+        self.assertEqual(self.feed.wait_area_events((0, 9, 0, 9), 0, 0), (5, None))
+        self.assertEqual(self.feed.wait_area_events((0, 9, 0, 9), 9, 0), (5, None))
+        self.assertEqual(len(self.feed.wait_area_events((0, 9, 0, 9), 2, 0)[1]), 3)
+
+
+class TestSerializers(unittest.TestCase):
+
+    """
+    Test case for api responses serializers.
+    """
+
+    def test_encode_default(self):
+
+        """
+        Test ObjectIds and datetimes are encoded as strings which can be decoded back and other types are rejected.
+        """
+
+        player_id = bson.ObjectId()
+        created_at = datetime.datetime(2020, 1, 2, 3, 4, 5, 6000)
+
+        self.assertEqual(bson.ObjectId(encode_default(player_id)), player_id)
+        self.assertEqual(datetime.datetime.fromisoformat(encode_default(created_at)), created_at)
+
+        with self.assertRaises(TypeError):
+            encode_default(object())
+
+    def test_backends_round_trip(self):
+
+        """
+        Test every installed backend encodes ObjectIds and datetimes the same way.
+        """
+
+        player_id = bson.ObjectId()
+        created_at = datetime.datetime(2020, 1, 2, 3, 4, 5, 6000)
+        data = {'players': [{'_id': player_id, 'x': 1, 'y': 2}], 'created_at': created_at}
+        expected = {'players': [{'_id': str(player_id), 'x': 1, 'y': 2}], 'created_at': created_at.isoformat()}
+
+        for name, serializer in get_available_serializers().items():
+
+            encoded = serializer.dumps(data)
+            decoded = msgpack.unpackb(encoded) if name == 'msgpack' else json.loads(encoded)
+
+            self.assertEqual(decoded, expected, name)
+            self.assertEqual(bson.ObjectId(decoded['players'][0]['_id']), player_id, name)
+            self.assertEqual(datetime.datetime.fromisoformat(decoded['created_at']), created_at, name)
+
+
+class TestTaskArrivals(unittest.TestCase):
+
+    """
+    Test case for tasks arrival delays, tasks starts limit and starts rate measurement.
+    """
+
+    def test_immediate_arrivals(self):
+
+        """
+        Test immediate tasks start without delay.
+        """
+
+        self.assertEqual(ArrivalModel('immediate').get_start_delays(3), [0, 0, 0])
+
+    def test_jitter_arrivals(self):
+
+        """
+        Test jittered tasks start within jitter.
+        """
+
+        delays = ArrivalModel('jitter', jitter=5).get_start_delays(1000)
+
+        self.assertEqual(len(delays), 1000)
+        self.assertTrue(all(0 <= delay <= 5 for delay in delays))
+
+    def test_poisson_arrivals(self):
+
+        """
+        Test poisson tasks start one after another with mean gap close to mean interval.
+        """
+
+        delays = ArrivalModel('poisson', mean_interval=2).get_start_delays(5000)
+        gaps = [delay - previous_delay for previous_delay, delay in zip([0] + delays, delays)]
+
+        self.assertTrue(all(gap > 0 for gap in gaps))
+        self.assertAlmostEqual(sum(gaps) / len(gaps), 2, delta=0.2)
+
+    def test_unknown_arrivals(self):
+
+        """
+        Test unknown arrivals kind is rejected.
+        """
+
+        with self.assertRaises(ValueError):
+            ArrivalModel('burst')
+
+    def test_token_bucket_burst(self):
+
+        """
+        Test starts over the burst wait for tokens refilled at the rate.
+        """
+
+        bucket = TokenBucket(rate=100, burst=5)
+
+        async def acquire_all():
+
+            for _ in range(15):
+                await bucket.acquire()
+
+        start_time = time.monotonic()
+        asyncio.run(acquire_all())
+        elapsed = time.monotonic() - start_time
+
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 0.5)
+
+    def test_token_bucket_cancel(self):
+
+        """
+        Test cancelled start gives its token back.
+        """
+
+        bucket = TokenBucket(rate=10, burst=1)
+
+        async def cancel_waiting():
+
+            await bucket.acquire()
+            waiting = asyncio.ensure_future(bucket.acquire())
+            await asyncio.sleep(0.01)
+            waiting.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+
+        asyncio.run(cancel_waiting())
+
+        self.assertGreater(bucket.tokens, -0.5)
+
+    def test_rate_meter_window(self):
+
+        """
+        Test rate is counted over whole seconds of the window before the current one.
+        """
+
+        meter = RateMeter(window=10)
+
+        for now in (100.1, 100.5, 100.9, 101.2, 101.7, 102.3):
+            meter.mark(now)
+
+        self.assertEqual(meter.get_rate(102.5), 0.5)
+        self.assertEqual(meter.get_rate(110.5), 0.6)
+        self.assertEqual(meter.get_rate(111.5), 0.3)
+        self.assertEqual(meter.get_rate(115), 0)
+
+
+class TestTaskScheduler(unittest.TestCase):
+
+    """
+    Test case for calling tasks completion callbacks at the tasks end time.
+    """
+
+    def setUp(self):
+
+        """
+        Make scheduler on new asyncio loop.
+        """
+
+        self.loop = asyncio.new_event_loop()
+        self.scheduler = TaskScheduler(self.loop)
+        self.ended = []
+
+    def tearDown(self):
+
+        """
+        Close asyncio loop.
+        """
+
+        self.loop.close()
+
+    def run_loop(self, seconds):
+
+        """
+        Run asyncio loop for some time.
+        :param seconds: time to run the loop for in seconds
+        :type seconds: float
+        :return: None
+        """
+
+        self.loop.run_until_complete(asyncio.sleep(seconds))
+
+    def test_heap_order(self):
+
+        """
+        Test callbacks are called in end time order, tasks with the same end time in scheduling order.
+        """
+
+        now = time.time()
+
+        for name, end_time in (('third', now + 0.03), ('first', now + 0.01), ('second', now + 0.02),
+                               ('fourth', now + 0.03)):
+            self.scheduler.schedule(end_time, self.ended.append, name)
+
+        self.assertEqual(len(self.scheduler), 4)
+
+        self.run_loop(0.1)
+
+        self.assertEqual(self.ended, ['first', 'second', 'third', 'fourth'])
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_cancel(self):
+
+        """
+        Test cancelled task is not called and can not be cancelled twice.
+        """
+
+        now = time.time()
+        task = self.scheduler.schedule(now + 0.01, self.ended.append, 'cancelled')
+        self.scheduler.schedule(now + 0.02, self.ended.append, 'kept')
+
+        self.assertTrue(self.scheduler.cancel(task))
+        self.assertFalse(self.scheduler.cancel(task))
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.run_loop(0.1)
+
+        self.assertEqual(self.ended, ['kept'])
+
+    def test_group_cancel(self):
+
+        """
+        Test cancelling all group tasks one by one leaves other groups tasks scheduled.
+        """
+
+        now = time.time()
+        tasks = [self.scheduler.schedule(now + 0.01 * i, self.ended.append, f'player 1 task {i}', group='player 1')
+                 for i in range(1, 4)]
+        self.scheduler.schedule(now + 0.02, self.ended.append, 'player 2 task', group='player 2')
+
+        for task in tasks:
+            self.scheduler.cancel(task)
+
+        self.assertEqual(self.scheduler.expire_group('player 1'), 0)
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.run_loop(0.1)
+
+        self.assertEqual(self.ended, ['player 2 task'])
+
+    def test_expire_group(self):
+
+        """
+        Test expired group tasks are called right away and only once.
+        """
+
+        now = time.time()
+
+        for i in range(1, 3):
+            self.scheduler.schedule(now + 10 * i, self.ended.append, f'player 1 task {i}', group='player 1')
+
+        self.scheduler.schedule(now + 0.01, self.ended.append, 'player 2 task', group='player 2')
+
+        self.assertEqual(self.scheduler.expire_group('player 1'), 2)
+        self.assertEqual(sorted(self.ended), ['player 1 task 1', 'player 1 task 2'])
+        self.assertEqual(len(self.scheduler), 1)
+
+        self.run_loop(0.1)
+
+        self.assertEqual(self.ended[2:], ['player 2 task'])
+        self.assertEqual(self.scheduler.expire_group('player 1'), 0)
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    """
+    Test case for in-memory spatial index of players.
+    """
+
+    def setUp(self):
+
+        """
+        Make index with players in several cells.
+        """
+
+        self.index = SpatialIndex(4)
+        self.players = [{'_id': bson.ObjectId(), 'x': x, 'y': y} for x, y in ((0, 0), (3, 3), (4, 4), (9, 1), (7, 7))]
+
+        for player in self.players:
+            self.index.add_player(player)
+
+    def get_area_ids(self, area):
+
+        """
+        Get ids of the index players within area.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: set of players ids
+        :rtype: set
+        """
+
+        return {player['_id'] for player in self.index.get_area_players(area)}
+
+    def test_area_players(self):
+
+        """
+        Test area query returns exactly players within area including partially covered cells.
+        """
+
+        for area in ((0, 3, 0, 3), (3, 4, 3, 4), (0, 9, 0, 9), (5, 6, 5, 6), (2, 9, 1, 4)):
+
+            left_x, right_x, lower_y, upper_y = area
+            expected = {player['_id'] for player in self.players
+                        if left_x <= player['x'] <= right_x and lower_y <= player['y'] <= upper_y}
+
+            self.assertEqual(self.get_area_ids(area), expected)
+
+    def test_update_player(self):
+
+        """
+        Test tasks changes and moves to another cell are applied, unknown players are ignored.
+        """
+
+        player_id = self.players[0]['_id']
+
+        self.index.update_player(player_id, set_fields={'Task 1': 10, 'Task 2': 20}, unset_fields=('Task 2',))
+        self.index.update_player(player_id, set_fields={'x': 8, 'y': 8})
+        self.index.update_player(bson.ObjectId(), set_fields={'Task 1': 10})
+
+        self.assertEqual(self.index.get_player(player_id), {'_id': player_id, 'x': 8, 'y': 8, 'Task 1': 10})
+        self.assertNotIn(player_id, self.get_area_ids((0, 3, 0, 3)))
+        self.assertIn(player_id, self.get_area_ids((8, 8, 8, 8)))
+        self.assertEqual(len(self.index), len(self.players))
+
+    def test_remove_player(self):
+
+        """
+        Test removed player is not found by id, by area or in players pages.
+        """
+
+        player_id = self.players[2]['_id']
+
+        self.index.remove_player(player_id)
+
+        self.assertIsNone(self.index.get_player(player_id))
+        self.assertNotIn(player_id, self.get_area_ids((0, 9, 0, 9)))
+        self.assertNotIn(player_id, [player['_id'] for player in self.index.get_players()])
+        self.assertEqual(len(self.index), len(self.players) - 1)
+
+    def test_players_pages(self):
+
+        """
+        Test players pages are sorted by id and continue after the given id.
+        """
+
+        player_ids = sorted(player['_id'] for player in self.players)
+        first_page = self.index.get_players(limit=2)
+        second_page = self.index.get_players(after=first_page[-1]['_id'], limit=2)
+
+        self.assertEqual([player['_id'] for player in first_page + second_page], player_ids[:4])
+
+    def test_expired_tasks(self):
+
+        """
+        Test only tasks expired by now are found and dropped.
+        """
+
+        self.index.update_player(self.players[0]['_id'], set_fields={'Task 1': 5, 'Task 2': 15})
+        self.index.update_player(self.players[1]['_id'], set_fields={'Task 1': 10})
+
+        self.assertEqual(self.index.get_expired_tasks(10), {self.players[0]['_id']: ['Task 1'],
+                                                            self.players[1]['_id']: ['Task 1']})
+        self.assertEqual(self.index.drop_expired_tasks(10), 2)
+        self.assertEqual(self.index.get_expired_tasks(10), {})
+        self.assertEqual(self.index.get_player(self.players[0]['_id'])['Task 2'], 15)
+
+
+class TestAreaCache(unittest.TestCase):
+
+    """
+    Test case for visible areas players cache invalidation.
+    """
+
+    def setUp(self):
+
+        """
+        Make cache over index with players in several cells.
+        """
+
+        self.index = SpatialIndex(4)
+        self.players = [{'_id': bson.ObjectId(), 'x': x, 'y': y} for x, y in ((0, 0), (3, 3), (4, 4), (9, 1))]
+
+        for player in self.players:
+            self.index.add_player(player)
+
+        self.cache = AreaCache(self.index, 100)
+
+    def get_area_ids(self, area):
+
+        """
+        Get ids of the cached players within area.
+        :param area: area coordinates (left_x, right_x, lower_y, upper_y)
+        :type area: tuple
+        :return: set of players ids
+        :rtype: set
+        """
+
+        return {player['_id'] for player in self.cache.get_area_players(area)}
+
+    def test_cached_area(self):
+
+        """
+        Test area is cached with str ids and served from the cache the second time.
+        """
+
+        expected = {str(player['_id']) for player in self.players[:2]}
+
+        self.assertEqual(self.get_area_ids((0, 3, 0, 3)), expected)
+        self.assertEqual(self.get_area_ids((0, 3, 0, 3)), expected)
+        self.assertEqual(self.cache.get_stats()['hits']['area'], 1)
+
+    def test_invalidate_point(self):
+
+        """
+        Test player's change drops only cell and areas containing the changed point.
+        """
+
+        self.get_area_ids((0, 3, 0, 3))
+        self.get_area_ids((8, 9, 0, 3))
+
+        self.index.update_player(self.players[1]['_id'], set_fields={'x': 2, 'y': 2})
+
+        self.assertNotIn(('cell', (0, 0)), self.cache._entries)
+        self.assertNotIn(('area', (0, 3, 0, 3)), self.cache._entries)
+        self.assertIn(('area', (8, 9, 0, 3)), self.cache._entries)
+
+        players = {player['_id']: player for player in self.cache.get_area_players((0, 3, 0, 3))}
+
+        self.assertEqual((players[str(self.players[1]['_id'])]['x'], players[str(self.players[1]['_id'])]['y']), (2, 2))
+
+    def test_changed_cell_not_cached(self):
+
+        """
+        Test cell players read before the cell change are returned but not cached.
+        """
+
+        version = self.cache._get_version((0, 0))
+
+        self.cache.invalidate_point(1, 1)
+        self.cache.get_cell_players((0, 0), version)
+
+        self.assertNotIn(('cell', (0, 0)), self.cache._entries)
+
+        self.cache.get_cell_players((0, 0), self.cache._get_version((0, 0)))
+
+        self.assertIn(('cell', (0, 0)), self.cache._entries)
+
+    def test_clear_drops_reads_of_unknown_cells(self):
+
+        """
+        Test cell players read before the cache clear are not cached even if the cell was never cached or changed.
+        """
+
+        version = self.cache._get_version((2, 0))
+
+        self.cache.clear()
+        self.cache.get_cell_players((2, 0), version)
+
+        self.assertNotIn(('cell', (2, 0)), self.cache._entries)
+        self.assertEqual(self.get_area_ids((8, 9, 0, 3)), {str(self.players[3]['_id'])})
+        self.assertIn(('cell', (2, 0)), self.cache._entries)
+
+
+class TestPauseRegistry(unittest.TestCase):
+
+    """
+    Test case for paused players registry.
+    """
+
+    def test_pause_resume(self):
+
+        """
+        Test players are paused and resumed once.
+        """
+
+        registry = PauseRegistry()
+
+        self.assertTrue(registry.pause('player 1'))
+        self.assertFalse(registry.pause('player 1'))
+        self.assertIn('player 1', registry)
+        self.assertEqual(len(registry), 1)
+
+        self.assertTrue(registry.resume('player 1'))
+        self.assertFalse(registry.resume('player 1'))
+        self.assertNotIn('player 1', registry)
+        self.assertEqual(len(registry), 0)
+
+    def test_wait_resumed(self):
+
+        """
+        Test coroutine waiting for the player is woken up by resume from another thread.
+        """
+
+        registry = PauseRegistry()
+        loop = asyncio.new_event_loop()
+        registry.bind_loop(loop)
+        registry.pause('player 1')
+
+        async def wait_resumed():
+
+            waiting = asyncio.ensure_future(registry.wait_resumed('player 1'))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiting.done())
+
+            loop.run_in_executor(None, registry.resume, 'player 1')
+            await asyncio.wait_for(waiting, 1)
+
+            # Not paused player is not waited for
+            await asyncio.wait_for(registry.wait_resumed('player 2'), 1)
+
+        try:
+            loop.run_until_complete(wait_resumed())
+        finally:
+            loop.close()
+
+
+class TestInMemoryTaskRepository(unittest.TestCase):
+
+    """
+    Test case for players tasks persistence in memory.
+    """
+
+    def test_tasks_and_log_notes(self):
+
+        """
+        Test tasks are set and deleted, log notes are saved in order.
+        """
+
+        repository = InMemoryTaskRepository()
+
+        async def write():
+
+            await repository.set_task('player 1', 'Task 1', 10)
+            await repository.set_task('player 1', 'Task 2', 20)
+            await repository.unset_task('player 1', 'Task 1')
+            await repository.unset_task('player 2', 'Task 1')
+            await repository.insert_log_note({'task_id': 'Task 1', 'task_status': 1})
+            await repository.insert_log_note({'task_id': 'Task 1', 'task_status': 0})
+
+        asyncio.run(write())
+
+        self.assertEqual(repository.players, {'player 1': {'Task 2': 20}})
+        self.assertEqual([log_note['task_status'] for log_note in repository.log_notes], [1, 0])
+
+    def test_latency(self):
+
+        """
+        Test every operation waits for simulated latency.
+        """
+
+        repository = InMemoryTaskRepository(latency=0.02)
+
+        start_time = time.monotonic()
+        asyncio.run(repository.set_task('player 1', 'Task 1', 10))
+
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.02)
+
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -3,7 +3,9 @@ Module for new world initialization. Includes map creation and random players di
 """
 
 
+import time
 import numpy as np
+from pymongo import ASCENDING
 
 
 class WorldCreator:
@@ -116,17 +118,75 @@ class WorldCreator:
 
             yield {'x': int(coordinates[0]), 'y': int(coordinates[1])}
 
-    def save_world(self, db_collection, world):
+    @staticmethod
+    def make_players_batches(world, batch_size):
+
+        """
+        Make batches of players identities basing on their position on the map (2D array indices).
+        :param world: map with randomly distributed players as 2D array
+        :type world: np.ndarray
+        :param batch_size: max number of players identities in one batch
+        :type batch_size: int
+        :return: generator for lists of player identities
+        """
+
+        # Get all players coordinates as two arrays at once
+        xs, ys = np.where(world)
+
+        for start in range(0, len(xs), batch_size):
+
+            # Convert coordinates slices to python ints in bulk
+            batch_xs = xs[start:start + batch_size].tolist()
+            batch_ys = ys[start:start + batch_size].tolist()
+
+            yield [{'x': x, 'y': y} for x, y in zip(batch_xs, batch_ys)]
+
+    def save_world(self, db_collection, world, batch_size=1000, ordered=True, progress=None, ids=None):
 
         """
-        Save players identities to MongoDB collection
+        Save players identities to MongoDB collection in batches and create players coordinates index.
         :param db_collection: MongoDB collection
         :param world: map with randomly distributed players as 2D array
         :type world: np.ndarray
-        :return: None
+        :param batch_size: number of players inserted with one request
+        :type batch_size: int
+        :param ordered: perform ordered inserts, unordered ones are faster but do not stop on the first error
+        :type ordered: bool
+        :param progress: function to call with number of saved players after every batch
+        :param ids: list to extend with ids of saved players in order of players on the map
+        :type ids: list
+        :return: seeding stats - players number, seconds spent and players per second rate
+        :rtype: dict
         """
 
-        # Use generator to generate player identity and insert it to MongoDB collection
-        for player in self.make_players_identities(world):
+        # Raise value error if batch size is not positive
+        if batch_size < 1:
+            raise ValueError('Seeding batch size must be positive!')
+
+        start_time = time.perf_counter()
+
+        # Create compound index for area queries
+        db_collection.create_index([('x', ASCENDING), ('y', ASCENDING)])
+
+        players_number = 0
+
+        # Insert players identities batch by batch
+        for players in self.make_players_batches(world, batch_size):
+
+            db_collection.insert_many(players, ordered=bool(ordered))
+            players_number += len(players)
+
+            # Inserted players dicts get their ids from the driver
+            if ids is not None:
+                ids.extend(player['_id'] for player in players)
+
+            if progress is not None:
+                progress(players_number)
+
+        seconds = time.perf_counter() - start_time
+
+        seeding_stats = {'players': players_number,
+                         'seconds': round(seconds, 3),
+                         'rows_per_second': round(players_number / seconds) if seconds else players_number}
 
-            db_collection.insert_one(player)
+        return seeding_stats
@@ -0,0 +1,305 @@
+"""
+Module for authoritative in-memory world state persisted with periodic snapshots and append-only change log.
+"""
+
+
+import os
+import json
+import atexit
+import logging
+import threading
+import time
+import bson
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+
+class WorldState:
+
+    """
+    Class for authoritative in-memory world state. Players are kept in the spatial index, every change is appended
+    to the change log file, changed players are periodically saved to MongoDB players collection as a snapshot.
+    On boot the world is recovered from the last snapshot and the changes logged after it.
+    """
+
+    def __init__(self, index, players_collection, change_log_path, snapshot_interval):
+
+        """
+        Instance initialization.
+        :param index: in-memory spatial index to keep players in
+        :type index: spatial_index.SpatialIndex
+        :param players_collection: MongoDB players collection
+        :param change_log_path: change log file path
+        :type change_log_path: str
+        :param snapshot_interval: delay between snapshots in seconds
+        :type snapshot_interval: float
+        """
+
+        self.index = index
+        self.players_collection = players_collection
+        self.change_log_path = change_log_path
+        self.snapshot_interval = snapshot_interval
+        self.logger = logging.getLogger(__name__)
+        self.version = 0
+
+        # Ids of players changed since the last snapshot
+        self._changed_players = set()
+        self._change_log = None
+        # Lock for changes and change log
+        self._lock = threading.Lock()
+        # Lock to take snapshots one after another
+        self._snapshot_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def old_change_log_path(self):
+
+        """
+        Path of the change log being saved with the snapshot.
+        :return: file path
+        :rtype: str
+        """
+
+        return f'{self.change_log_path}.old'
+
+    def replay_change_log(self, path):
+
+        """
+        Apply changes from the change log file to the in-memory world.
+        :param path: change log file path
+        :type path: str
+        :return: number of applied changes
+        :rtype: int
+        """
+
+        if not os.path.exists(path):
+            return 0
+
+        changes_number = 0
+
+        with open(path, 'r') as file:
+
+            for line in file:
+
+                # Skip the last line if it was not written completely
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    continue
+
+                player_id = bson.ObjectId(change['player_id'])
+
+                self.index.update_player(player_id, change['set'], change['unset'])
+                self._changed_players.add(player_id)
+                self.version = max(self.version, change['version'])
+                changes_number += 1
+
+        return changes_number
+
+    def recover(self):
+
+        """
+        Recover the world from the last snapshot and the change log.
+        :return: True if there are players in the world
+        :rtype: bool
+        """
+
+        # Load the last snapshot
+        self.index.load(self.players_collection)
+
+        if not len(self.index):
+            return False
+
+        # Apply changes which could be missed by the last snapshot, applying them twice changes nothing
+        self.replay_change_log(self.old_change_log_path)
+        self.replay_change_log(self.change_log_path)
+
+        return True
+
+    def record_change(self, player_id, set_fields=None, unset_fields=None):
+
+        """
+        Apply player's change to the in-memory world and append it to the change log.
+        :param player_id: player's id
+        :param set_fields: fields to set as in MongoDB $set
+        :type set_fields: dict
+        :param unset_fields: fields names to delete as in MongoDB $unset
+        :type unset_fields: iterable
+        :return: None
+        """
+
+        with self._lock:
+            self._record_change(player_id, set_fields, unset_fields)
+
+    def _record_change(self, player_id, set_fields=None, unset_fields=None):
+
+        """
+        Apply player's change to the in-memory world and append it to the change log. Lock must be acquired by the
+        caller.
+        :param player_id: player's id
+        :param set_fields: fields to set as in MongoDB $set
+        :type set_fields: dict
+        :param unset_fields: fields names to delete as in MongoDB $unset
+        :type unset_fields: iterable
+        :return: None
+        """
+
+        self.version += 1
+
+        change = {'version': self.version,
+                  'player_id': str(player_id),
+                  'set': set_fields or {},
+                  'unset': list(unset_fields or ())}
+
+        if self._change_log is None:
+            self._change_log = open(self.change_log_path, 'a')
+
+        self._change_log.write(json.dumps(change) + '\n')
+        self.index.update_player(player_id, set_fields, unset_fields)
+        self._changed_players.add(player_id)
+
+    def drop_expired_tasks(self, now):
+
+        """
+        Delete tasks expired by now from the in-memory world as logged changes, so snapshots and recovery keep them
+        deleted.
+        :param now: time to compare tasks end time with (Unix timestamp)
+        :type now: float
+        :return: number of deleted tasks
+        :rtype: int
+        """
+
+        dropped = 0
+
+        for player_id in self.index.get_expired_tasks(now):
+
+            with self._lock:
+
+                player = self.index.get_player(player_id)
+
+                if player is None:
+                    continue
+
+                # Check end time again, the task could be started again with the same id after it was found expired
+                task_ids = [task_id for task_id, end_time in player.items()
+                            if task_id not in ('_id', 'x', 'y') and end_time <= now]
+
+                if task_ids:
+                    self._record_change(player_id, unset_fields=task_ids)
+                    dropped += len(task_ids)
+
+        return dropped
+
+    def snapshot(self):
+
+        """
+        Save players changed since the last snapshot to MongoDB players collection and drop change log saved with it.
+        :return: number of saved players
+        :rtype: int
+        """
+
+        with self._snapshot_lock:
+
+            # Start new change log and take changed players
+            with self._lock:
+
+                changed_players, self._changed_players = self._changed_players, set()
+
+                if self._change_log is not None:
+                    self._change_log.close()
+                    self._change_log = None
+
+                # Change log of the failed snapshot is kept till the next snapshot succeeds
+                if os.path.exists(self.change_log_path) and not os.path.exists(self.old_change_log_path):
+                    os.replace(self.change_log_path, self.old_change_log_path)
+
+            requests = []
+
+            for player_id in changed_players:
+
+                player = self.index.get_player(player_id)
+
+                if player is not None:
+                    requests.append(ReplaceOne({'_id': player_id}, player))
+
+            try:
+
+                if requests:
+                    self.players_collection.bulk_write(requests, ordered=False)
+
+            except PyMongoError:
+
+                # Players will be saved with the next snapshot
+                with self._lock:
+                    self._changed_players |= changed_players
+
+                raise
+
+            if os.path.exists(self.old_change_log_path):
+                os.remove(self.old_change_log_path)
+
+            return len(requests)
+
+    def flush_change_log(self):
+
+        """
+        Flush change log file buffer.
+        :return: None
+        """
+
+        with self._lock:
+
+            if self._change_log is not None:
+                self._change_log.flush()
+
+    def run(self):
+
+        """
+        Flush change log every second and take snapshot every snapshot interval.
+        :return: None
+        """
+
+        next_snapshot_time = time.time() + self.snapshot_interval
+
+        while not self._stop_event.wait(1):
+
+            self.flush_change_log()
+
+            if time.time() < next_snapshot_time:
+                continue
+
+            next_snapshot_time = time.time() + self.snapshot_interval
+
+            try:
+                self.snapshot()
+            except PyMongoError:
+                self.logger.exception('Failed to save world snapshot')
+
+    def start(self):
+
+        """
+        Start periodic snapshots in new Thread and take the last snapshot on interpreter exit.
+        :return: None
+        """
+
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+
+        """
+        Stop periodic snapshots and take the last snapshot.
+        :return: None
+        """
+
+        if self._stop_event.is_set():
+            return
+
+        self._stop_event.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.snapshot()
@@ -0,0 +1,256 @@
+"""
+Module for write-behind buffering of MongoDB players updates and log notes.
+"""
+
+
+import atexit
+import logging
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError, BulkWriteError
+import metrics
+
+
+class WriteBehindBuffer:
+
+    """
+    Class to collect players documents updates and log notes and write them to MongoDB in batches from a separate
+    thread. Updates of the same player are coalesced into one request with the last write winning for every field,
+    batches are written one after another, so the order of updates is kept for every player. Failed batches are put
+    back and written again with the next flush.
+    """
+
+    def __init__(self, players_collection, log_collection, max_size, flush_interval):
+
+        """
+        Instance initialization.
+        :param players_collection: MongoDB players collection
+        :param log_collection: MongoDB log collection
+        :param max_size: number of pending writes which triggers flush
+        :type max_size: int
+        :param flush_interval: max delay between flushes in seconds
+        :type flush_interval: float
+        """
+
+        self.players_collection = players_collection
+        self.log_collection = log_collection
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.logger = logging.getLogger(__name__)
+
+        # Player's id to pending $set and $unset fields mapping, dict keeps players order
+        self._updates = {}
+        # Pending log notes
+        self._log_notes = []
+        self._pending_size = 0
+        # Lock for pending writes
+        self._lock = threading.Lock()
+        # Lock to write batches one after another
+        self._flush_lock = threading.Lock()
+        # Event to wake up flushing thread before flush interval ends
+        self._wake_event = threading.Event()
+        self._closed = False
+        # Functions to call with ids of players which updates are written
+        self.flush_listeners = []
+
+        # Start flushing thread and flush everything left on interpreter exit
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _add_pending(self):
+
+        """
+        Count new pending write and wake up flushing thread if buffer is full. Lock must be acquired by the caller.
+        :return: None
+        """
+
+        self._pending_size += 1
+
+        if self._pending_size >= self.max_size:
+            self._wake_event.set()
+
+    def set_fields(self, player_id, fields):
+
+        """
+        Buffer player's document update as MongoDB $set.
+        :param player_id: player's id
+        :param fields: fields to set
+        :type fields: dict
+        :return: None
+        """
+
+        with self._lock:
+
+            update = self._updates.setdefault(player_id, {'$set': {}, '$unset': {}})
+
+            for field, value in fields.items():
+
+                update['$unset'].pop(field, None)
+                update['$set'][field] = value
+
+            self._add_pending()
+
+    def unset_fields(self, player_id, fields):
+
+        """
+        Buffer player's document update as MongoDB $unset.
+        :param player_id: player's id
+        :param fields: fields names to delete
+        :type fields: iterable
+        :return: None
+        """
+
+        with self._lock:
+
+            update = self._updates.setdefault(player_id, {'$set': {}, '$unset': {}})
+
+            for field in fields:
+
+                update['$set'].pop(field, None)
+                update['$unset'][field] = ''
+
+            self._add_pending()
+
+    def add_log_note(self, log_note):
+
+        """
+        Buffer log note insert.
+        :param log_note: log note
+        :type log_note: dict
+        :return: None
+        """
+
+        with self._lock:
+
+            self._log_notes.append(log_note)
+            self._add_pending()
+
+    def _requeue(self, updates, log_notes):
+
+        """
+        Put failed updates and log notes back before pending ones, so pending values written after them win.
+        :param updates: player's id to $set and $unset fields mapping of failed updates
+        :type updates: dict
+        :param log_notes: failed log notes
+        :type log_notes: list
+        :return: None
+        """
+
+        with self._lock:
+
+            pending_updates, self._updates = self._updates, {}
+
+            for player_id, update in updates.items():
+                self._updates[player_id] = {'$set': dict(update['$set']), '$unset': dict(update['$unset'])}
+
+            for player_id, update in pending_updates.items():
+
+                requeued = self._updates.setdefault(player_id, {'$set': {}, '$unset': {}})
+
+                for field, value in update['$set'].items():
+
+                    requeued['$unset'].pop(field, None)
+                    requeued['$set'][field] = value
+
+                for field in update['$unset']:
+
+                    requeued['$set'].pop(field, None)
+                    requeued['$unset'][field] = ''
+
+            self._log_notes = log_notes + self._log_notes
+            self._pending_size += len(updates) + len(log_notes)
+
+    def flush(self):
+
+        """
+        Write all pending updates and log notes to MongoDB. Writes which failed are put back and the error is raised.
+        :return: None
+        """
+
+        with self._flush_lock:
+
+            # Take pending writes and release the lock for new ones
+            with self._lock:
+
+                updates, self._updates = self._updates, {}
+                log_notes, self._log_notes = self._log_notes, []
+                self._pending_size = 0
+
+            requests = []
+
+            for player_id, update in updates.items():
+
+                # MongoDB does not accept empty update operators
+                update = {operator: fields for operator, fields in update.items() if fields}
+                requests.append(UpdateOne({'_id': player_id}, update))
+
+            if requests:
+
+                # Updates are idempotent, so the whole batch is written again if it fails
+                try:
+
+                    with metrics.mongo_seconds.time('bulk_write'):
+                        self.players_collection.bulk_write(requests, ordered=True)
+
+                except PyMongoError:
+                    self._requeue(updates, log_notes)
+                    raise
+
+                for listener in self.flush_listeners:
+                    listener(list(updates))
+
+            if log_notes:
+
+                # Unordered insert writes all the notes it can, notes inserted before the failure have ids and are
+                # skipped as duplicates when they are inserted again
+                try:
+
+                    with metrics.mongo_seconds.time('insert_many'):
+                        self.log_collection.insert_many(log_notes, ordered=False)
+
+                except BulkWriteError as error:
+                    failed = {write_error['index'] for write_error in error.details.get('writeErrors', [])
+                              if write_error.get('code') != 11000}
+                    self._requeue({}, [log_note for i, log_note in enumerate(log_notes) if i in failed])
+                    raise
+                except PyMongoError:
+                    self._requeue({}, log_notes)
+                    raise
+
+    def _run(self):
+
+        """
+        Flush pending writes every flush interval or when buffer is full.
+        :return: None
+        """
+
+        while not self._closed:
+
+            self._wake_event.wait(self.flush_interval)
+            self._wake_event.clear()
+
+            # Keep flushing thread alive on any error, otherwise buffered writes are never written
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception('Failed to flush buffered writes')
+
+    def close(self):
+
+        """
+        Stop flushing thread and flush everything left.
+        :return: None
+        """
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wake_event.set()
+        self._thread.join()
+
+        try:
+            self.flush()
+        except Exception:
+            self.logger.exception('Failed to flush buffered writes on close')
@@ -0,0 +1,12 @@
+"""
+WSGI entry point for production serving with many request workers, e.g.:
+
+    gunicorn --workers 4 wsgi:application
+
+One of the workers is elected to run simulation engine (config.SERVER_ROLE = 'all'), or the engine runs as separate
+process started with engine.py and workers serve api requests only (config.SERVER_ROLE = 'api'). Workers must import
+the app after fork, so the app must not be preloaded by the server.
+"""
+
+
+from app import app as application